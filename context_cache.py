@@ -0,0 +1,227 @@
+import time
+import hashlib
+import logging
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+import google.generativeai as genai
+from token_estimator import estimate_tokens
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds before expiry at which an explicit cache is recreated rather than reused
+EXPIRY_MARGIN = 60
+
+def prefix_key(model_name: str, system_instruction: str, snapshot: str) -> str:
+    """Hash of the stable part of a prompt, requests with the same key share a byte-identical prefix"""
+    digest = hashlib.sha256()
+    for part in (model_name, system_instruction, snapshot):
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def snapshot_turns(snapshot: str) -> List[Dict]:
+    """Chat history turns carrying a workspace memory snapshot"""
+    if not snapshot:
+        return []
+    return [{
+        "role": "model",
+        "parts": [f"I have access to the following important information that I should remember:\n\n{snapshot}"]
+    }]
+
+class ContextCache:
+    """Keeps the stable prompt prefix of each workspace identical across requests
+
+    The prefix is the system instruction followed by a snapshot of the workspace memory.
+    Snapshots are rebuilt at most every snapshot_ttl seconds, so consecutive requests
+    share a byte-identical prefix that Gemini's implicit caching can reuse.
+
+    Modes:
+        off: Only the stable layout, caching is left to the API
+        gemini: The prefix is stored as explicit cached content, one handle per bot and workspace
+        local: Offline stand-in for explicit caching that counts the prefix tokens of
+            repeated prefixes as cached, for tests and capacity planning
+    """
+
+    def __init__(self, mode: str = "off", ttl: int = 3600, snapshot_ttl: float = 300.0):
+        """Initialize the context cache
+
+        Args:
+            mode: "off", "gemini" or "local", unknown modes fall back to "off"
+            ttl: Lifetime in seconds of explicit cached contents
+            snapshot_ttl: Seconds a workspace memory snapshot is reused before it is rebuilt
+        """
+        if mode not in ("off", "gemini", "local"):
+            logger.warning(f"Unknown context cache mode '{mode}', using off")
+            mode = "off"
+        self.mode = mode
+        self.ttl = ttl
+        self.snapshot_ttl = snapshot_ttl
+        self._lock = threading.Lock()
+
+        # workspace_id -> (snapshot text, built_at)
+        self._snapshots = {}
+        # (app_id, workspace_id) -> {"key", "handle", "model", "expires_at"}
+        self._explicit = {}
+        # (app_id, workspace_id) -> prefix key whose explicit cache could not be created
+        self._explicit_failures = {}
+        # prefix key -> expires_at, for the local stand-in
+        self._local = {}
+
+        self._counters = {
+            "requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "cache_hit_requests": 0,
+            "snapshots_built": 0, "explicit_created": 0, "explicit_reused": 0, "explicit_failed": 0
+        }
+
+    def snapshot(self, workspace_id: str, build_fn: Callable[[], str]) -> str:
+        """Get the memory snapshot of a workspace, rebuilt once it is older than snapshot_ttl
+
+        Args:
+            workspace_id: Workspace ID
+            build_fn: Callable returning a fresh snapshot text
+
+        Returns:
+            Snapshot text
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._snapshots.get(workspace_id)
+            if cached is not None and now - cached[1] < self.snapshot_ttl:
+                return cached[0]
+        try:
+            text = build_fn()
+        except Exception as e:
+            logger.error(f"Error building memory snapshot for {workspace_id}: {str(e)}")
+            return cached[0] if cached is not None else ""
+        with self._lock:
+            self._snapshots[workspace_id] = (text, now)
+            self._counters["snapshots_built"] += 1
+        return text
+
+    def model_for(self, app_id: str, workspace_id: str, bot: Dict, snapshot: str) -> Tuple[Any, List[Dict], str]:
+        """Get the model and history prefix used for a request
+
+        Args:
+            app_id: Bot app ID
+            workspace_id: Workspace ID
+            bot: Bot entry with "model", "system_instruction" and "model_settings"
+            snapshot: Workspace memory snapshot
+
+        Returns:
+            Tuple of the model, the chat history turns that open the conversation and the prefix key
+        """
+        settings = bot.get("model_settings", {})
+        key = prefix_key(settings.get("model_name", ""), bot.get("system_instruction", ""), snapshot)
+        if self.mode == "gemini" and snapshot:
+            model = self._explicit_model(app_id, workspace_id, bot, snapshot, key)
+            if model is not None:
+                return model, [], key
+        return bot["model"], snapshot_turns(snapshot), key
+
+    def _explicit_model(self, app_id: str, workspace_id: str, bot: Dict, snapshot: str, key: str):
+        """Get a model backed by explicit cached content holding the prefix, None if it cannot be created"""
+        now = time.monotonic()
+        slot = (app_id, workspace_id)
+        with self._lock:
+            entry = self._explicit.get(slot)
+            if entry is not None and entry["key"] == key and entry["expires_at"] - EXPIRY_MARGIN > now:
+                self._counters["explicit_reused"] += 1
+                return entry["model"]
+            if self._explicit_failures.get(slot) == key:
+                # Do not retry the same prefix on every request
+                return None
+
+        settings = bot.get("model_settings", {})
+        model_name = settings.get("model_name", "")
+        try:
+            handle = genai.caching.CachedContent.create(
+                model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+                display_name=f"{app_id}-{workspace_id}",
+                system_instruction=bot.get("system_instruction"),
+                contents=snapshot_turns(snapshot),
+                tools=settings.get("tools"),
+                ttl=datetime.timedelta(seconds=self.ttl)
+            )
+            model = genai.GenerativeModel.from_cached_content(
+                handle,
+                generation_config=settings.get("generation_config"),
+                safety_settings=settings.get("safety_settings")
+            )
+        except Exception as e:
+            # Explicit caches need a minimum prefix size, smaller prefixes rely on implicit caching
+            logger.warning(f"Error creating cached content for {app_id}/{workspace_id}: {str(e)}")
+            with self._lock:
+                self._explicit_failures[slot] = key
+                self._counters["explicit_failed"] += 1
+            return None
+
+        with self._lock:
+            previous = self._explicit.get(slot)
+            self._explicit[slot] = {"key": key, "handle": handle, "model": model, "expires_at": now + self.ttl}
+            self._counters["explicit_created"] += 1
+        if previous is not None and previous["key"] != key:
+            self._delete(previous["handle"])
+        return model
+
+    def _delete(self, handle):
+        """Delete an explicit cache that was replaced by a newer snapshot"""
+        try:
+            handle.delete()
+        except Exception as e:
+            logger.warning(f"Error deleting cached content: {str(e)}")
+
+    def record_usage(self, response, key: str, prefix_text: str = "", estimated_tokens: int = 0):
+        """Record the prompt and cached token counts of a response
+
+        Args:
+            response: Gemini response, its usage_metadata is read when present
+            key: Prefix key of the request
+            prefix_text: Text of the stable prefix, used by the local stand-in to count cached tokens
+            estimated_tokens: Estimated prompt size, used when the response carries no usage metadata
+        """
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+
+        if self.mode == "local":
+            now = time.monotonic()
+            with self._lock:
+                hit = self._local.get(key, 0) > now
+                self._local[key] = now + self.ttl
+                for stale in [k for k, expires_at in self._local.items() if expires_at <= now]:
+                    del self._local[stale]
+            prefix_tokens = estimate_tokens(prefix_text)
+            prompt_tokens = prompt_tokens or max(estimated_tokens, prefix_tokens)
+            cached_tokens = prefix_tokens if hit else 0
+
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["prompt_tokens"] += prompt_tokens
+            self._counters["cached_tokens"] += cached_tokens
+            if cached_tokens:
+                self._counters["cache_hit_requests"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters and hit rates
+
+        Returns:
+            Dictionary of context cache metrics
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                "mode": self.mode,
+                "explicit_caches": len(self._explicit),
+                "token_hit_rate": round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0,
+                "request_hit_rate": round(stats["cache_hit_requests"] / stats["requests"], 4) if stats["requests"] else 0.0,
+            })
+            return stats
+
+    def shutdown(self):
+        """Delete the explicit caches created by this process"""
+        with self._lock:
+            entries = list(self._explicit.values())
+            self._explicit.clear()
+        for entry in entries:
+            self._delete(entry["handle"])
@@ -0,0 +1,247 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class _CachedConversation:
+    """Recent entries of one conversation plus the entries not yet written to disk"""
+
+    __slots__ = ("entries", "sizes", "pending", "count")
+
+    def __init__(self, entries: List[Dict], count: int):
+        self.entries = entries
+        self.sizes = [len(json.dumps(entry, ensure_ascii=False)) for entry in entries]
+        self.pending = []
+        self.count = count
+
+    @property
+    def size(self) -> int:
+        return sum(self.sizes)
+
+class ConversationCache:
+    """LRU cache of hot conversations with write-behind persistence to a session store"""
+
+    def __init__(self, store, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 flush_interval: float = 2.0, flush_batch_size: int = 100):
+        """Initialize the conversation cache
+
+        Args:
+            store: Session store used for reads on a miss and for flushing appends
+            max_entries: Maximum number of conversations kept in memory
+            max_bytes: Approximate maximum size of the cached entries in bytes
+            flush_interval: Seconds between background flushes of dirty conversations
+            flush_batch_size: Maximum number of conversations written per flush
+        """
+        self.store = store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        # Number of entries kept per conversation, matching what the store retains after compaction
+        self.window = store.max_entries
+
+        self._conversations = OrderedDict()
+        self._dirty = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Serializes flushes so appends for one conversation reach the disk in order
+        self._flush_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "flushes": 0, "flushed_entries": 0, "flush_errors": 0}
+
+        self._wake = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_worker, name="conversation-flusher", daemon=True)
+        self._flusher.start()
+
+    def _load(self, history_id: str) -> _CachedConversation:
+        """Get a conversation from the cache, reading it from the store on a miss"""
+        with self._lock:
+            conversation = self._conversations.get(history_id)
+            if conversation is not None:
+                self._conversations.move_to_end(history_id)
+                self._counters["hits"] += 1
+                return conversation
+            self._counters["misses"] += 1
+
+        # Read outside the lock so other conversations are not blocked on disk
+        entries = self.store.read_tail(history_id, self.window)
+        count = self.store.count(history_id)
+
+        with self._lock:
+            # Another thread may have loaded it meanwhile
+            conversation = self._conversations.get(history_id)
+            if conversation is None:
+                conversation = _CachedConversation(entries, count)
+                self._conversations[history_id] = conversation
+                self._bytes += conversation.size
+            self._conversations.move_to_end(history_id)
+        self._evict()
+        return conversation
+
+    def get(self, history_id: str, limit: int) -> List[Dict]:
+        """Get the most recent entries of a conversation
+
+        Args:
+            history_id: Conversation history ID
+            limit: Maximum number of entries to return
+
+        Returns:
+            List of the most recent entries, oldest first
+        """
+        if limit <= 0:
+            return []
+        conversation = self._load(history_id)
+        with self._lock:
+            return list(conversation.entries[-limit:])
+
+    def count(self, history_id: str) -> int:
+        """Get the number of entries ever appended to a conversation since it was last compacted
+
+        Args:
+            history_id: Conversation history ID
+
+        Returns:
+            Number of entries, including those not yet flushed
+        """
+        conversation = self._load(history_id)
+        with self._lock:
+            return conversation.count
+
+    def append(self, history_id: str, entries: List[Dict]):
+        """Append entries to a conversation, they are written to disk by the background flusher
+
+        Args:
+            history_id: Conversation history ID
+            entries: Entries to append, oldest first
+        """
+        if not entries:
+            return
+        conversation = self._load(history_id)
+        with self._lock:
+            # Re-insert if it was evicted between the load and this append
+            if history_id not in self._conversations:
+                self._conversations[history_id] = conversation
+                self._bytes += conversation.size
+            for entry in entries:
+                size = len(json.dumps(entry, ensure_ascii=False))
+                conversation.entries.append(entry)
+                conversation.sizes.append(size)
+                self._bytes += size
+            # Keep only the window that feeds prompts and summaries
+            overflow = len(conversation.entries) - self.window
+            if overflow > 0:
+                self._bytes -= sum(conversation.sizes[:overflow])
+                del conversation.entries[:overflow]
+                del conversation.sizes[:overflow]
+            conversation.pending.extend(entries)
+            conversation.count += len(entries)
+            self._dirty[history_id] = conversation
+            dirty_count = len(self._dirty)
+
+        if dirty_count >= self.flush_batch_size:
+            self._wake.set()
+        self._evict()
+
+    def _evict(self):
+        """Evict least recently used conversations while over the entry or byte budget"""
+        while True:
+            with self._lock:
+                if len(self._conversations) <= self.max_entries and self._bytes <= self.max_bytes:
+                    return
+                if len(self._conversations) <= 1:
+                    return
+                history_id, conversation = next(iter(self._conversations.items()))
+
+            # Dirty conversations must reach the disk before they leave the cache, this also
+            # waits for an in-flight flush so a reload cannot miss entries still being written
+            self._flush_keys([history_id])
+
+            with self._lock:
+                if history_id in self._dirty:
+                    # The flush failed, keep the entries in memory and retry on a later flush
+                    return
+                if self._conversations.get(history_id) is conversation:
+                    del self._conversations[history_id]
+                    self._bytes -= conversation.size
+                    self._counters["evictions"] += 1
+
+    def _flush_keys(self, history_ids: List[str]):
+        """Write the pending entries of the given conversations to the store
+
+        A conversation whose write fails gets its entries back in front of any appended
+        meanwhile and stays dirty, so the next flush retries it.
+        """
+        with self._flush_lock:
+            batch = []
+            with self._lock:
+                for history_id in history_ids:
+                    conversation = self._dirty.pop(history_id, None)
+                    if conversation is not None and conversation.pending:
+                        batch.append((history_id, conversation, conversation.pending))
+                        conversation.pending = []
+
+            flushed = 0
+            for history_id, conversation, pending in batch:
+                try:
+                    self.store.append(history_id, pending)
+                    flushed += len(pending)
+                except Exception as e:
+                    logger.error(f"Error flushing conversation {history_id}: {str(e)}")
+                    with self._lock:
+                        conversation.pending = pending + conversation.pending
+                        self._dirty[history_id] = conversation
+                        self._counters["flush_errors"] += 1
+
+            if flushed:
+                with self._lock:
+                    self._counters["flushes"] += 1
+                    self._counters["flushed_entries"] += flushed
+
+    def flush(self, max_conversations: int = None):
+        """Write dirty conversations to the store
+
+        Args:
+            max_conversations: Optional limit on the number of conversations written
+        """
+        with self._lock:
+            history_ids = list(self._dirty.keys())
+        if max_conversations is not None:
+            history_ids = history_ids[:max_conversations]
+        if history_ids:
+            self._flush_keys(history_ids)
+
+    def flush_all(self):
+        """Write every dirty conversation to the store, used on shutdown"""
+        self.flush()
+        with self._lock:
+            remaining = len(self._dirty)
+        if remaining:
+            logger.error(f"{remaining} conversations could not be flushed")
+        else:
+            logger.info("Flushed all dirty conversations")
+
+    def _flush_worker(self):
+        """Flush dirty conversations in batches on a fixed interval, or sooner when many are dirty"""
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush(self.flush_batch_size)
+            except Exception as e:
+                logger.error(f"Error flushing conversations: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters
+
+        Returns:
+            Dictionary of cache metrics
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["conversations"] = len(self._conversations)
+            stats["bytes"] = self._bytes
+            stats["dirty"] = len(self._dirty)
+            return stats
@@ -0,0 +1,347 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import google.generativeai as genai
+from vector_store import HashingEmbedder
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CACHE_SCHEMA = "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+SELECT_EMBEDDING = "SELECT vector FROM embeddings WHERE key = ?"
+INSERT_EMBEDDING = "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)"
+
+# Deterministic offline provider, the same text always gets the same vector
+LocalEmbeddingProvider = HashingEmbedder
+
+class GeminiEmbeddingProvider:
+    """Provider that embeds texts with the Gemini embedding API"""
+
+    def __init__(self, model: str = "models/text-embedding-004", dim: int = 768,
+                 task_type: str = "semantic_similarity"):
+        """Initialize the provider
+
+        Args:
+            model: Gemini embedding model name
+            dim: Number of dimensions the model returns
+            task_type: Embedding task type sent with every request
+        """
+        self.model = model
+        self.dim = dim
+        self.task_type = task_type
+
+    @property
+    def name(self) -> str:
+        return f"gemini:{self.model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts with one API call
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            L2-normalized float32 matrix with one row per text
+        """
+        result = genai.embed_content(model=self.model, content=texts, task_type=self.task_type)
+        vectors = np.asarray(result["embedding"], dtype=np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed one query text"""
+        return self.embed([text])[0]
+
+class EmbeddingCache:
+    """Persistent content-hash to vector cache in a SQLite database"""
+
+    def __init__(self, database_path: str):
+        """Open or create the cache database
+
+        Args:
+            database_path: Path of the SQLite database file
+        """
+        self.database_path = database_path
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute(CACHE_SCHEMA)
+        connection.commit()
+
+    def _connection(self):
+        """Get this thread's connection, opening it on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up cached vectors
+
+        Args:
+            keys: Content keys
+
+        Returns:
+            Dictionary of the keys that were found to their vectors
+        """
+        found = {}
+        connection = self._connection()
+        for key in keys:
+            row = connection.execute(SELECT_EMBEDDING, (key,)).fetchone()
+            if row is not None:
+                found[key] = np.frombuffer(row[0], dtype=np.float32)
+        return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]):
+        """Store vectors in one transaction
+
+        Args:
+            items: (key, vector) pairs
+        """
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                INSERT_EMBEDDING,
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+            )
+
+class EmbeddingService:
+    """Embeds texts through a provider with content-hash caching and request batching
+
+    Texts that miss the cache are queued and sent to the provider in batches. A batch
+    is sent when it is full or when its oldest text has waited max_wait seconds, so
+    concurrent callers share provider calls instead of making one round trip each.
+    Queries go through embed_query, which calls the provider directly and never writes
+    the persistent cache, so one-off texts neither wait for a batch nor fill the
+    database. The service has the same dim, embed() and embed_query() interface as a
+    provider.
+    """
+
+    def __init__(self, provider, cache_path: Optional[str] = None, batch_size: int = 100,
+                 max_wait: float = 0.05, memory_cache_size: int = 10000, batching: bool = True):
+        """Initialize the embedding service
+
+        Args:
+            provider: Object with name and dim attributes and an embed(texts) method
+            cache_path: Optional path of the persistent SQLite cache
+            batch_size: Maximum number of texts per provider call
+            max_wait: Seconds a queued text waits for more texts before its batch is sent
+            memory_cache_size: Number of vectors also kept in an in-memory LRU
+            batching: Whether missing texts are queued for the batcher, off for providers that embed locally
+        """
+        self.provider = provider
+        self.dim = provider.dim
+        self.name = provider.name
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.memory_cache_size = memory_cache_size
+        self.batching = batching
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+
+        self._memory_cache = OrderedDict()
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._counters = {
+            "requested": 0, "memory_hits": 0, "cache_hits": 0,
+            "embedded": 0, "provider_calls": 0, "provider_errors": 0
+        }
+
+        self._batcher = None
+        if batching:
+            self._batcher = threading.Thread(target=self._batch_worker, name="embedding-batcher", daemon=True)
+            self._batcher.start()
+
+    def content_key(self, text: str) -> str:
+        """Get the cache key of a text for this service's provider"""
+        return hashlib.sha256(f"{self.name}\n{text}".encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, using cached vectors where available and persisting new ones
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            L2-normalized float32 matrix with one row per text
+        """
+        return self._embed(texts, persist=True)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed a one-off query text without waiting for a batch or persisting its vector
+
+        Args:
+            text: Query text
+
+        Returns:
+            L2-normalized float32 vector
+        """
+        return self._embed([text], persist=False)[0]
+
+    def _embed(self, texts: List[str], persist: bool) -> np.ndarray:
+        """Embed texts through the caches, the batcher when persisting, or the provider directly"""
+        keys = [self.content_key(text) for text in texts]
+        vectors = {}
+
+        with self._lock:
+            self._counters["requested"] += len(texts)
+            for key in keys:
+                vector = self._memory_cache.get(key)
+                if vector is not None:
+                    self._memory_cache.move_to_end(key)
+                    vectors[key] = vector
+            self._counters["memory_hits"] += len(vectors)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing and self.cache is not None:
+            try:
+                found = self.cache.get_many(list(missing))
+            except Exception as e:
+                logger.error(f"Error reading embedding cache: {str(e)}")
+                found = {}
+            if found:
+                vectors.update(found)
+                self._remember(found.items())
+                for key in found:
+                    del missing[key]
+                with self._lock:
+                    self._counters["cache_hits"] += len(found)
+
+        if missing and persist and self.batching:
+            futures = self._enqueue(missing)
+            for key, future in futures.items():
+                vectors[key] = future.result()
+        elif missing:
+            with self._lock:
+                self._counters["provider_calls"] += 1
+            try:
+                embedded = self.provider.embed(list(missing.values()))
+            except Exception:
+                with self._lock:
+                    self._counters["provider_errors"] += 1
+                raise
+            items = [(key, embedded[row]) for row, key in enumerate(missing)]
+            self._store(items, persist)
+            vectors.update(items)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, key in enumerate(keys):
+            matrix[row] = vectors[key]
+        return matrix
+
+    def _remember(self, items):
+        """Add vectors to the in-memory LRU"""
+        with self._lock:
+            for key, vector in items:
+                self._memory_cache[key] = vector
+                self._memory_cache.move_to_end(key)
+            while len(self._memory_cache) > self.memory_cache_size:
+                self._memory_cache.popitem(last=False)
+
+    def _store(self, items: List[Tuple[str, np.ndarray]], persist: bool):
+        """Remember newly embedded vectors, writing them to the persistent cache if persist is set"""
+        self._remember(items)
+        if persist and self.cache is not None:
+            try:
+                self.cache.put_many(items)
+            except Exception as e:
+                logger.error(f"Error writing embedding cache: {str(e)}")
+        with self._lock:
+            self._counters["embedded"] += len(items)
+
+    def _enqueue(self, texts: Dict[str, str]) -> Dict[str, Future]:
+        """Queue texts for the batcher, joining requests already queued for the same text"""
+        futures = {}
+        with self._ready:
+            for key, text in texts.items():
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = (text, Future(), time.monotonic())
+                    self._pending[key] = pending
+                futures[key] = pending[1]
+            self._ready.notify()
+        return futures
+
+    def _batch_worker(self):
+        """Send queued texts to the provider in batches"""
+        while True:
+            with self._ready:
+                while not self._pending:
+                    self._ready.wait()
+                # Wait for the batch to fill, but not past the oldest text's deadline
+                oldest_enqueued_at = next(iter(self._pending.values()))[2]
+                while len(self._pending) < self.batch_size:
+                    remaining = oldest_enqueued_at + self.max_wait - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._ready.wait(remaining)
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    key, (text, future, _) = self._pending.popitem(last=False)
+                    batch.append((key, text, future))
+                self._counters["provider_calls"] += 1
+
+            try:
+                vectors = self.provider.embed([text for _, text, _ in batch])
+            except Exception as e:
+                logger.error(f"Error embedding {len(batch)} texts with {self.name}: {str(e)}")
+                with self._lock:
+                    self._counters["provider_errors"] += 1
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self._store([(key, vectors[row]) for row, (key, _, _) in enumerate(batch)], persist=True)
+            for row, (_, _, future) in enumerate(batch):
+                future.set_result(vectors[row])
+
+    def stats(self) -> Dict[str, Any]:
+        """Get service counters
+
+        Returns:
+            Dictionary of embedding metrics
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["provider"] = self.name
+            stats["queued"] = len(self._pending)
+            stats["memory_cached"] = len(self._memory_cache)
+            stats["average_batch_size"] = (
+                round(stats["embedded"] / stats["provider_calls"], 1) if stats["provider_calls"] else 0
+            )
+            return stats
+
+def create_embedding_service(provider_name: str, cache_path: Optional[str] = None,
+                             model: str = "models/text-embedding-004", batch_size: int = 100,
+                             max_wait: float = 0.05) -> EmbeddingService:
+    """Create the embedding service for the configured provider
+
+    Args:
+        provider_name: "local" for the offline hashing provider, or "gemini"
+        cache_path: Optional path of the persistent SQLite cache
+        model: Gemini embedding model name
+        batch_size: Maximum number of texts per provider call
+        max_wait: Seconds a queued text waits for more texts before its batch is sent
+
+    Returns:
+        Embedding service, batching only provider calls that go over the network
+    """
+    if provider_name == "gemini":
+        provider = GeminiEmbeddingProvider(model=model)
+    else:
+        if provider_name != "local":
+            logger.warning(f"Unknown embedding provider '{provider_name}', using local")
+        provider = LocalEmbeddingProvider()
+    return EmbeddingService(provider, cache_path=cache_path, batch_size=batch_size, max_wait=max_wait,
+                            batching=provider_name == "gemini")
@@ -0,0 +1,168 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# How long an event key is remembered, Slack stops retrying well within this window
+DEFAULT_DEDUP_TTL = 600
+
+def event_dedup_key(payload: Dict) -> Optional[str]:
+    """Build the deduplication key for a Slack event payload
+
+    Args:
+        payload: Parsed Slack request body
+
+    Returns:
+        The event_id, or channel and ts when there is no event_id, or None if neither is available
+    """
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("event_id"):
+        return payload["event_id"]
+
+    event = payload.get("event") or {}
+    channel = event.get("channel")
+    ts = event.get("event_ts") or event.get("ts")
+    if channel and ts:
+        return f"{channel}:{ts}"
+    return None
+
+class DedupStore:
+    """Interface for stores that remember which Slack events were already accepted"""
+
+    def mark_if_new(self, key: str) -> bool:
+        """Record a key unless it was already seen
+
+        Args:
+            key: Deduplication key of the event
+
+        Returns:
+            True if the key was new, False if it is a duplicate
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Get store counters
+
+        Returns:
+            Dictionary of store metrics
+        """
+        return {}
+
+class InMemoryDedupStore(DedupStore):
+    """TTL-bounded store that deduplicates events within a single process
+
+    Keys stay in insertion order and keep the expiry of their first sighting, like the
+    Redis store's SET NX EX, so the oldest key is always the next to expire.
+    """
+
+    def __init__(self, ttl: int = DEFAULT_DEDUP_TTL, max_entries: int = 10000):
+        """Initialize the store
+
+        Args:
+            ttl: Seconds a key is remembered
+            max_entries: Maximum number of keys kept, the oldest are evicted first
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._accepted = 0
+        self._duplicates = 0
+
+    def mark_if_new(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired keys from the old end, entries are ordered by expiry
+            while self._entries:
+                _, expires_at = next(iter(self._entries.items()))
+                if expires_at > now:
+                    break
+                self._entries.popitem(last=False)
+
+            if key in self._entries:
+                self._duplicates += 1
+                return False
+
+            self._entries[key] = now + self.ttl
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._accepted += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "accepted": self._accepted,
+                "duplicates": self._duplicates,
+            }
+
+class RedisDedupStore(DedupStore):
+    """Shared store backed by Redis so replicas behind a load balancer drop the same duplicates"""
+
+    def __init__(self, url: str, ttl: int = DEFAULT_DEDUP_TTL, prefix: str = "slack-event:"):
+        """Initialize the store
+
+        Args:
+            url: Redis connection URL
+            ttl: Seconds a key is remembered
+            prefix: Prefix for Redis keys
+        """
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._accepted = 0
+        self._duplicates = 0
+        self._errors = 0
+
+    def mark_if_new(self, key: str) -> bool:
+        try:
+            is_new = bool(self.client.set(f"{self.prefix}{key}", 1, nx=True, ex=self.ttl))
+        except Exception as e:
+            # Fail open so a Redis outage does not stop the bot from answering
+            logger.error(f"Error checking event key in Redis: {str(e)}")
+            with self._lock:
+                self._errors += 1
+            return True
+
+        with self._lock:
+            if is_new:
+                self._accepted += 1
+            else:
+                self._duplicates += 1
+        return is_new
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "redis",
+                "accepted": self._accepted,
+                "duplicates": self._duplicates,
+                "errors": self._errors,
+            }
+
+def create_dedup_store(redis_url: Optional[str] = None, ttl: int = DEFAULT_DEDUP_TTL) -> DedupStore:
+    """Create the shared store when a Redis URL is configured, otherwise the in-process store
+
+    Args:
+        redis_url: Optional Redis connection URL
+        ttl: Seconds a key is remembered
+
+    Returns:
+        A dedup store instance
+    """
+    if redis_url:
+        try:
+            return RedisDedupStore(redis_url, ttl=ttl)
+        except Exception as e:
+            logger.error(f"Error initializing Redis dedup store, falling back to in-memory store: {str(e)}")
+    return InMemoryDedupStore(ttl=ttl)
@@ -0,0 +1,210 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class EventWorkerPool:
+    """Bounded worker pool that runs Slack event work after the HTTP request has been acknowledged
+
+    Jobs submitted with a key run strictly in submission order for that key,
+    while jobs for different keys run in parallel.
+    """
+
+    def __init__(self, max_workers: int = 8, max_queue_size: int = 100, name: str = "slack-events"):
+        """Initialize the worker pool
+
+        Args:
+            max_workers: Number of worker threads
+            max_queue_size: Maximum number of jobs waiting for a worker before load is shed
+            name: Prefix used for worker thread names
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # Counters and queue-wait statistics
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._shed = 0
+        self._active = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recent_waits = deque(maxlen=1000)
+
+        # Jobs waiting behind a queued or running job with the same key
+        self._keyed = {}
+        self._keyed_waiting = 0
+
+        self._threads = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> bool:
+        """Queue a job for execution without blocking the caller
+
+        Args:
+            fn: Callable to run on a worker thread
+            *args: Positional arguments for the callable
+            **kwargs: Keyword arguments for the callable
+
+        Returns:
+            True if the job was queued, False if it was shed because the queue is full
+        """
+        return self.submit_keyed(None, fn, *args, **kwargs)
+
+    def submit_keyed(self, key: Hashable, fn: Callable, *args, **kwargs) -> bool:
+        """Queue a job that must not run concurrently with, or ahead of, earlier jobs with the same key
+
+        Args:
+            key: Serialization key such as a conversation history ID, or None for no ordering
+            fn: Callable to run on a worker thread
+            *args: Positional arguments for the callable
+            **kwargs: Keyword arguments for the callable
+
+        Returns:
+            True if the job was queued, False if it was shed because the queue is full
+        """
+        job = (time.monotonic(), fn, args, kwargs, key)
+        with self._lock:
+            if self._closed:
+                logger.warning("Event worker pool is shut down, dropping job")
+                return False
+            if self._queue.qsize() + self._keyed_waiting >= self.max_queue_size:
+                self._shed += 1
+                logger.warning(f"Event queue full ({self.max_queue_size} waiting), shedding job")
+                return False
+
+            if key is not None and key in self._keyed:
+                # An earlier job for this key is queued or running, it will run this one next
+                self._keyed[key].append(job)
+                self._keyed_waiting += 1
+                self._submitted += 1
+                return True
+
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._shed += 1
+                logger.warning(f"Event queue full ({self.max_queue_size} waiting), shedding job")
+                return False
+            if key is not None:
+                self._keyed[key] = deque()
+            self._submitted += 1
+        return True
+
+    def _worker(self):
+        """Worker loop that executes queued jobs"""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+
+            try:
+                key = job[4]
+                self._run(job)
+                # Run the jobs that queued up behind this one for the same key, in order
+                while key is not None:
+                    with self._lock:
+                        waiting = self._keyed.get(key)
+                        if not waiting:
+                            self._keyed.pop(key, None)
+                            break
+                        job = waiting.popleft()
+                        self._keyed_waiting -= 1
+                    self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        """Execute one job and record its queue wait"""
+        enqueued_at, fn, args, kwargs, _ = job
+        wait = time.monotonic() - enqueued_at
+        with self._lock:
+            self._active += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._recent_waits.append(wait)
+
+        try:
+            fn(*args, **kwargs)
+            with self._lock:
+                self._completed += 1
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            logger.error(f"Error running queued event job: {str(e)}")
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pool counters and queue-wait statistics
+
+        Returns:
+            Dictionary of pool metrics, wait times are in milliseconds
+        """
+        with self._lock:
+            recent = sorted(self._recent_waits)
+            started = self._completed + self._failed + self._active
+            # Longest per-key backlog, counting the queued or running job plus those waiting behind it.
+            # Keys are conversation IDs, so only their count and backlog lengths are reported
+            longest_key_queue = max((len(waiting) + 1 for waiting in self._keyed.values()), default=0)
+            return {
+                "workers": self.max_workers,
+                "queue_capacity": self.max_queue_size,
+                "queue_depth": self._queue.qsize(),
+                "active": self._active,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "shed": self._shed,
+                "active_keys": len(self._keyed),
+                "keyed_waiting": self._keyed_waiting,
+                "longest_key_queue": longest_key_queue,
+                "queue_wait_ms": {
+                    "avg": round(self._wait_total / started * 1000, 2) if started else 0.0,
+                    "max": round(self._wait_max * 1000, 2),
+                    "p50": round(recent[len(recent) // 2] * 1000, 2) if recent else 0.0,
+                    "p95": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 2) if recent else 0.0,
+                },
+            }
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None) -> bool:
+        """Stop accepting jobs and stop the workers once the queue drains
+
+        Args:
+            wait: Whether to block until all queued jobs have run
+            timeout: Optional maximum seconds to wait for the queue to drain
+
+        Returns:
+            Whether every accepted job has finished
+        """
+        with self._lock:
+            self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                # Stop markers queue behind the accepted jobs, so those still run first
+                self._queue.put(None, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        if not wait:
+            return False
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            unfinished = self._submitted - self._completed - self._failed
+        if unfinished:
+            logger.warning(f"Event worker pool stopped with {unfinished} jobs not finished")
+        return not unfinished
@@ -1,120 +1,206 @@
-import os
-import json
+import re
 import logging
-import datetime
-import google.generativeai as genai
-from typing import Dict, List, Any, Optional
+from typing import List, Optional
+from storage import JsonMemoryStorage, MemoryStorage
+from memory_index import BM25Index
+from near_duplicates import MinHashLSH, compatible, distinctive_terms, jaccard, shingles
+from vector_store import HashingEmbedder, VectorStore
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Default number of memory items and characters included in a prompt
+MEMORY_CONTEXT_ITEMS = 20
+MEMORY_CONTEXT_CHARS = 2000
+
+# Default number of memory items and characters in the workspace snapshot at the start of prompts
+MEMORY_SNAPSHOT_ITEMS = 30
+MEMORY_SNAPSHOT_CHARS = 3000
+
+# Memory items recording a user's name, written by memory_extractor.user_name_memories
+USER_MEMORY_PATTERN = re.compile(r"^User (\S+): ")
+
+# Constant of the reciprocal rank fusion that merges BM25 and vector rankings
+RANK_FUSION_K = 60
+
 class FlatMemoryManager:
     """Simplified manager class to handle memory for workspace1 in a single flat list"""
     
-    def __init__(self, memory_dir: str, workspace_id: str = "workspace1"):
+    def __init__(self, memory_dir: str, workspace_id: str = "workspace1", storage: Optional[MemoryStorage] = None,
+                 embedder=None):
         """Initialize the memory manager
         
         Args:
             memory_dir: Directory to store memory files
             workspace_id: ID of the workspace to manage memory for
+            storage: Optional memory storage backend, defaults to JSON files in memory_dir
+            embedder: Optional embedding service or provider with name and dim attributes and an
+                embed(texts) method returning a float32 matrix and an embed_query(text) method, defaults to
+                the local hashing embedder
         """
         self.memory_dir = memory_dir
         self.workspace_id = workspace_id
-        os.makedirs(memory_dir, exist_ok=True)
+        self.storage = storage or JsonMemoryStorage(memory_dir)
         
-        # Memory file path
-        self.memory_file = os.path.join(memory_dir, f"{workspace_id}_memory.json")
+        # Initialize memory structure, loaded once, with a hash index for deduplication
+        self.memory = {
+            "memory": self.storage.load_memories(workspace_id)
+        }
+        self._memory_index = set(self.memory["memory"])
         
-        # Initialize memory structure
-        self.memory = self._load_memory()
+        # Inverted index over memory items for query-relevant retrieval, keyed by list position
+        self.search_index = BM25Index()
+        # MinHash index that catches reworded repeats of stored items, keyed by list position
+        self.near_duplicates = MinHashLSH()
+        self._user_items = {}
+        for position, memory_item in enumerate(self.memory["memory"]):
+            self._index_item(position, memory_item)
         
-        # Initialize Gemini model for memory processing
+        # Vector index over memory items, row i holds the vector of memory item i
+        self.embedder = embedder or HashingEmbedder()
+        self.vector_store = None
         try:
-            self.memory_model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
+            self.vector_store = VectorStore(
+                memory_dir, f"{workspace_id}_vectors", self.embedder.dim,
+                model=getattr(self.embedder, "name", None)
+            )
+            self._sync_vectors()
         except Exception as e:
-            logging.error(f"Error initializing Gemini model: {str(e)}")
-            self.memory_model = None
+            logger.error(f"Error opening memory vector store: {str(e)}")
+            self.vector_store = None
     
-    def _load_memory(self) -> Dict:
-        """Load memory from file
+    def add_memory(self, memory_item: str):
+        """Add a memory item to the list
         
+        Args:
+            memory_item: Memory item to add
+        """
+        self.add_memories([memory_item])
+    
+    def add_memories(self, memory_items: List[str]) -> List[str]:
+        """Add several memory items with a single storage commit
+        
+        An item that is a near-duplicate of a stored item refreshes that item instead
+        of being appended, so rewordings of one fact do not pile up. Items whose names,
+        IDs or numbers conflict are never near-duplicates of each other.
+        
+        Args:
+            memory_items: Memory items to add
+            
         Returns:
-            Dictionary containing the memory data
+            The items that were new and got stored
         """
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Error loading memory from {self.memory_file}: {str(e)}")
+        new_items = []
+        batch_index = set()
+        batch_terms = []
+        for memory_item in memory_items:
+            if not memory_item or memory_item in self._memory_index or memory_item in batch_index:
+                continue
+            duplicate = self.near_duplicates.find(memory_item)
+            if duplicate is not None and self._refresh_item(duplicate[0], memory_item):
+                continue
+            terms = shingles(memory_item)
+            distinctive = distinctive_terms(memory_item)
+            if any(
+                jaccard(terms, other_terms) >= self.near_duplicates.threshold and compatible(distinctive, other_distinctive)
+                for other_terms, other_distinctive in batch_terms
+            ):
+                continue
+            batch_index.add(memory_item)
+            batch_terms.append((terms, distinctive))
+            new_items.append(memory_item)
+        if not new_items:
+            return []
         
-        # Return default memory structure if file doesn't exist or there's an error
-        return {
-            "memory": []
-        }
+        # Only items the storage accepted as new are added to the in-memory list
+        added = self.storage.add_memories(self.workspace_id, new_items)
+        for memory_item in added:
+            self.memory["memory"].append(memory_item)
+            self._index_item(len(self.memory["memory"]) - 1, memory_item)
+        self._memory_index.update(added)
+        self._sync_vectors()
+        return added
     
-    def _save_memory(self):
-        """Save memory to file"""
-        try:
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.memory, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            logging.error(f"Error saving memory to {self.memory_file}: {str(e)}")
-            
-    def _append_memory_item(self, memory_item):
-        """Append a single memory item to the file without updating the entire file
+    def _refresh_item(self, position: int, memory_item: str) -> bool:
+        """Replace a stored item with a newer wording of the same fact
+        
+        A rewording that adds no terms to the stored item is dropped. A rewording that
+        keeps all names, IDs and numbers of the stored item replaces it in place, since
+        it may carry more detail. Any other rewording is left to be stored separately,
+        so no distinctive term is ever lost.
         
         Args:
-            memory_item: Memory item to append
+            position: Position of the stored near-duplicate in the memory list
+            memory_item: Newer wording
+            
+        Returns:
+            Whether the newer wording was handled, False if it should be stored as a new item
         """
+        old_item = self.memory["memory"][position]
+        if shingles(memory_item) <= self.near_duplicates.terms(position):
+            logger.debug(f"Dropping near-duplicate memory item: {memory_item}")
+            return True
+        if not distinctive_terms(memory_item) >= self.near_duplicates.distinctive_terms(position):
+            return False
+        if not self.storage.replace_memory(self.workspace_id, old_item, memory_item):
+            return True
+        
+        logger.info(f"Refreshed memory item '{old_item}' with '{memory_item}'")
+        self.memory["memory"][position] = memory_item
+        self._memory_index.discard(old_item)
+        self._memory_index.add(memory_item)
+        match = USER_MEMORY_PATTERN.match(old_item)
+        if match and self._user_items.get(match.group(1)) == position:
+            del self._user_items[match.group(1)]
+        self._index_item(position, memory_item)
+        
+        if self.vector_store is not None and position < self.vector_store.count:
+            try:
+                self.vector_store.update(position, self.embedder.embed([memory_item])[0])
+            except Exception as e:
+                logger.error(f"Error embedding memory items: {str(e)}")
+        return True
+    
+    def _sync_vectors(self):
+        """Embed the memory items that have no vector yet and append them to the vector store"""
+        if self.vector_store is None:
+            return
+        memory_items = self.memory["memory"]
+        if self.vector_store.count > len(memory_items):
+            # The memory list was replaced underneath the vectors, rebuild them
+            logger.warning(f"Vector store of {self.workspace_id} is ahead of its memory items, rebuilding")
+            self.vector_store.truncate(0)
+        missing = memory_items[self.vector_store.count:]
+        if not missing:
+            return
         try:
-            # First, check if the memory item already exists in the file
-            if os.path.exists(self.memory_file):
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    current_memory = json.load(f)
-                    if "memory" in current_memory and memory_item in current_memory["memory"]:
-                        # Memory item already exists, no need to append
-                        return
-            
-            # Update the in-memory representation
-            if "memory" not in self.memory:
-                self.memory["memory"] = []
-            if memory_item not in self.memory["memory"]:
-                self.memory["memory"].append(memory_item)
-            
-            # Append to the file
-            with open(self.memory_file, 'r+', encoding='utf-8') as f:
-                try:
-                    current_memory = json.load(f)
-                    if "memory" not in current_memory:
-                        current_memory["memory"] = []
-                    
-                    # Only append if it doesn't already exist
-                    if memory_item not in current_memory["memory"]:
-                        current_memory["memory"].append(memory_item)
-                        
-                        # Move file pointer to beginning and truncate
-                        f.seek(0)
-                        f.truncate()
-                        
-                        # Write the updated memory
-                        json.dump(current_memory, f, indent=2, ensure_ascii=False)
-                except json.JSONDecodeError:
-                    # File might be empty or invalid, write the full memory
-                    f.seek(0)
-                    f.truncate()
-                    json.dump(self.memory, f, indent=2, ensure_ascii=False)
+            self.vector_store.add(self.embedder.embed(missing))
         except Exception as e:
-            logging.error(f"Error appending memory item to {self.memory_file}: {str(e)}")
+            logger.error(f"Error embedding memory items: {str(e)}")
     
-    def add_memory(self, memory_item: str):
-        """Add a memory item to the list
+    def _vector_search(self, query: str, k: int) -> List[int]:
+        """Rank memory item positions by cosine similarity to the query"""
+        if self.vector_store is None:
+            return []
+        try:
+            query_vector = self.embedder.embed_query(query)
+            return [position for position, score in self.vector_store.search(query_vector, k) if score > 0]
+        except Exception as e:
+            logger.error(f"Error searching memory vectors: {str(e)}")
+            return []
+    
+    def _index_item(self, position: int, memory_item: str):
+        """Add a memory item to the search and near-duplicate indexes and the user lookup
         
         Args:
-            memory_item: Memory item to add
+            position: Position of the item in the memory list
+            memory_item: Memory item text
         """
-        # Use the append method to only update the file if there's a new memory item
-        self._append_memory_item(memory_item)
+        self.search_index.add(position, memory_item)
+        self.near_duplicates.add(position, memory_item)
+        match = USER_MEMORY_PATTERN.match(memory_item)
+        if match:
+            self._user_items[match.group(1)] = position
     
     def get_memory(self) -> List[str]:
         """Get all memory items
@@ -124,111 +210,79 @@ class FlatMemoryManager:
         """
         return self.memory.get("memory", [])
     
-    def extract_important_info(self, message: Dict) -> List[str]:
-        """Extract important information from a single chat message using Gemini API
+    def get_context_for_user(self, user_id: str = None, query: str = None,
+                             max_items: int = MEMORY_CONTEXT_ITEMS, max_chars: int = MEMORY_CONTEXT_CHARS) -> str:
+        """Get the memory items most relevant to a user and their current query
         
         Args:
-            message: A single chat message
+            user_id: Optional ID of the user, their name record is always included
+            query: Optional current query, items are ranked against it with BM25 and vector similarity
+            max_items: Maximum number of items returned
+            max_chars: Maximum total length of the returned items
             
         Returns:
-            List of extracted important information
+            String containing relevant memory context, one item per line
         """
-        # If Gemini model is not available, return empty list
-        if not self.memory_model or message.get("role") != "user":
-            return []
+        memory_items = self.get_memory()
+        if not memory_items:
+            return ""
         
-        try:
-            # Get the content of the current message
-            content = message.get("content", "")
-            user_name = message.get("user_name", "User")
-            
-            # Only process messages with meaningful content
-            if len(content.strip()) < 10:  # Skip very short messages
-                return []
-            
-            # Ask Gemini to extract important information as natural language
-            memory_prompt = f"""Below is a message from a user. If this message contains any important information worth remembering long-term, extract it.
-            Important information could be about people, organizations, preferences, facts, or any other significant information.
-            If there's nothing worth remembering, return NOTHING.
-            If there is something worth remembering, write each memory as a complete, natural language sentence. Be concise but informative.
-            Return ONLY the memories, one per line, with no prefixes or categorization.
-            
-            USER MESSAGE:
-            {user_name}: {content}
-            
-            IMPORTANT INFORMATION (or NOTHING if none):"""
-            
-            memory_response = self.memory_model.generate_content(memory_prompt)
-            if memory_response and memory_response.text:
-                text = memory_response.text.strip()
-                if text.lower() == "nothing" or "nothing worth remembering" in text.lower():
-                    return []
-                    
-                memories = [memory.strip() for memory in text.split("\n") if memory.strip() and memory.lower() != "nothing"]
-                return memories
-            
-        except Exception as e:
-            logger.error(f"Error extracting information with Gemini: {str(e)}")
+        candidates = []
+        if user_id and user_id in self._user_items:
+            candidates.append(self._user_items[user_id])
         
-        return []
-    
-    def summarize_session(self, chat_history: List[Dict]) -> Dict[str, Any]:
-        """Summarize a chat session to extract important information using Gemini API
+        ranked = []
+        if query:
+            # Merge the keyword and vector rankings with reciprocal rank fusion
+            fused = {}
+            rankings = (
+                [position for position, _ in self.search_index.search(query, max_items * 2)],
+                self._vector_search(query, max_items * 2)
+            )
+            for ranking in rankings:
+                for rank, position in enumerate(ranking):
+                    fused[position] = fused.get(position, 0.0) + 1.0 / (RANK_FUSION_K + rank + 1)
+            ranked = sorted(fused, key=fused.get, reverse=True)
+        if ranked:
+            candidates.extend(ranked)
+        else:
+            # Without a query or any match, fall back to the most recent items
+            candidates.extend(range(len(memory_items) - 1, max(-1, len(memory_items) - 1 - max_items), -1))
         
-        Args:
-            chat_history: List of chat messages
-            
-        Returns:
-            Dictionary containing extracted information
-        """
-        summary = {
-            "user_info": {},
-            "memories": [],
-            "timestamp": datetime.datetime.now().isoformat()
-        }
+        # Pack the candidates in rank order within the item and character budgets
+        selected = []
+        seen = set()
+        used_chars = 0
+        for position in candidates:
+            if position in seen:
+                continue
+            seen.add(position)
+            memory_item = memory_items[position]
+            if used_chars + len(memory_item) + 1 > max_chars:
+                continue
+            selected.append(memory_item)
+            used_chars += len(memory_item) + 1
+            if len(selected) >= max_items:
+                break
         
-        # Extract user information from chat history
-        for message in chat_history:
-            if message.get("role") == "user" and message.get("user_id") and message.get("user_name"):
-                user_id = message.get("user_id")
-                if user_id not in summary["user_info"]:
-                    summary["user_info"][user_id] = {
-                        "name": message.get("user_name"),
-                        "last_active": message.get("timestamp")
-                    }
-                    # Remember user name
-                    self.add_memory(f"User {user_id}: {message.get('user_name')}")
-        
-        # Consolidate full chat history and extract important information
-        history_text = "\n".join(
-            f"{entry.get('user_name', 'Bot')}: {entry.get('content', '')}"
-            for entry in chat_history
-        )
-        if history_text.strip():
-            synthetic_message = {
-                "role": "user",
-                "content": history_text,
-                "user_name": "History"
-            }
-            memories = self.extract_important_info(synthetic_message)
-            summary["memories"] = memories
-            for memory in memories:
-                self.add_memory(memory)
-        return summary
+        return "\n".join(selected)
     
-    def get_context_for_user(self, user_id: str = None) -> str:
-        """Get memory context for a specific user or general context
+    def get_snapshot(self, max_items: int = MEMORY_SNAPSHOT_ITEMS, max_chars: int = MEMORY_SNAPSHOT_CHARS) -> str:
+        """Get the most recent memory items in stored order, shared by all prompts of the workspace
         
         Args:
-            user_id: Optional ID of the user
+            max_items: Maximum number of items returned
+            max_chars: Maximum total length of the returned items
             
         Returns:
-            String containing relevant memory context
+            String containing the snapshot, one item per line
         """
-        memory_items = self.get_memory()
-        
-        # Limit to a reasonable number of items (max 20)
-        if len(memory_items) > 20:
-            memory_items = memory_items[:20]
-        
-        return "\n".join(memory_items)
+        selected = []
+        used_chars = 0
+        for memory_item in reversed(self.get_memory()):
+            if used_chars + len(memory_item) + 1 > max_chars or len(selected) >= max_items:
+                break
+            selected.append(memory_item)
+            used_chars += len(memory_item) + 1
+        selected.reverse()
+        return "\n".join(selected)
@@ -0,0 +1,266 @@
+import ast
+import math
+import datetime
+import operator
+from typing import Any, Callable, Dict
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Timezone used when neither the model nor the workspace gives one
+DEFAULT_TIMEZONE = "UTC"
+
+# Limits that keep arithmetic cheap
+MAX_EXPRESSION_LENGTH = 200
+MAX_EXPONENT = 1000
+MAX_RESULT_BITS = 4096
+
+# Integers beyond this lose precision as a JSON number and are returned as strings
+MAX_EXACT_INTEGER = 2 ** 53
+
+# Function declarations of the tools executed locally, offered to the model beside search_web
+datetime_function = {
+    "name": "get_current_datetime",
+    "description": "Get the current date, time and day of the week. Use this instead of searching for today's date or the time.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "timezone": {
+                "type": "string",
+                "description": "Optional IANA timezone such as Asia/Seoul or America/New_York, the workspace timezone by default"
+            }
+        }
+    }
+}
+
+calculate_function = {
+    "name": "calculate",
+    "description": "Evaluate an arithmetic expression. Supports + - * / // % **, parentheses and sqrt, abs, round, min, max, log, log10, sin, cos, tan, pi, e.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "expression": {
+                "type": "string",
+                "description": "Arithmetic expression, for example (12.5 * 3) / 4"
+            }
+        },
+        "required": ["expression"]
+    }
+}
+
+convert_units_function = {
+    "name": "convert_units",
+    "description": "Convert a value between units of length, area, mass, volume, speed, time, data size or temperature.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "value": {"type": "number", "description": "Value to convert"},
+            "from_unit": {"type": "string", "description": "Unit of the value, for example km, lb, °F"},
+            "to_unit": {"type": "string", "description": "Unit to convert to"}
+        },
+        "required": ["value", "from_unit", "to_unit"]
+    }
+}
+
+LOCAL_TOOL_DECLARATIONS = [datetime_function, calculate_function, convert_units_function]
+
+def current_datetime(timezone: str = None) -> Dict[str, Any]:
+    """Get the current date and time in a timezone
+
+    Args:
+        timezone: IANA timezone name, DEFAULT_TIMEZONE if not given
+
+    Returns:
+        Dictionary with the date, time, weekday, ISO timestamp and timezone
+    """
+    try:
+        zone = ZoneInfo(timezone or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return {"error": f"Unknown timezone: {timezone}"}
+    now = datetime.datetime.now(zone)
+    return {
+        "date": now.strftime("%Y-%m-%d"),
+        "time": now.strftime("%H:%M:%S"),
+        "weekday": now.strftime("%A"),
+        "iso": now.isoformat(timespec="seconds"),
+        "timezone": str(zone),
+        "utc_offset": now.strftime("%z")
+    }
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+_UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+_FUNCTIONS = {
+    "sqrt": math.sqrt, "abs": abs, "round": round, "min": min, "max": max,
+    "log": math.log, "log10": math.log10, "sin": math.sin, "cos": math.cos, "tan": math.tan,
+}
+
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+
+def _evaluate(node):
+    """Evaluate a node of a parsed arithmetic expression"""
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+        return _CONSTANTS[node.id]
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_evaluate(node.operand))
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left = _evaluate(node.left)
+        right = _evaluate(node.right)
+        if isinstance(node.op, ast.Pow) and abs(right) > MAX_EXPONENT:
+            raise ValueError("Exponent is too large")
+        # Check the size of integer results before computing them
+        if isinstance(left, int) and isinstance(right, int):
+            if isinstance(node.op, ast.Pow) and right > 0 and left.bit_length() * right > MAX_RESULT_BITS:
+                raise ValueError("Result is too large")
+            if isinstance(node.op, ast.Mult) and left.bit_length() + right.bit_length() > MAX_RESULT_BITS:
+                raise ValueError("Result is too large")
+        return _BINARY_OPERATORS[type(node.op)](left, right)
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS
+            and not node.keywords):
+        return _FUNCTIONS[node.func.id](*[_evaluate(arg) for arg in node.args])
+    raise ValueError("Unsupported expression")
+
+def calculate(expression: str = "") -> Dict[str, Any]:
+    """Evaluate an arithmetic expression without eval
+
+    Args:
+        expression: Arithmetic expression
+
+    Returns:
+        Dictionary with the expression and its result, or an error
+    """
+    expression = expression.replace("×", "*").replace("÷", "/").replace("^", "**").strip()
+    if not expression or len(expression) > MAX_EXPRESSION_LENGTH:
+        return {"error": "Expression is empty or too long"}
+    try:
+        result = _evaluate(ast.parse(expression, mode="eval"))
+    except ZeroDivisionError:
+        return {"expression": expression, "error": "Division by zero"}
+    except (SyntaxError, ValueError, TypeError, OverflowError) as e:
+        return {"expression": expression, "error": str(e) or "Invalid expression"}
+    if not isinstance(result, (int, float)) or (isinstance(result, float) and not math.isfinite(result)):
+        return {"expression": expression, "error": "Result is not a finite real number"}
+    if isinstance(result, float) and result.is_integer() and abs(result) < 1e15:
+        result = int(result)
+    if isinstance(result, int) and abs(result) > MAX_EXACT_INTEGER:
+        result = str(result)
+    return {"expression": expression, "result": result}
+
+# Linear units as (dimension, factor to the base unit of the dimension)
+_UNITS = {
+    # Length, base meter
+    "mm": ("length", 0.001), "cm": ("length", 0.01), "m": ("length", 1.0), "km": ("length", 1000.0),
+    "in": ("length", 0.0254), "ft": ("length", 0.3048), "yd": ("length", 0.9144), "mi": ("length", 1609.344),
+    "nmi": ("length", 1852.0),
+    # Area, base square meter
+    "m2": ("area", 1.0), "km2": ("area", 1e6), "ft2": ("area", 0.09290304), "acre": ("area", 4046.8564224),
+    "ha": ("area", 10000.0), "pyeong": ("area", 400 / 121),
+    # Mass, base kilogram
+    "mg": ("mass", 1e-6), "g": ("mass", 0.001), "kg": ("mass", 1.0), "t": ("mass", 1000.0),
+    "oz": ("mass", 0.028349523125), "lb": ("mass", 0.45359237),
+    # Volume, base liter
+    "ml": ("volume", 0.001), "l": ("volume", 1.0), "m3": ("volume", 1000.0), "tsp": ("volume", 0.00492892159375),
+    "tbsp": ("volume", 0.01478676478125), "cup": ("volume", 0.2365882365), "floz": ("volume", 0.0295735295625),
+    "gal": ("volume", 3.785411784),
+    # Speed, base meter per second
+    "m/s": ("speed", 1.0), "km/h": ("speed", 1 / 3.6), "mph": ("speed", 0.44704), "knot": ("speed", 1852 / 3600),
+    # Time, base second
+    "ms": ("time", 0.001), "s": ("time", 1.0), "min": ("time", 60.0), "h": ("time", 3600.0), "day": ("time", 86400.0),
+    "week": ("time", 604800.0), "year": ("time", 31557600.0),
+    # Data size, base byte
+    "b": ("data", 1.0), "kb": ("data", 1e3), "mb": ("data", 1e6), "gb": ("data", 1e9), "tb": ("data", 1e12),
+    "kib": ("data", 1024.0), "mib": ("data", 1024.0 ** 2), "gib": ("data", 1024.0 ** 3), "tib": ("data", 1024.0 ** 4),
+    "bit": ("data", 0.125), "kbit": ("data", 125.0), "mbit": ("data", 1.25e5), "gbit": ("data", 1.25e8),
+    "tbit": ("data", 1.25e11),
+}
+
+# Symbols whose case changes the unit, resolved before names are lowercased
+_CASE_SENSITIVE_UNITS = {
+    "B": "b", "kB": "kb", "KB": "kb", "MB": "mb", "GB": "gb", "TB": "tb",
+    "Kb": "kbit", "Mb": "mbit", "Gb": "gbit", "Tb": "tbit",
+}
+
+_UNIT_ALIASES = {
+    "millimeter": "mm", "centimeter": "cm", "meter": "m", "metre": "m", "kilometer": "km", "inch": "in",
+    "inches": "in", "foot": "ft", "feet": "ft", "yard": "yd", "mile": "mi", "miles": "mi",
+    "sqm": "m2", "m²": "m2", "km²": "km2", "sqft": "ft2", "ft²": "ft2", "hectare": "ha", "평": "pyeong",
+    "gram": "g", "kilogram": "kg", "ton": "t", "tonne": "t", "ounce": "oz", "pound": "lb", "lbs": "lb",
+    "milliliter": "ml", "liter": "l", "litre": "l", "gallon": "gal", "fl oz": "floz",
+    "kph": "km/h", "kmh": "km/h", "knots": "knot", "kn": "knot",
+    "sec": "s", "second": "s", "minute": "min", "hour": "h", "hr": "h", "days": "day", "weeks": "week", "years": "year",
+    "byte": "b", "bytes": "b", "bits": "bit", "kilobit": "kbit", "megabit": "mbit", "gigabit": "gbit",
+    "c": "c", "°c": "c", "celsius": "c", "f": "f", "°f": "f", "fahrenheit": "f", "k": "k", "kelvin": "k",
+}
+
+_TEMPERATURE_TO_CELSIUS = {
+    "c": lambda value: value,
+    "f": lambda value: (value - 32) * 5 / 9,
+    "k": lambda value: value - 273.15,
+}
+
+_TEMPERATURE_FROM_CELSIUS = {
+    "c": lambda value: value,
+    "f": lambda value: value * 9 / 5 + 32,
+    "k": lambda value: value + 273.15,
+}
+
+def _unit(name: str) -> str:
+    """Normalize a unit name to its key"""
+    name = name.strip()
+    if name in _CASE_SENSITIVE_UNITS:
+        return _CASE_SENSITIVE_UNITS[name]
+    key = name.lower()
+    key = _UNIT_ALIASES.get(key, key)
+    if key not in _UNITS and key not in _TEMPERATURE_TO_CELSIUS and key.endswith("s"):
+        # Plurals such as "mins", "kgs" or "hours"
+        singular = key[:-1]
+        if singular in _UNITS:
+            key = singular
+        elif singular in _UNIT_ALIASES:
+            key = _UNIT_ALIASES[singular]
+    return key
+
+def convert_units(value: float = 0.0, from_unit: str = "", to_unit: str = "") -> Dict[str, Any]:
+    """Convert a value between two units of the same dimension
+
+    Args:
+        value: Value to convert
+        from_unit: Unit of the value
+        to_unit: Unit to convert to
+
+    Returns:
+        Dictionary with the converted value, or an error
+    """
+    source = _unit(from_unit)
+    target = _unit(to_unit)
+    value = float(value)
+    if source in _TEMPERATURE_TO_CELSIUS and target in _TEMPERATURE_FROM_CELSIUS:
+        result = _TEMPERATURE_FROM_CELSIUS[target](_TEMPERATURE_TO_CELSIUS[source](value))
+    elif source in _UNITS and target in _UNITS:
+        source_dimension, source_factor = _UNITS[source]
+        target_dimension, target_factor = _UNITS[target]
+        if source_dimension != target_dimension:
+            return {"error": f"Cannot convert {source_dimension} ({from_unit}) to {target_dimension} ({to_unit})"}
+        result = value * source_factor / target_factor
+    else:
+        return {"error": f"Unknown unit conversion from {from_unit} to {to_unit}"}
+    return {"value": value, "from_unit": from_unit, "to_unit": to_unit, "result": round(result, 6)}
+
+def local_tool_handlers() -> Dict[str, Callable[..., Dict[str, Any]]]:
+    """Get the handlers of the local tools, keyed by function name"""
+    return {
+        "get_current_datetime": current_datetime,
+        "calculate": calculate,
+        "convert_units": convert_units,
+    }
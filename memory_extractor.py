@@ -0,0 +1,186 @@
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+import google.generativeai as genai
+from token_estimator import estimate_tokens
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Model used for memory extraction
+EXTRACTION_MODEL = 'gemini-2.5-flash-preview-04-17'
+
+# Length limits of the rolling summary carried between summarization passes
+ROLLING_SUMMARY_SENTENCES = 5
+ROLLING_SUMMARY_CHARS = 1500
+
+# Structured output: one object per conversation with its memories and updated summary
+EXTRACTION_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "conversation_id": {"type": "STRING"},
+            "memories": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "summary": {"type": "STRING"},
+        },
+        "required": ["conversation_id", "memories", "summary"],
+    },
+}
+
+EXTRACTION_PROMPT = """Below are the newest messages of one or more conversations, each with a short summary of the conversation before them.
+For each conversation:
+1. Extract any important information from its NEW MESSAGES worth remembering long-term, such as facts about people, organizations, preferences or decisions. Write each memory as a complete, natural language sentence. Do not repeat information already in its summary. Use an empty list if there is nothing worth remembering.
+2. Rewrite its summary so it also covers the new messages, in at most {sentences} sentences.
+Return one result per conversation with its conversation_id.
+
+{conversations}"""
+
+def format_turns(entries: List[Dict]) -> str:
+    """Format chat history entries as "name: content" lines for extraction prompts"""
+    return "\n".join(
+        f"{entry.get('user_name', 'Bot') if entry.get('role') == 'user' else 'Bot'}: {entry.get('content', '')}"
+        for entry in entries
+    )
+
+def user_name_memories(entries: List[Dict]) -> List[str]:
+    """Get the memory items recording the names of the users in chat history entries"""
+    memories = []
+    for entry in entries:
+        if entry.get("role") == "user" and entry.get("user_id") and entry.get("user_name"):
+            memory_item = f"User {entry['user_id']}: {entry['user_name']}"
+            if memory_item not in memories:
+                memories.append(memory_item)
+    return memories
+
+class BatchMemoryExtractor:
+    """Extracts memories from several conversations per Gemini request with a JSON response schema
+
+    Conversations are packed into requests up to a token budget. When a request fails
+    or its reply is missing conversations, those are retried one request each.
+    """
+
+    def __init__(self, model=None, max_batch_tokens: int = 24000, max_batch_items: int = 20):
+        """Initialize the extractor
+
+        Args:
+            model: Optional Gemini model, created from EXTRACTION_MODEL if not given
+            max_batch_tokens: Estimated prompt token budget of one request
+            max_batch_items: Maximum number of conversations per request
+        """
+        self.model = model or genai.GenerativeModel(EXTRACTION_MODEL)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self._lock = threading.Lock()
+        self._counters = {"conversations": 0, "requests": 0, "fallback_requests": 0, "failed": 0}
+
+    def _render(self, item: Dict) -> str:
+        """Render one conversation block of the prompt"""
+        return (
+            f"CONVERSATION {item['id']}\n"
+            f"SUMMARY SO FAR:\n{item.get('summary') or '(none)'}\n"
+            f"NEW MESSAGES:\n{item['text']}\n"
+        )
+
+    def _batches(self, items: List[Dict]) -> List[List[Dict]]:
+        """Split items into batches within the token and item budgets, oversized texts are trimmed to their end"""
+        overhead = estimate_tokens(EXTRACTION_PROMPT)
+        batches = []
+        batch = []
+        batch_tokens = overhead
+        for item in items:
+            tokens = estimate_tokens(self._render(item))
+            if overhead + tokens > self.max_batch_tokens:
+                # Keep the newest part of a conversation that does not fit a request on its own
+                keep_chars = max(1, int(len(item["text"]) * (self.max_batch_tokens - overhead) / tokens))
+                item = dict(item, text=item["text"][-keep_chars:])
+                tokens = estimate_tokens(self._render(item))
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= self.max_batch_items):
+                batches.append(batch)
+                batch = []
+                batch_tokens = overhead
+            batch.append(item)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _request(self, batch: List[Dict]) -> Dict[str, Dict]:
+        """Send one extraction request and parse its structured reply
+
+        Returns:
+            Dictionary of conversation ID to its result, for the conversations found in the reply
+        """
+        prompt = EXTRACTION_PROMPT.format(
+            sentences=ROLLING_SUMMARY_SENTENCES,
+            conversations="\n".join(self._render(item) for item in batch)
+        )
+        response = self.model.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json", "response_schema": EXTRACTION_SCHEMA}
+        )
+        expected = {item["id"] for item in batch}
+        results = {}
+        for result in json.loads(response.text):
+            conversation_id = str(result.get("conversation_id", ""))
+            if conversation_id not in expected:
+                continue
+            memories = [memory.strip() for memory in result.get("memories") or [] if isinstance(memory, str) and memory.strip()]
+            results[conversation_id] = {
+                "memories": memories,
+                "summary": (result.get("summary") or "").strip()[:ROLLING_SUMMARY_CHARS]
+            }
+        return results
+
+    def extract(self, items: List[Dict]) -> Dict[str, Optional[Dict]]:
+        """Extract memories and updated summaries for several conversations
+
+        Args:
+            items: Dictionaries with the conversation "id", the new turns as "text" and the
+                optional rolling "summary" of the earlier turns
+
+        Returns:
+            Dictionary of conversation ID to a dictionary with "memories" and "summary",
+            or None for conversations that could not be processed
+        """
+        items = [dict(item, id=str(item["id"])) for item in items if item.get("text", "").strip()]
+        results = {}
+        for batch in self._batches(items):
+            with self._lock:
+                self._counters["requests"] += 1
+                self._counters["conversations"] += len(batch)
+            try:
+                results.update(self._request(batch))
+            except Exception as e:
+                logger.error(f"Error extracting memories for {len(batch)} conversations: {str(e)}")
+
+            # Retry what the batched request did not answer, one conversation per request
+            for item in batch:
+                if item["id"] in results:
+                    continue
+                if len(batch) == 1:
+                    results[item["id"]] = None
+                    with self._lock:
+                        self._counters["failed"] += 1
+                    continue
+                with self._lock:
+                    self._counters["fallback_requests"] += 1
+                try:
+                    results[item["id"]] = self._request([item]).get(item["id"])
+                except Exception as e:
+                    logger.error(f"Error extracting memories for {item['id']}: {str(e)}")
+                    results[item["id"]] = None
+                if results[item["id"]] is None:
+                    with self._lock:
+                        self._counters["failed"] += 1
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Get extraction counters
+
+        Returns:
+            Dictionary of extraction metrics
+        """
+        with self._lock:
+            return dict(self._counters)
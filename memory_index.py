@@ -0,0 +1,185 @@
+import re
+import math
+import heapq
+import threading
+from collections import Counter
+from typing import Dict, Hashable, List, Tuple
+
+# Latin letters and digits form words, Hangul runs are also split into character bigrams
+_LATIN_PATTERN = re.compile(r"[0-9a-z]+")
+_HANGUL_PATTERN = re.compile(r"[가-힣]+")
+
+# Frequent English words that carry no meaning for retrieval
+STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from has have how i in is it its me my of on or "
+    "so that the their there this to was we were what when where which who why will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Split text into index terms for English and Korean
+
+    Latin words are lowercased and stopwords dropped. Hangul words are kept whole and also split
+    into character bigrams, so "날짜가" still matches "날짜" without a morphological
+    analyzer.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of terms, with repeats
+    """
+    text = text.lower()
+    tokens = [token for token in _LATIN_PATTERN.findall(text) if token not in STOPWORDS]
+    for word in _HANGUL_PATTERN.findall(text):
+        tokens.append(word)
+        if len(word) > 2:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+class BM25Index:
+    """Incrementally maintained inverted index with BM25 scoring
+
+    Terms with more than candidate_limit postings are never scanned in full. When rarer
+    query terms have produced candidates they only rescore those, otherwise they score
+    a cached list of their candidate_limit highest impact postings plus the documents
+    added since that list was built. Queries made only of very common terms are
+    therefore ranked approximately, in exchange for a bounded search cost.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, candidate_limit: int = 1000):
+        """Initialize an empty index
+
+        Args:
+            k1: Term frequency saturation parameter
+            b: Document length normalization parameter
+            candidate_limit: Posting list length above which a term only scans its top impact postings
+        """
+        self.k1 = k1
+        self.b = b
+        self.candidate_limit = candidate_limit
+        self._postings = {}
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._total_length = 0
+        # term -> doc IDs with the highest BM25 impact, for terms with long posting lists
+        self._top_postings = {}
+        # term -> doc IDs added since its top postings were built
+        self._recent_postings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, doc_id: Hashable, text: str):
+        """Index a document, replacing it if the ID is already indexed
+
+        Args:
+            doc_id: Document ID
+            text: Document text
+        """
+        term_counts = Counter(tokenize(text))
+        with self._lock:
+            if doc_id in self._doc_lengths:
+                self._remove_locked(doc_id)
+            for term, count in term_counts.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+                recent = self._recent_postings.get(term)
+                if recent is not None:
+                    recent.add(doc_id)
+                    # Rebuild the top postings once the additions are as many as the list itself
+                    if len(recent) > self.candidate_limit:
+                        del self._top_postings[term]
+                        del self._recent_postings[term]
+            self._doc_terms[doc_id] = tuple(term_counts)
+            length = sum(term_counts.values())
+            self._doc_lengths[doc_id] = length
+            self._total_length += length
+
+    def remove(self, doc_id: Hashable):
+        """Remove a document from the index
+
+        Args:
+            doc_id: Document ID
+        """
+        with self._lock:
+            if doc_id in self._doc_lengths:
+                self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: Hashable):
+        """Remove a document, the caller holds the lock"""
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+                    self._top_postings.pop(term, None)
+                    self._recent_postings.pop(term, None)
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Hashable, float]]:
+        """Find the documents that best match a query
+
+        Args:
+            query: Query text
+            k: Maximum number of results
+
+        Returns:
+            List of (doc_id, score) pairs, best first
+        """
+        terms = set(tokenize(query))
+        if not terms or k <= 0:
+            return []
+
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if not doc_count:
+                return []
+            average_length = self._total_length / doc_count
+            doc_lengths = self._doc_lengths
+            length_factor = self.k1 * self.b / average_length
+            base_norm = self.k1 * (1 - self.b)
+            scores = {}
+
+            # Rare terms first: once they produce enough candidates, common terms with long
+            # posting lists only rescore those candidates instead of scanning every posting
+            term_postings = sorted(
+                ((term, self._postings[term]) for term in terms if term in self._postings),
+                key=lambda item: len(item[1])
+            )
+            for term, postings in term_postings:
+                document_frequency = len(postings)
+                idf = math.log(1 + (doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                if document_frequency <= self.candidate_limit:
+                    matches = postings.items()
+                elif len(scores) >= k:
+                    matches = ((doc_id, postings[doc_id]) for doc_id in list(scores) if doc_id in postings)
+                else:
+                    candidates = self._top_candidates_locked(term, postings, base_norm, length_factor)
+                    matches = ((doc_id, postings[doc_id]) for doc_id in candidates if doc_id in postings)
+                for doc_id, term_frequency in matches:
+                    norm = base_norm + length_factor * doc_lengths[doc_id]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * term_frequency * (self.k1 + 1) / (term_frequency + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def _top_candidates_locked(self, term: str, postings: Dict, base_norm: float, length_factor: float):
+        """Get the highest impact postings of a common term plus its recent additions, the caller holds the lock"""
+        top = self._top_postings.get(term)
+        if top is None:
+            doc_lengths = self._doc_lengths
+            impact = lambda doc_id: postings[doc_id] / (postings[doc_id] + base_norm + length_factor * doc_lengths[doc_id])
+            top = heapq.nlargest(self.candidate_limit, postings, key=impact)
+            self._top_postings[term] = top
+            self._recent_postings[term] = set()
+        recent = self._recent_postings[term]
+        return top + list(recent) if recent else top
+
+    def stats(self) -> Dict[str, int]:
+        """Get index size counters
+
+        Returns:
+            Dictionary with the number of documents and terms
+        """
+        with self._lock:
+            return {"documents": len(self._doc_lengths), "terms": len(self._postings)}
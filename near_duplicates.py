@@ -0,0 +1,164 @@
+import re
+import zlib
+import random
+import threading
+from typing import Dict, FrozenSet, Hashable, Optional, Tuple
+from memory_index import STOPWORDS, tokenize
+
+# Mersenne prime modulus of the universal hash family used as MinHash permutations
+_PRIME = (1 << 61) - 1
+
+# Capitalized words and words with digits, such as names, places, Slack IDs and numbers
+_DISTINCTIVE_PATTERN = re.compile(r"\b(?:[A-Z][\w'-]*|[^\W\d]*\d[\w.-]*)")
+
+def shingles(text: str) -> FrozenSet[str]:
+    """Get the set of terms two texts are compared on"""
+    return frozenset(tokenize(text))
+
+def distinctive_terms(text: str) -> FrozenSet[str]:
+    """Get the names, IDs and numbers of a text, which a near-duplicate must not contradict"""
+    return frozenset(
+        term for term in (match.casefold() for match in _DISTINCTIVE_PATTERN.findall(text)) if term not in STOPWORDS
+    )
+
+def compatible(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+    """Check whether two distinctive term sets can describe the same fact, one containing the other"""
+    return a <= b or b <= a
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Get the Jaccard similarity of two term sets"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class MinHashLSH:
+    """Near-duplicate detector using MinHash signatures and locality-sensitive hashing
+
+    Each text's term set is reduced to a MinHash signature that is split into bands.
+    Texts sharing any band are candidates, and candidates are confirmed with their
+    exact Jaccard similarity, so a lookup only compares against a handful of texts.
+    Candidates whose distinctive terms conflict, such as facts about different people
+    or with different numbers, are never near-duplicates however similar the rest is.
+    The default 16 bands of 3 rows make pairs at 0.6 similarity candidates about 98% of
+    the time and pairs at 0.2 only about 12% of the time.
+    """
+
+    def __init__(self, threshold: float = 0.6, num_perm: int = 48, bands: int = 16, seed: int = 1):
+        """Initialize an empty detector
+
+        Args:
+            threshold: Minimum Jaccard similarity of near-duplicates
+            num_perm: Number of hash permutations in a signature
+            bands: Number of LSH bands, must divide num_perm
+            seed: Seed of the hash permutations
+        """
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        generator = random.Random(seed)
+        self._permutations = [
+            (generator.randrange(1, _PRIME), generator.randrange(0, _PRIME)) for _ in range(num_perm)
+        ]
+        self._buckets = {}
+        self._entries: Dict[Hashable, Tuple[FrozenSet[str], Tuple, FrozenSet[str]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _signature(self, terms: FrozenSet[str]) -> Tuple[int, ...]:
+        """Compute the MinHash signature of a term set"""
+        if not terms:
+            return (0,) * self.num_perm
+        hashes = [zlib.crc32(term.encode("utf-8")) for term in terms]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self._permutations)
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        """Get the bucket key of each band of a signature"""
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def add(self, key: Hashable, text: str):
+        """Index a text, replacing it if the key is already indexed
+
+        Args:
+            key: Text key
+            text: Text to index
+        """
+        terms = shingles(text)
+        signature = self._signature(terms)
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = (terms, signature, distinctive_terms(text))
+            for band_key in self._band_keys(signature):
+                self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: Hashable):
+        """Remove a text from the index
+
+        Args:
+            key: Text key
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+
+    def _remove_locked(self, key: Hashable):
+        """Remove a text, the caller holds the lock"""
+        _, signature, _ = self._entries.pop(key)
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def find(self, text: str) -> Optional[Tuple[Hashable, float]]:
+        """Find the indexed text most similar to a text, if it is a near-duplicate
+
+        Args:
+            text: Text to look up
+
+        Returns:
+            Tuple of the key and Jaccard similarity of the best near-duplicate, or None
+        """
+        terms = shingles(text)
+        if not terms:
+            return None
+        distinctive = distinctive_terms(text)
+        signature = self._signature(terms)
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates.update(self._buckets.get(band_key, ()))
+            best = None
+            for key in candidates:
+                candidate_terms, _, candidate_distinctive = self._entries[key]
+                if not compatible(distinctive, candidate_distinctive):
+                    continue
+                similarity = jaccard(terms, candidate_terms)
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity)
+            return best
+
+    def terms(self, key: Hashable) -> FrozenSet[str]:
+        """Get the term set of an indexed text"""
+        with self._lock:
+            return self._entries[key][0]
+
+    def distinctive_terms(self, key: Hashable) -> FrozenSet[str]:
+        """Get the distinctive terms of an indexed text"""
+        with self._lock:
+            return self._entries[key][2]
+
+    def stats(self) -> Dict[str, int]:
+        """Get index size counters
+
+        Returns:
+            Dictionary with the number of texts and buckets
+        """
+        with self._lock:
+            return {"texts": len(self._entries), "buckets": len(self._buckets)}
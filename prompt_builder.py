@@ -0,0 +1,169 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from token_estimator import estimate_tokens
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Fragments of the API errors returned when a prompt exceeds the model's context window
+CONTEXT_LENGTH_ERRORS = (
+    "exceeds the maximum number of tokens",
+    "input token count",
+    "context length",
+    "context window",
+    "too many tokens",
+    "request payload size exceeds",
+)
+
+# Tokens added per message for role and turn markers
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def is_context_length_error(error: Exception) -> bool:
+    """Check whether an API error was caused by a prompt that is too long"""
+    message = str(error).lower()
+    return any(fragment in message for fragment in CONTEXT_LENGTH_ERRORS)
+
+class PromptBuilder:
+    """Packs memory and chat history into a prompt token budget
+
+    The prompt is laid out stable parts first so consecutive requests share a prefix:
+    the system instruction and the prefix turns (the workspace memory snapshot) open it,
+    the history follows, and everything that changes per request (the current time,
+    the memory items relevant to the query and the query itself) goes into the final
+    message. The stable parts and the query are always included. Relevant memory items
+    get up to a share of the remaining budget in rank order, and the rest is filled
+    with history entries from newest to oldest. Token counts are estimated locally
+    and cached per text, so repeated history entries are only measured once.
+    """
+
+    def __init__(self, token_budget: int = 8000, memory_share: float = 0.25, cache_size: int = 20000):
+        """Initialize the prompt builder
+
+        Args:
+            token_budget: Default total prompt token budget
+            memory_share: Maximum share of the budget left after the instruction and query used by memory
+            cache_size: Number of token counts kept in the cache
+        """
+        self.token_budget = token_budget
+        self.memory_share = memory_share
+        self.cache_size = cache_size
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"builds": 0, "retries": 0, "history_trimmed": 0, "cache_hits": 0, "cache_misses": 0}
+
+    def count(self, text: str) -> int:
+        """Get the estimated token count of a text, from the cache when it was measured before
+
+        Args:
+            text: Text to measure
+
+        Returns:
+            Estimated token count including the per-message overhead
+        """
+        with self._lock:
+            tokens = self._counts.get(text)
+            if tokens is not None:
+                self._counts.move_to_end(text)
+                self._counters["cache_hits"] += 1
+                return tokens
+        tokens = estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+        with self._lock:
+            self._counters["cache_misses"] += 1
+            self._counts[text] = tokens
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def build(self, system_instruction: str, memory_context: str, chat_history: List[Dict], query: str,
+              is_channel: bool = False, token_budget: Optional[int] = None, prefix: Optional[List[Dict]] = None,
+              preamble: str = "") -> Tuple[List[Dict], str, Dict[str, Any]]:
+        """Build the chat history and final message of a query
+
+        Args:
+            system_instruction: System instruction of the model
+            memory_context: Memory items relevant to the query, one per line, best first
+            chat_history: Recent conversation entries, oldest first
+            query: Current query as it will be sent
+            is_channel: Whether user entries are prefixed with the user's name
+            token_budget: Optional budget overriding the default, used when retrying with a smaller prompt
+            prefix: Optional stable turns that open the history, such as the memory snapshot
+            preamble: Optional per-request context placed at the start of the final message
+
+        Returns:
+            Tuple of the Gemini chat history, the message to send and a dictionary of packing statistics
+        """
+        budget = token_budget or self.token_budget
+        prefix = prefix or []
+        used = self.count(system_instruction or "") + self.count(query) + self.count(preamble)
+        for turn in prefix:
+            used += sum(self.count(part) for part in turn["parts"] if isinstance(part, str))
+
+        # Memory items in rank order, up to their share of what is left
+        memory_budget = int(max(0, budget - used) * self.memory_share)
+        memory_items = []
+        memory_tokens = 0
+        for memory_item in (memory_context or "").splitlines():
+            if not memory_item.strip():
+                continue
+            tokens = self.count(memory_item)
+            if memory_tokens + tokens > memory_budget:
+                break
+            memory_items.append(memory_item)
+            memory_tokens += tokens
+        used += memory_tokens
+
+        # History from newest to oldest until the budget is spent
+        history = []
+        for entry in reversed(chat_history):
+            content = entry.get("content", "")
+            # If this is a channel message and has user info, prefix with user name only (no channel prefix)
+            if is_channel and entry.get("user_name") and entry.get("role") == "user":
+                content = f"{entry['user_name']}: {content}"
+            tokens = self.count(content)
+            if used + tokens > budget:
+                break
+            history.append({
+                "role": "user" if entry.get("role") == "user" else "model",
+                "parts": [content]
+            })
+            used += tokens
+        history.reverse()
+
+        # Per-request context goes after the history so it never breaks the shared prefix
+        message_parts = []
+        if preamble:
+            message_parts.append(preamble)
+        if memory_items:
+            memory_text = "\n".join(memory_items)
+            message_parts.append(f"Relevant information I remember:\n{memory_text}")
+        message_parts.append(query)
+        message = "\n\n".join(message_parts)
+
+        with self._lock:
+            self._counters["builds"] += 1
+            if token_budget:
+                self._counters["retries"] += 1
+            if len(history) < len(chat_history):
+                self._counters["history_trimmed"] += 1
+
+        stats = {
+            "budget": budget,
+            "estimated_tokens": used,
+            "memory_items": len(memory_items),
+            "history_entries": len(history),
+            "history_available": len(chat_history),
+        }
+        return list(prefix) + history, message, stats
+
+    def stats(self) -> Dict[str, Any]:
+        """Get prompt building counters
+
+        Returns:
+            Dictionary of prompt metrics
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({"token_budget": self.token_budget, "cached_counts": len(self._counts)})
+            return stats
@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+from memory_index import BM25Index
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Request phrasing around a search that never changes what is searched for
+QUERY_STOPWORDS = frozenset(
+    "please pls can could you me search find look show tell give "
+    "알려줘 알려주세요 찾아줘 찾아봐 검색해줘 검색".split()
+)
+
+def normalize_query(query: str) -> str:
+    """Reduce a search query to its case-folded words, in order, without filler words
+
+    Queries that differ only in case, punctuation, spacing or request phrasing share a
+    key, so "Please search: Weather in Seoul?" and "weather in seoul" hit the same
+    cached results. Word order and every content word are kept, so different queries
+    never share a key.
+
+    Args:
+        query: Search query
+
+    Returns:
+        Normalized cache key
+    """
+    text = query.casefold()
+    keywords = [word for word in _WORD_PATTERN.findall(text) if word not in QUERY_STOPWORDS]
+    if not keywords:
+        return " ".join(text.split())
+    return " ".join(keywords)
+
+class SearchProvider:
+    """Interface for the backends of the search_web tool"""
+
+    # Name reported in tool results and metrics
+    name = "none"
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, str]]:
+        """Search for a query
+
+        Args:
+            query: Search keywords
+            limit: Maximum number of results
+
+        Returns:
+            List of results with "title", "url" and "snippet", best first
+        """
+        raise NotImplementedError
+
+class LocalIndexSearchProvider(SearchProvider):
+    """Offline stand-in that searches a local document collection with BM25
+
+    Documents are read from a JSON array or JSON lines file of objects with "title",
+    "url" and "text". A missing file gives an empty index.
+    """
+
+    name = "local"
+
+    def __init__(self, path: str, snippet_chars: int = 300):
+        """Load and index the documents
+
+        Args:
+            path: Path of the document file
+            snippet_chars: Maximum length of a result snippet
+        """
+        self.path = path
+        self.snippet_chars = snippet_chars
+        self.documents = []
+        self.index = BM25Index()
+        if os.path.exists(path):
+            for document in self._read(path):
+                self.add_document(document)
+        else:
+            logger.warning(f"Search index {path} not found, local search returns no results")
+
+    @staticmethod
+    def _read(path: str) -> List[Dict]:
+        """Read documents from a JSON array or JSON lines file"""
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        if not content:
+            return []
+        if content.startswith("["):
+            return json.loads(content)
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def add_document(self, document: Dict):
+        """Index a document with "title", "url" and "text" """
+        position = len(self.documents)
+        self.documents.append(document)
+        self.index.add(position, f"{document.get('title', '')}\n{document.get('text', '')}")
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, str]]:
+        results = []
+        for position, _ in self.index.search(query, limit):
+            document = self.documents[position]
+            results.append({
+                "title": document.get("title", ""),
+                "url": document.get("url", ""),
+                "snippet": document.get("text", "")[:self.snippet_chars]
+            })
+        return results
+
+class CachedSearch:
+    """Result cache in front of a search provider
+
+    Results are cached for ttl seconds under the normalized query, and concurrent
+    searches for the same key share one provider call (single-flight). Failed
+    searches are not cached.
+    """
+
+    def __init__(self, provider: SearchProvider, ttl: float = 600.0, max_entries: int = 1000):
+        """Initialize the cache
+
+        Args:
+            provider: Search provider
+            ttl: Seconds results are reused
+            max_entries: Maximum number of cached queries, least recently used are evicted first
+        """
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._counters = {"searches": 0, "hits": 0, "misses": 0, "coalesced": 0, "provider_calls": 0, "errors": 0}
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, str]]:
+        """Search through the cache
+
+        Args:
+            query: Search query
+            limit: Maximum number of results
+
+        Returns:
+            List of results, best first
+        """
+        key = (normalize_query(query), limit)
+        with self._lock:
+            self._counters["searches"] += 1
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[0]
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                leader = False
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                self._counters["misses"] += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            with self._lock:
+                self._counters["provider_calls"] += 1
+            results = self.provider.search(query, limit)
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = (results, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            del self._in_flight[key]
+        future.set_result(results)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters
+
+        Returns:
+            Dictionary of search metrics
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({"provider": self.provider.name, "cached_queries": len(self._entries), "in_flight": len(self._in_flight)})
+            return stats
+
+def create_search_provider(name: str, index_path: Optional[str] = None) -> SearchProvider:
+    """Create the configured search provider
+
+    Args:
+        name: Provider name, "local" for the offline document index
+        index_path: Path of the local document file
+
+    Returns:
+        A search provider instance
+    """
+    if name != "local":
+        logger.warning(f"Unknown search provider '{name}', using local")
+    return LocalIndexSearchProvider(index_path or os.path.join("data", "search_index.jsonl"))
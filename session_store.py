@@ -0,0 +1,439 @@
+import os
+import json
+import queue
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from storage import SessionStorage
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Size of the blocks read backward from the end of a session file
+TAIL_BLOCK_SIZE = 8192
+
+def make_history_id(app_id: str, channel_id: str, thread_ts: Optional[str] = None) -> str:
+    """Build the history ID of a conversation
+
+    Args:
+        app_id: ID of the app (workspace)
+        channel_id: Slack channel ID, or the user ID for direct messages
+        thread_ts: Optional thread timestamp when threads are stored separately
+
+    Returns:
+        History ID in the format "{app_id}_channel_{channel_id}[_thread_{thread_ts}]"
+    """
+    history_id = f"{app_id}_channel_{channel_id}"
+    if thread_ts:
+        history_id += f"_thread_{thread_ts}"
+    return history_id
+
+def parse_history_id(history_id: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """Split a history ID into its workspace, channel and thread parts
+
+    Args:
+        history_id: Conversation history ID
+
+    Returns:
+        Tuple of workspace ID, channel ID and thread timestamp, the last two may be None
+    """
+    if "_channel_" not in history_id:
+        return history_id, None, None
+    workspace_id, rest = history_id.split("_channel_", 1)
+    if "_thread_" in rest:
+        channel_id, thread_ts = rest.split("_thread_", 1)
+        return workspace_id, channel_id, thread_ts
+    return workspace_id, rest, None
+
+def decode_session_lines(lines, source: str) -> List[Dict]:
+    """Decode JSONL session lines, skipping blank and partially written ones
+
+    Args:
+        lines: Iterable of encoded lines
+        source: Name used in log messages
+
+    Returns:
+        List of decoded entries
+    """
+    entries = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed session line in {source}")
+    return entries
+
+def iter_session_file(path: str) -> Iterator[Dict]:
+    """Stream the entries of a JSONL session file one line at a time
+
+    Args:
+        path: Path of the JSONL session file
+
+    Yields:
+        Entries, oldest first
+    """
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'rb') as f:
+            for line in f:
+                yield from decode_session_lines((line,), path)
+    except Exception as e:
+        logger.error(f"Error reading session file {path}: {str(e)}")
+
+def read_session_file(path: str) -> List[Dict]:
+    """Read every entry of a JSONL session file, streaming it line by line
+
+    Args:
+        path: Path of the JSONL session file
+
+    Returns:
+        List of entries, oldest first
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'rb') as f:
+            return decode_session_lines(f, path)
+    except Exception as e:
+        logger.error(f"Error reading session file {path}: {str(e)}")
+        return []
+
+class JsonlSessionStore(SessionStorage):
+    """Append-only JSONL session log, one file per conversation, with tail reads and background compaction"""
+
+    def __init__(self, sessions_dir: str, max_entries: int = 100, compact_slack: Optional[int] = None):
+        """Initialize the session store
+
+        Args:
+            sessions_dir: Directory to store session files
+            max_entries: Number of entries kept per session after compaction
+            compact_slack: Number of entries a session may grow past max_entries before it is compacted
+        """
+        self.sessions_dir = sessions_dir
+        self.max_entries = max_entries
+        self.compact_slack = compact_slack if compact_slack is not None else max(10, max_entries // 2)
+        os.makedirs(sessions_dir, exist_ok=True)
+
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._counts = {}
+
+        # Compaction runs on its own thread so it never delays a reply
+        self._compaction_queue = queue.Queue()
+        self._pending_compactions = set()
+        self._compactor = threading.Thread(target=self._compaction_worker, name="session-compactor", daemon=True)
+        self._compactor.start()
+
+    def session_file(self, history_id: str) -> str:
+        """Get the session file path for a history ID
+
+        Args:
+            history_id: Conversation history ID
+
+        Returns:
+            Path of the JSONL session file
+        """
+        # Each conversation gets its own file, spread over hashed subdirectories of its workspace
+        workspace_id = parse_history_id(history_id)[0]
+        digest = hashlib.sha1(history_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.sessions_dir, workspace_id, digest[:2], digest[2:4], f"{history_id}.jsonl")
+
+    def summary_file(self, history_id: str) -> str:
+        """Get the path of a conversation's summary state, stored next to its session file"""
+        return self.session_file(history_id)[:-len(".jsonl")] + ".summary.json"
+
+    def iter_session_files(self, workspace_id: Optional[str] = None) -> Iterator[str]:
+        """Iterate over the conversation files of one or all workspaces
+
+        Args:
+            workspace_id: Optional workspace to restrict the listing to
+
+        Yields:
+            Paths of JSONL session files
+        """
+        if workspace_id:
+            roots = [os.path.join(self.sessions_dir, workspace_id)]
+        else:
+            roots = [os.path.join(self.sessions_dir, name) for name in self.list_workspaces()]
+        for root in roots:
+            for dir_path, _, file_names in os.walk(root):
+                for file_name in sorted(file_names):
+                    if file_name.endswith(".jsonl"):
+                        yield os.path.join(dir_path, file_name)
+
+    def list_workspaces(self) -> List[str]:
+        """List the workspaces that have stored conversations
+
+        Returns:
+            List of workspace IDs
+        """
+        return sorted(
+            name for name in os.listdir(self.sessions_dir)
+            if os.path.isdir(os.path.join(self.sessions_dir, name))
+        )
+
+    def list_conversations(self, workspace_id: str) -> List[str]:
+        """List the history IDs of the stored conversations of a workspace
+
+        Args:
+            workspace_id: Workspace ID
+
+        Returns:
+            List of history IDs
+        """
+        return [os.path.basename(path)[:-len(".jsonl")] for path in self.iter_session_files(workspace_id)]
+
+    def iter_entries(self, history_id: str) -> Iterator[Dict]:
+        """Stream every entry of a session without loading the whole file
+
+        Args:
+            history_id: Conversation history ID
+
+        Yields:
+            Entries, oldest first
+        """
+        return iter_session_file(self.session_file(history_id))
+
+    def _lock_for(self, path: str) -> threading.Lock:
+        """Get the lock that serializes appends and compaction of one file"""
+        with self._locks_guard:
+            if path not in self._locks:
+                self._locks[path] = threading.Lock()
+            return self._locks[path]
+
+    def read_tail(self, history_id: str, limit: int) -> List[Dict]:
+        """Read the last entries of a session by seeking backward from the end of the file
+
+        Args:
+            history_id: Conversation history ID
+            limit: Maximum number of entries to return
+
+        Returns:
+            List of the most recent entries, oldest first
+        """
+        path = self.session_file(history_id)
+        if limit <= 0 or not os.path.exists(path):
+            return []
+
+        try:
+            with open(path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                position = f.tell()
+                data = b""
+                # Read blocks until there are more newlines than requested lines, or the start of the file
+                while position > 0 and data.count(b"\n") <= limit:
+                    read_size = min(TAIL_BLOCK_SIZE, position)
+                    position -= read_size
+                    f.seek(position)
+                    data = f.read(read_size) + data
+        except Exception as e:
+            logger.error(f"Error loading chat history for {history_id}: {str(e)}")
+            return []
+
+        lines = data.split(b"\n")
+        if position > 0:
+            # The first line may be cut in the middle
+            lines = lines[1:]
+        return decode_session_lines(lines, history_id)[-limit:]
+
+    def read_all(self, history_id: str) -> List[Dict]:
+        """Read every entry of a session
+
+        Args:
+            history_id: Conversation history ID
+
+        Returns:
+            List of entries, oldest first
+        """
+        return read_session_file(self.session_file(history_id))
+
+    def count(self, history_id: str) -> int:
+        """Get the number of entries in a session, counting lines only the first time
+
+        Args:
+            history_id: Conversation history ID
+
+        Returns:
+            Number of entries in the session file
+        """
+        path = self.session_file(history_id)
+        with self._lock_for(path):
+            return self._count_locked(path)
+
+    def _count_locked(self, path: str) -> int:
+        """Get the cached line count of a file, the caller holds the file lock"""
+        if path not in self._counts:
+            count = 0
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    count = sum(1 for line in f if line.strip())
+            self._counts[path] = count
+        return self._counts[path]
+
+    def append(self, history_id: str, entries: List[Dict]):
+        """Append entries to a session and schedule compaction when it grows too large
+
+        Args:
+            history_id: Conversation history ID
+            entries: Entries to append, oldest first
+        """
+        if not entries:
+            return
+        path = self.session_file(history_id)
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        try:
+            with self._lock_for(path):
+                count = self._count_locked(path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(data)
+                self._counts[path] = count + len(entries)
+                needs_compaction = self._counts[path] > self.max_entries + self.compact_slack
+        except Exception as e:
+            logger.error(f"Error saving chat history for {history_id}: {str(e)}")
+            return
+
+        if needs_compaction:
+            self.schedule_compaction(path)
+
+    def schedule_compaction(self, path: str):
+        """Queue a session file for background compaction
+
+        Args:
+            path: Path of the JSONL session file
+        """
+        with self._locks_guard:
+            if path in self._pending_compactions:
+                return
+            self._pending_compactions.add(path)
+        self._compaction_queue.put(path)
+
+    def _compaction_worker(self):
+        """Compact queued session files one at a time"""
+        while True:
+            path = self._compaction_queue.get()
+            with self._locks_guard:
+                self._pending_compactions.discard(path)
+            try:
+                self.compact(path)
+            except Exception as e:
+                logger.error(f"Error compacting session file {path}: {str(e)}")
+
+    def compact(self, path: str):
+        """Rewrite a session file keeping only the most recent max_entries entries
+
+        Args:
+            path: Path of the JSONL session file
+        """
+        with self._lock_for(path):
+            entries = read_session_file(path)
+            if len(entries) > self.max_entries:
+                entries = entries[-self.max_entries:]
+                self._write_entries(path, entries)
+                logger.info(f"Compacted session file {path} to {len(entries)} entries")
+            self._counts[path] = len(entries)
+
+    def clear(self, history_id: str):
+        """Delete a session
+
+        Args:
+            history_id: Conversation history ID
+        """
+        path = self.session_file(history_id)
+        with self._lock_for(path):
+            for file_path in (path, self.summary_file(history_id)):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            self._counts[path] = 0
+
+    def load_summary_state(self, history_id: str) -> Optional[Dict]:
+        path = self.summary_file(history_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading summary state {path}: {str(e)}")
+            return None
+
+    def save_summary_state(self, history_id: str, state: Dict):
+        path = self.summary_file(history_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _write_entries(path: str, entries: List[Dict]):
+        """Atomically replace a session file with the given entries"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_path, path)
+
+    def migrate_legacy_sessions(self) -> int:
+        """Split legacy top-level session files into per-conversation files
+
+        Handles both sessions/*.json and sessions/*.jsonl. Shared workspace files
+        (named after the workspace) are split by the channel_id stored on each
+        entry, other files already hold a single conversation. The original file
+        is kept with a .bak suffix.
+
+        Returns:
+            Number of files migrated
+        """
+        migrated = 0
+        for file_name in sorted(os.listdir(self.sessions_dir)):
+            legacy_path = os.path.join(self.sessions_dir, file_name)
+            if not os.path.isfile(legacy_path) or not file_name.endswith((".json", ".jsonl")):
+                continue
+            name = file_name.rsplit(".", 1)[0]
+            try:
+                if file_name.endswith(".jsonl"):
+                    entries = read_session_file(legacy_path)
+                else:
+                    with open(legacy_path, 'r', encoding='utf-8') as f:
+                        entries = json.load(f)
+                    if not isinstance(entries, list):
+                        logger.warning(f"Skipping session file with unexpected format: {legacy_path}")
+                        continue
+
+                # Group entries by the conversation they belong to
+                conversations = {}
+                for entry in entries:
+                    if "_channel_" in name:
+                        history_id = name
+                    else:
+                        history_id = make_history_id(name, entry.get("channel_id") or "legacy")
+                    conversations.setdefault(history_id, []).append(entry)
+
+                for history_id, conversation in conversations.items():
+                    path = self.session_file(history_id)
+                    with self._lock_for(path):
+                        # Entries already written to the conversation file are newer than the legacy file
+                        conversation = (conversation + read_session_file(path))[-self.max_entries:]
+                        self._write_entries(path, conversation)
+                        self._counts[path] = len(conversation)
+
+                os.replace(legacy_path, legacy_path + ".bak")
+                migrated += 1
+                logger.info(f"Split session file {legacy_path} into {len(conversations)} conversations")
+            except Exception as e:
+                logger.error(f"Error migrating session file {legacy_path}: {str(e)}")
+        return migrated
+
+if __name__ == "__main__":
+    # Split legacy session files in the default sessions directory into per-conversation files
+    logging.basicConfig(level=logging.INFO)
+    sessions_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+    store = JsonlSessionStore(sessions_dir)
+    print(f"Migrated {store.migrate_legacy_sessions()} session files")
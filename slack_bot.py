@@ -2,13 +2,32 @@ import os
 import json
 import logging
 import datetime
-import os
+import time
+import signal
+import threading
 from flask import Flask, request, jsonify
 from slack_bolt import App
 from slack_bolt.adapter.flask import SlackRequestHandler
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 from flat_memory_manager import FlatMemoryManager
+from event_pipeline import EventWorkerPool
+from event_dedup import create_dedup_store, event_dedup_key
+from slack_metadata_cache import SlackMetadataCache
+from slack_routing import SlackRoutingTable, parse_slack_body
+from session_store import make_history_id, parse_history_id
+from storage import create_storage
+from conversation_cache import ConversationCache
+from summarization_scheduler import SummarizationScheduler
+from memory_extractor import BatchMemoryExtractor, format_turns, user_name_memories
+from prompt_builder import PromptBuilder, is_context_length_error
+from context_cache import ContextCache
+from slack_streaming import SlackStreamer
+from tool_runner import ToolRunner
+from search_provider import CachedSearch, create_search_provider
+from local_tools import LOCAL_TOOL_DECLARATIONS, local_tool_handlers
+from embedding_service import create_embedding_service
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -48,21 +67,171 @@ os.makedirs(MEMORY_DIR, exist_ok=True)
 # Maximum number of messages to keep in history
 MAX_HISTORY_SIZE = 50
 
+# Keep a separate history per thread instead of one per channel
+SESSION_PER_THREAD = os.environ.get("SESSION_PER_THREAD", "false").lower() == "true"
+
+# Storage backend for sessions and memory: "json" (files) or "sqlite"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+DATABASE_PATH = os.environ.get("DATABASE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "slack_bot.db"))
+
+# Hot conversations are cached in memory and written to disk in the background
+CONVERSATION_CACHE_SIZE = int(os.environ.get("CONVERSATION_CACHE_SIZE", 1000))
+CONVERSATION_CACHE_BYTES = int(os.environ.get("CONVERSATION_CACHE_BYTES", 64 * 1024 * 1024))
+CONVERSATION_FLUSH_INTERVAL = float(os.environ.get("CONVERSATION_FLUSH_INTERVAL", 2.0))
+
+# Embedding provider for memory and history search: "local" (offline hashing) or "gemini"
+EMBEDDING_PROVIDER = os.environ.get("EMBEDDING_PROVIDER", "local")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "models/text-embedding-004")
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "embeddings.db"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 100))
+EMBEDDING_BATCH_WAIT = float(os.environ.get("EMBEDDING_BATCH_WAIT", 0.05))
+
+# Background summarization of conversations into long-term memory
+SUMMARY_INTERVAL = int(os.environ.get("SUMMARY_INTERVAL", 10))
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", 2))
+SUMMARY_DELAY = float(os.environ.get("SUMMARY_DELAY", 10.0))
+SUMMARY_BATCH_SIZE = int(os.environ.get("SUMMARY_BATCH_SIZE", 8))
+SUMMARY_BATCH_TOKENS = int(os.environ.get("SUMMARY_BATCH_TOKENS", 24000))
+
+# Estimated token budget of a prompt, filled with memory and then history from newest to oldest
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 8000))
+PROMPT_MEMORY_SHARE = float(os.environ.get("PROMPT_MEMORY_SHARE", 0.25))
+# Number of retries with a halved budget when the API rejects a prompt as too long
+PROMPT_MAX_RETRIES = int(os.environ.get("PROMPT_MAX_RETRIES", 2))
+
+# Stable prompt prefix caching: "off" (implicit caching only), "gemini" (explicit cached content) or "local" (offline stand-in)
+CONTEXT_CACHE = os.environ.get("CONTEXT_CACHE", "off")
+CONTEXT_CACHE_TTL = int(os.environ.get("CONTEXT_CACHE_TTL", 3600))
+# Seconds a workspace memory snapshot stays in the prompt prefix before it is rebuilt
+MEMORY_SNAPSHOT_TTL = float(os.environ.get("MEMORY_SNAPSHOT_TTL", 300))
+
+# Stable sentence of the system instruction, the current date and time are sent at the start of each message
+CURRENT_TIME_INSTRUCTION = "The current date and time are given at the start of the latest message. Always use them when asked about the current date or time."
+
+# Stream replies into a placeholder message that is edited as the text is generated
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "false").lower() == "true"
+# Minimum seconds between two edits in one channel, Slack allows about one message update per second per channel
+STREAM_UPDATE_INTERVAL = float(os.environ.get("STREAM_UPDATE_INTERVAL", 1.0))
+STREAM_PLACEHOLDER = os.environ.get("STREAM_PLACEHOLDER", "_Thinking..._")
+
+# Maximum number of tool rounds (function calls answered with their results) per reply
+TOOL_MAX_ITERATIONS = int(os.environ.get("TOOL_MAX_ITERATIONS", 3))
+# Function calls of one model turn run concurrently, and the turn waits at most TOOL_DEADLINE seconds for them
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", 8))
+TOOL_DEADLINE = float(os.environ.get("TOOL_DEADLINE", 10.0))
+
+# Backend of the search_web tool: "local" searches an offline document index
+SEARCH_PROVIDER = os.environ.get("SEARCH_PROVIDER", "local")
+SEARCH_INDEX_PATH = os.environ.get("SEARCH_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "search_index.jsonl"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 600))
+SEARCH_RESULTS = int(os.environ.get("SEARCH_RESULTS", 5))
+
+# Default IANA timezone of workspaces, used for the current time and the get_current_datetime tool
+BOT_TIMEZONE = os.environ.get("BOT_TIMEZONE", "UTC")
+
+# Tells the model to answer date, time, arithmetic and unit questions with the local tools instead of searching
+LOCAL_TOOLS_INSTRUCTION = "For the current date or time, arithmetic and unit conversions, use the get_current_datetime, calculate and convert_units tools instead of search_web."
+
 # Default configuration file path
 DEFAULT_CONFIG_PATH = os.path.join(CONFIG_DIR, "slack_config.json")
 
+# Worker pool used to process Slack events after they have been acknowledged
+EVENT_WORKERS = int(os.environ.get("EVENT_WORKERS", 8))
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", 100))
+# Seconds queued and running events may take to finish on shutdown
+EVENT_DRAIN_TIMEOUT = float(os.environ.get("EVENT_DRAIN_TIMEOUT", 8))
+
+# Event deduplication, set DEDUP_REDIS_URL to share seen events across replicas
+DEDUP_REDIS_URL = os.environ.get("DEDUP_REDIS_URL")
+DEDUP_TTL = int(os.environ.get("DEDUP_TTL", 600))
+
+# Slack user and channel metadata cache lifetimes in seconds
+METADATA_CACHE_TTL = int(os.environ.get("METADATA_CACHE_TTL", 3600))
+METADATA_NEGATIVE_TTL = int(os.environ.get("METADATA_NEGATIVE_TTL", 300))
+
+# Reply sent when the event queue is full and the event is shed
+BUSY_MESSAGE = "I'm handling a lot of requests right now. Please try again in a moment."
+
 class SlackBotManager:
     """Manager class to handle multiple Slack bot instances"""
     
     def __init__(self):
         self.bots = {}
         self.handlers = {}
+        self.routes = SlackRoutingTable()
+        
+        # Session and memory storage for the configured backend
+        self.session_store, self.memory_storage = create_storage(
+            STORAGE_BACKEND,
+            SESSIONS_DIR,
+            MEMORY_DIR,
+            DATABASE_PATH,
+            max_entries=MAX_HISTORY_SIZE * 2  # *2 because each exchange has user and bot messages
+        )
+        self.conversation_cache = ConversationCache(
+            self.session_store,
+            max_entries=CONVERSATION_CACHE_SIZE,
+            max_bytes=CONVERSATION_CACHE_BYTES,
+            flush_interval=CONVERSATION_FLUSH_INTERVAL
+        )
         self.flask_app = Flask(__name__)
         
+        # Slack listeners only enqueue work so the request can be acked right away
+        self.event_pool = EventWorkerPool(max_workers=EVENT_WORKERS, max_queue_size=EVENT_QUEUE_SIZE)
+        
+        # Remember accepted events so Slack retries are not answered twice
+        self.dedup_store = create_dedup_store(DEDUP_REDIS_URL, ttl=DEDUP_TTL)
+        
+        # Shared embedding service with a persistent cache, batching calls across conversations
+        self.embedding_service = None
+        try:
+            self.embedding_service = create_embedding_service(
+                EMBEDDING_PROVIDER,
+                cache_path=EMBEDDING_CACHE_PATH,
+                model=EMBEDDING_MODEL,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                max_wait=EMBEDDING_BATCH_WAIT
+            )
+        except Exception as e:
+            logger.error(f"Error initializing embedding service: {str(e)}")
+        
+        # Structured memory extractor shared by the workspaces, batching conversations per request
+        self.memory_extractor = BatchMemoryExtractor(max_batch_tokens=SUMMARY_BATCH_TOKENS)
+        
         # Initialize memory manager
         self.memory = {}
         for workspace_id in ["workspace1", "workspace2"]:
-            self.memory[workspace_id] = FlatMemoryManager(MEMORY_DIR, workspace_id)
+            self.memory[workspace_id] = FlatMemoryManager(
+                MEMORY_DIR, workspace_id, storage=self.memory_storage, embedder=self.embedding_service
+            )
+        
+        # Summaries are produced in the background so they never delay a reply
+        self.summarizer = SummarizationScheduler(
+            self.summarize_conversations,
+            max_workers=SUMMARY_WORKERS,
+            delay=SUMMARY_DELAY,
+            max_batch=SUMMARY_BATCH_SIZE
+        )
+        
+        # Packs memory and history into the prompt token budget
+        self.prompt_builder = PromptBuilder(token_budget=PROMPT_TOKEN_BUDGET, memory_share=PROMPT_MEMORY_SHARE)
+        
+        # Keeps the instruction and memory snapshot of each workspace a stable, cacheable prompt prefix
+        self.context_cache = ContextCache(CONTEXT_CACHE, ttl=CONTEXT_CACHE_TTL, snapshot_ttl=MEMORY_SNAPSHOT_TTL)
+        
+        # Progressive reply edits, rate limited per channel across all replies
+        self.streamer = SlackStreamer(min_interval=STREAM_UPDATE_INTERVAL, placeholder=STREAM_PLACEHOLDER)
+        
+        # Search results are cached by normalized query and concurrent identical searches share one call
+        self.search = CachedSearch(create_search_provider(SEARCH_PROVIDER, SEARCH_INDEX_PATH), ttl=SEARCH_CACHE_TTL)
+        
+        # Function calls of the model are executed locally and their results returned in the same chat
+        self.tool_runner = ToolRunner(
+            dict(local_tool_handlers(), search_web=self.search_web),
+            max_iterations=TOOL_MAX_ITERATIONS,
+            max_workers=TOOL_WORKERS,
+            deadline=TOOL_DEADLINE
+        )
         
         # Load configurations
         self.load_configurations()
@@ -78,6 +247,7 @@ class SlackBotManager:
                 default_config = [{
                     "app_id": "default",
                     "team_id": os.environ.get("SLACK_TEAM_ID", ""),
+                    "api_app_id": os.environ.get("SLACK_APP_ID", ""),
                     "bot_token": os.environ.get("SLACK_BOT_TOKEN", ""),
                     "signing_secret": os.environ.get("SLACK_SIGNING_SECRET", ""),
                     "model": "gemini-2.5-flash-preview-04-17",
@@ -99,19 +269,16 @@ class SlackBotManager:
                 bot_token = config.get("bot_token", os.environ.get("SLACK_BOT_TOKEN"))
                 signing_secret = config.get("signing_secret", os.environ.get("SLACK_SIGNING_SECRET"))
                 model_name = config.get("model", "gemini-2.5-flash-preview-04-17")
-                # Get current date and time
-                current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-                current_day = datetime.datetime.now().strftime("%A")
-                current_time = datetime.datetime.now().strftime("%H:%M:%S")
                 
-                # Add current date and time to system instruction
                 base_instruction = config.get("system_instruction", 
                                             "Keep your responses simple, short, and conversational like a Slack chat. Avoid lengthy explanations. Be direct and concise.")
                 
                 # Encourage keyword extraction for search tool
                 base_instruction += " When searching for current information, first extract concise search keywords from the user's question and use them as the query for your search_web tool."
+                base_instruction += f" {LOCAL_TOOLS_INSTRUCTION}"
                 
-                system_instruction = f"{base_instruction}\n\nIMPORTANT: Today's date is {current_date} ({current_day}), and the current time is {current_time}. Always use this information when asked about the current date or time."
+                # The current date and time change every request, so they are sent with each message rather than in the cached instruction
+                system_instruction = f"{base_instruction}\n\nIMPORTANT: {CURRENT_TIME_INSTRUCTION}"
                 
                 # Configure safety settings
                 safety_settings = {
@@ -128,27 +295,39 @@ class SlackBotManager:
                 # Initialize Slack app
                 app = App(token=bot_token, signing_secret=signing_secret)
                 
+                generation_config = {
+                    "temperature": 0.7,
+                    "top_p": 0.95,
+                    "top_k": 40,
+                }
+                tools = [{"function_declarations": [search_function] + LOCAL_TOOL_DECLARATIONS}]  # Enable Google Search and the local tools
+                
                 # Initialize Gemini model with Google Search capability
                 model = genai.GenerativeModel(
                     model_name, 
                     system_instruction=system_instruction,
                     safety_settings=safety_settings,
-                    generation_config={
-                        "temperature": 0.7,
-                        "top_p": 0.95,
-                        "top_k": 40,
-                    },
-                    tools=[{"function_declarations": [search_function]}]  # Enable Google Search
+                    generation_config=generation_config,
+                    tools=tools
                 )
                 
                 # Store app, handler, and model
                 self.bots[app_id] = {
                     "app": app,
                     "model": model,
-                    "config": config
+                    "config": config,
+                    "system_instruction": system_instruction,
+                    "timezone": config.get("timezone", BOT_TIMEZONE),
+                    "model_settings": {
+                        "model_name": model_name,
+                        "safety_settings": safety_settings,
+                        "generation_config": generation_config,
+                        "tools": tools
+                    }
                 }
                 
                 self.handlers[app_id] = SlackRequestHandler(app)
+                self.routes.add(app_id, config)
                 
                 # Register event handlers
                 self.register_event_handlers(app_id)
@@ -190,7 +369,8 @@ class SlackBotManager:
             
             # Initialize Gemini model with Google Search grounding
             system_instruction = ("Keep your responses simple, short, and conversational like a Slack chat. Avoid lengthy explanations. Be direct and concise. "
-                                  "When searching for current information, first extract concise search keywords from the user's question and use them as the query for your search_web tool.")
+                                  "When searching for current information, first extract concise search keywords from the user's question and use them as the query for your search_web tool. "
+                                  f"{LOCAL_TOOLS_INSTRUCTION}\n\nIMPORTANT: {CURRENT_TIME_INSTRUCTION}")
             
             # For Gemini 2.5, we need to define function declarations for search
             search_function = {
@@ -208,19 +388,29 @@ class SlackBotManager:
                 }
             }
             
+            tools = [{"function_declarations": [search_function] + LOCAL_TOOL_DECLARATIONS}]  # Enable Google Search and the local tools
+            
             # Initialize the model with the search function
             model = genai.GenerativeModel(
                 'gemini-2.5-flash-preview-04-17', 
                 system_instruction=system_instruction,
                 safety_settings=safety_settings,
                 generation_config=generation_config,
-                tools=[{"function_declarations": [search_function]}]  # Enable Google Search as a tool
+                tools=tools
             )
             
             # Store app, handler, and model
             self.bots[app_id] = {
                 "app": app,
                 "model": model,
+                "system_instruction": system_instruction,
+                "timezone": BOT_TIMEZONE,
+                "model_settings": {
+                    "model_name": 'gemini-2.5-flash-preview-04-17',
+                    "safety_settings": safety_settings,
+                    "generation_config": generation_config,
+                    "tools": tools
+                },
                 "config": {
                     "app_id": app_id,
                     "bot_token": bot_token,
@@ -231,6 +421,7 @@ class SlackBotManager:
             }
             
             self.handlers[app_id] = SlackRequestHandler(app)
+            self.routes.add(app_id, self.bots[app_id]["config"])
             
             # Register event handlers
             self.register_event_handlers(app_id)
@@ -244,305 +435,382 @@ class SlackBotManager:
         """Register event handlers for a specific app"""
         app = self.bots[app_id]["app"]
         
+        # Cache Slack metadata per app, resolve the bot identity now and warm the user cache in the background
+        metadata = SlackMetadataCache(app.client, ttl=METADATA_CACHE_TTL, negative_ttl=METADATA_NEGATIVE_TTL)
+        self.bots[app_id]["metadata"] = metadata
+        metadata.get_bot_user_id()
+        threading.Thread(target=metadata.prefetch_users, name=f"prefetch-users-{app_id}", daemon=True).start()
+        
         @app.event("app_mention")
         def handle_app_mention(body, say):
             """Handle mentions of the bot in channels"""
-            try:
-                # Extract the text, user ID, and channel ID from the mention
-                text = body["event"]["text"]
-                user_id = body["event"]["user"]
-                channel_id = body["event"]["channel"]
-                
-                # Get user info
-                user_info = self.get_user_info(app_id, user_id)
-                user_name = user_info.get("name")
-                
-                # Get thread_ts only if the message is in a thread
-                thread_ts = body["event"].get("thread_ts")
-                
-                # Extract the bot ID from the event
-                bot_id = body["event"].get("bot_id") or app.client.auth_test()["user_id"]
-                bot_mention = f"<@{bot_id}>"
-                
-                # Remove the bot mention to get the query, regardless of where it appears
-                query = text.replace(bot_mention, "").strip()
-                
-                if not query:
-                    # Respond in thread if in thread, otherwise in channel
-                    if thread_ts:
-                        say(text="How can I help you today?", thread_ts=thread_ts)
-                    else:
-                        say(text="How can I help you today?")
-                    return
-                
-                # Log the incoming query
-                logger.info(f"[{app_id}] Received query from user {user_name} ({user_id}) in channel {channel_id}: {query}")
-                
-                # Use workspace-wide history for both threads and channel messages
-                history_id = f"{app_id}_channel_{channel_id}"
-                is_channel = True
-                response_text = self.generate_response_with_history(app_id, history_id, query, is_channel, user_id, user_name, thread_ts)
-                
-                # Send the response back to Slack in the same thread if applicable
-                if thread_ts:
-                    say(text=response_text, thread_ts=thread_ts)
-                else:
-                    say(text=response_text)
-                
-            except Exception as e:
-                logger.error(f"[{app_id}] Error handling app mention: {str(e)}")
-                say("Sorry, I encountered an error processing your request.")
+            event = body["event"]
+            # Events of one conversation run in order, different conversations run in parallel
+            history_id = self.history_id_for_event(app_id, event.get("channel"), event)
+            if not self.event_pool.submit_keyed(history_id, self.process_app_mention, app_id, event, say):
+                self.reply_busy(app_id, event, say)
         
         @app.event("message")
         def handle_direct_message(body, say):
             """Handle direct messages to the bot"""
-            try:
-                # Skip messages from the bot itself to avoid loops
-                if body.get("event", {}).get("bot_id"):
-                    return
-                
-                # Extract the message text and user ID
-                text = body["event"]["text"]
-                user_id = body["event"]["user"]
-                
-                # Get user info
-                user_info = self.get_user_info(app_id, user_id)
-                user_name = user_info.get("name")
-                
-                # Get thread_ts only if the message is in a thread
-                thread_ts = body["event"].get("thread_ts")
-                
-                if not text:
-                    # Respond in thread if in thread, otherwise in channel
-                    if thread_ts:
-                        say(text="How can I help you today?", thread_ts=thread_ts)
-                    else:
-                        say(text="How can I help you today?")
-                    return
-                
-                # Log the incoming message
-                logger.info(f"[{app_id}] Received DM from user {user_name} ({user_id}): {text}")
-                
-                # Generate response using Gemini with workspace-wide chat history
-                # For DMs, we'll use the user ID as the channel ID to maintain separation between workspaces
-                history_id = f"{app_id}_channel_{user_id}"
-                response_text = self.generate_response_with_history(app_id, history_id, text, True, user_id, user_name, thread_ts)
-                
-                # Send the response back to Slack in the same thread if applicable
+            event = body.get("event", {})
+            # Skip messages from the bot itself to avoid loops
+            if event.get("bot_id"):
+                return
+            history_id = self.history_id_for_event(app_id, event.get("user"), event)
+            if not self.event_pool.submit_keyed(history_id, self.process_direct_message, app_id, event, say):
+                self.reply_busy(app_id, event, say)
+        
+        @app.event("user_change")
+        def handle_user_change(event):
+            """Refresh the cached user when their profile changes"""
+            metadata.update_user(event.get("user", {}))
+    
+    def history_id_for_event(self, app_id, conversation_id, event):
+        """Get the history ID of the conversation an event belongs to
+        
+        Channels use the channel ID and DMs use the user ID, with the thread
+        appended when SESSION_PER_THREAD is enabled.
+        """
+        thread_ts = event.get("thread_ts") if SESSION_PER_THREAD else None
+        return make_history_id(app_id, conversation_id, thread_ts)
+    
+    def reply_busy(self, app_id, event, say):
+        """Tell the user their event was shed because the worker queue is full"""
+        logger.warning(f"[{app_id}] Shedding event in channel {event.get('channel')} from user {event.get('user')}")
+        try:
+            thread_ts = event.get("thread_ts")
+            if thread_ts:
+                say(text=BUSY_MESSAGE, thread_ts=thread_ts)
+            else:
+                say(text=BUSY_MESSAGE)
+        except Exception as e:
+            logger.error(f"[{app_id}] Error sending busy message: {str(e)}")
+    
+    def process_app_mention(self, app_id, event, say):
+        """Generate and send the reply to a channel mention on a worker thread"""
+        started_at = time.monotonic()
+        reply = None
+        try:
+            # Extract the text, user ID, and channel ID from the mention
+            text = event["text"]
+            user_id = event["user"]
+            channel_id = event["channel"]
+            
+            # Get user info
+            user_info = self.get_user_info(app_id, user_id)
+            user_name = user_info.get("name")
+            
+            # Get thread_ts only if the message is in a thread
+            thread_ts = event.get("thread_ts")
+            
+            # Extract the bot ID from the event
+            bot_id = event.get("bot_id") or self.bots[app_id]["metadata"].get_bot_user_id()
+            bot_mention = f"<@{bot_id}>"
+            
+            # Remove the bot mention to get the query, regardless of where it appears
+            query = text.replace(bot_mention, "").strip()
+            
+            if not query:
+                # Respond in thread if in thread, otherwise in channel
                 if thread_ts:
-                    say(text=response_text, thread_ts=thread_ts)
+                    say(text="How can I help you today?", thread_ts=thread_ts)
                 else:
-                    say(text=response_text)
-                
-            except Exception as e:
-                logger.error(f"[{app_id}] Error handling direct message: {str(e)}")
+                    say(text="How can I help you today?")
+                return
+            
+            # Log the incoming query
+            logger.info(f"[{app_id}] Received query from user {user_name} ({user_id}) in channel {channel_id}: {query}")
+            
+            # Use one history per channel, or per thread when SESSION_PER_THREAD is enabled
+            history_id = self.history_id_for_event(app_id, channel_id, event)
+            is_channel = True
+            reply = self.start_streaming_reply(app_id, channel_id, thread_ts, started_at)
+            response_text = self.generate_response_with_history(app_id, history_id, query, is_channel, user_id, user_name, thread_ts, stream=reply)
+            
+            # Send the response back to Slack in the same thread if applicable
+            if reply is not None and reply.finish(response_text):
+                return
+            if thread_ts:
+                say(text=response_text, thread_ts=thread_ts)
+            else:
+                say(text=response_text)
+            
+        except Exception as e:
+            logger.error(f"[{app_id}] Error handling app mention: {str(e)}")
+            if reply is None or not reply.finish("Sorry, I encountered an error processing your request."):
+                say("Sorry, I encountered an error processing your request.")
+    
+    def process_direct_message(self, app_id, event, say):
+        """Generate and send the reply to a direct message on a worker thread"""
+        started_at = time.monotonic()
+        reply = None
+        try:
+            # Extract the message text and user ID
+            text = event["text"]
+            user_id = event["user"]
+            
+            # Get user info
+            user_info = self.get_user_info(app_id, user_id)
+            user_name = user_info.get("name")
+            
+            # Get thread_ts only if the message is in a thread
+            thread_ts = event.get("thread_ts")
+            
+            if not text:
+                # Respond in thread if in thread, otherwise in channel
+                if thread_ts:
+                    say(text="How can I help you today?", thread_ts=thread_ts)
+                else:
+                    say(text="How can I help you today?")
+                return
+            
+            # Log the incoming message
+            logger.info(f"[{app_id}] Received DM from user {user_name} ({user_id}): {text}")
+            
+            # Generate response using Gemini with the DM's chat history
+            # For DMs, we'll use the user ID as the channel ID to maintain separation between workspaces
+            history_id = self.history_id_for_event(app_id, user_id, event)
+            reply = self.start_streaming_reply(app_id, event.get("channel"), thread_ts, started_at)
+            response_text = self.generate_response_with_history(app_id, history_id, text, True, user_id, user_name, thread_ts, stream=reply)
+            
+            # Send the response back to Slack in the same thread if applicable
+            if reply is not None and reply.finish(response_text):
+                return
+            if thread_ts:
+                say(text=response_text, thread_ts=thread_ts)
+            else:
+                say(text=response_text)
+            
+        except Exception as e:
+            logger.error(f"[{app_id}] Error handling direct message: {str(e)}")
+            if reply is None or not reply.finish("Sorry, I encountered an error processing your request."):
                 say("Sorry, I encountered an error processing your request.")
     
+    def start_streaming_reply(self, app_id, channel_id, thread_ts, started_at):
+        """Post the placeholder of a streamed reply, None when streaming is disabled or the post failed"""
+        if not STREAM_RESPONSES or not channel_id:
+            return None
+        return self.streamer.start(self.bots[app_id]["app"].client, channel_id, thread_ts, started_at)
+    
     def setup_routes(self):
         """Set up Flask routes for all bots"""
         
         @self.flask_app.route("/slack/events", methods=["POST"])
         def slack_events():
             """Endpoint for Slack events"""
+            # Parse the body once and reuse it for verification, dedup and routing
+            raw_body = request.get_data(as_text=True)
+            payload = parse_slack_body(raw_body, request.headers.get("Content-Type"))
+            
             # Check if this is a URL verification challenge
-            if request.json and request.json.get("type") == "url_verification":
+            if payload.get("type") == "url_verification":
                 logger.info("Received URL verification challenge")
-                return jsonify({"challenge": request.json.get("challenge")})
-            
-            # Determine which app should handle this request based on the team_id
-            # Team ID could be at the top level or in the event/team object
-            team_id = request.json.get("team_id")
-            if not team_id and request.json.get("event"):
-                team_id = request.json.get("event", {}).get("team")
-            
-            # Log the incoming request details for debugging
-            logger.info(f"Received request from team_id: {team_id}")
-            logger.info(f"Request type: {request.json.get('type')}")
-            
-            # If we still don't have a team_id but have a token, try to match by token
-            if not team_id and request.headers.get("X-Slack-Signature"):
-                logger.info("No team_id found, trying to match by signature")
-                # Try each handler until one accepts the request
-                for app_id, handler in self.handlers.items():
-                    try:
-                        response = handler.handle(request)
-                        logger.info(f"Handler for app {app_id} accepted the request")
-                        return response
-                    except Exception as e:
-                        logger.debug(f"Handler for app {app_id} rejected: {str(e)}")
-                        continue
+                return jsonify({"challenge": payload.get("challenge")})
             
-            # Find the appropriate handler based on team_id
-            handler = None
-            for app_id, bot_data in self.bots.items():
-                config_team_id = bot_data["config"].get("team_id")
-                logger.info(f"Checking app {app_id} with team_id {config_team_id}")
-                if config_team_id == team_id:
-                    handler = self.handlers[app_id]
-                    logger.info(f"Found handler for app {app_id}")
-                    break
+            # Look up the app by api_app_id/team_id, then by which signing secret produced the signature
+            app_id = self.routes.resolve(payload) or self.routes.match_signature(request.headers, raw_body)
             
-            # If no specific handler found, use the default
-            if not handler and "default" in self.handlers:
-                handler = self.handlers["default"]
-                logger.info("Using default handler")
+            # If no specific app matched, use the default
+            if not app_id and "default" in self.handlers:
+                app_id = "default"
             
-            # If we have a handler, use it to handle the request
-            if handler:
-                return handler.handle(request)
-            else:
-                logger.error(f"No handler found for team_id: {team_id}")
+            handler = self.handlers.get(app_id)
+            if not handler:
+                logger.error(f"No handler found for request of type {payload.get('type')} from team {payload.get('team_id')}")
                 return jsonify({"error": "No handler available for this team"}), 400
+            
+            # Drop events that were already accepted, Slack retries them when our ack is slow.
+            # Only signed requests may mark an event as seen, so a forged event ID cannot suppress the real event.
+            dedup_key = event_dedup_key(payload)
+            if dedup_key and not self.routes.verify_signature(app_id, request.headers, raw_body):
+                logger.warning(f"Rejecting request with an invalid signature for app {app_id}")
+                return jsonify({"error": "invalid request"}), 401
+            if dedup_key and not self.dedup_store.mark_if_new(dedup_key):
+                retry_num = request.headers.get("X-Slack-Retry-Num")
+                retry_reason = request.headers.get("X-Slack-Retry-Reason")
+                logger.info(f"Dropping duplicate event {dedup_key} (retry {retry_num}, reason {retry_reason})")
+                return "", 200
+            
+            logger.debug(f"Routing {payload.get('type')} request to app {app_id}")
+            return handler.handle(request)
+        
+        @self.flask_app.route("/metrics", methods=["GET"])
+        def metrics():
+            """Endpoint exposing event pipeline metrics for capacity planning"""
+            return jsonify({
+                "event_pool": self.event_pool.stats(),
+                "dedup": self.dedup_store.stats(),
+                "conversation_cache": self.conversation_cache.stats(),
+                "embeddings": self.embedding_service.stats() if self.embedding_service else None,
+                "summarization": self.summarizer.stats(),
+                "memory_extraction": self.memory_extractor.stats(),
+                "prompt": self.prompt_builder.stats(),
+                "context_cache": self.context_cache.stats(),
+                "streaming": self.streamer.stats(),
+                "tools": self.tool_runner.stats(),
+                "search": self.search.stats(),
+                "metadata": {app_id: bot_data["metadata"].stats() for app_id, bot_data in self.bots.items() if "metadata" in bot_data}
+            })
     
 
     
-    def load_chat_history(self, user_id_or_channel):
-        """Load chat history for a user or channel from their session file"""
-        # For workspace-wide history, extract the workspace ID
-        if user_id_or_channel.startswith("workspace") and "_channel_" in user_id_or_channel:
-            # Extract workspace ID from the format "workspace{id}_channel_{channel_id}"
-            workspace_id = user_id_or_channel.split("_channel_")[0]
-            session_file = os.path.join(SESSIONS_DIR, f"{workspace_id}.json")
-        else:
-            session_file = os.path.join(SESSIONS_DIR, f"{user_id_or_channel}.json")
-            
-        if os.path.exists(session_file):
-            try:
-                with open(session_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Error loading chat history for {user_id_or_channel}: {str(e)}")
-        return []
+    def load_chat_history(self, user_id_or_channel, limit=MAX_HISTORY_SIZE * 2):
+        """Load the most recent chat history entries for a user or channel, from memory when cached"""
+        return self.conversation_cache.get(user_id_or_channel, limit)
+    
+    def save_chat_history(self, user_id_or_channel, new_entries):
+        """Append new chat history entries for a user or channel, the session log is written in the background"""
+        self.conversation_cache.append(user_id_or_channel, new_entries)
     
-    def save_chat_history(self, user_id_or_channel, chat_history):
-        """Save chat history for a user or channel to their session file"""
-        # Limit the history size
-        if len(chat_history) > MAX_HISTORY_SIZE * 2:  # *2 because each exchange has user and bot messages
-            # Keep only the most recent messages
-            chat_history = chat_history[-MAX_HISTORY_SIZE * 2:]
+    def summarize_conversations(self, jobs):
+        """Summarize the turns added since the last pass of several users or channels into their workspace memory, run by the summarizer
         
-        # For workspace-wide history, extract the workspace ID
-        if user_id_or_channel.startswith("workspace") and "_channel_" in user_id_or_channel:
-            # Extract workspace ID from the format "workspace{id}_channel_{channel_id}"
-            workspace_id = user_id_or_channel.split("_channel_")[0]
-            session_file = os.path.join(SESSIONS_DIR, f"{workspace_id}.json")
-        else:
-            session_file = os.path.join(SESSIONS_DIR, f"{user_id_or_channel}.json")
-            
-        try:
-            with open(session_file, 'w', encoding='utf-8') as f:
-                json.dump(chat_history, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            logger.error(f"Error saving chat history for {user_id_or_channel}: {str(e)}")
+        Args:
+            jobs: List of (workspace ID, history ID) pairs
+        """
+        items = []
+        for workspace_id, user_id_or_channel in jobs:
+            if workspace_id not in self.memory:
+                logger.warning(f"No memory configured for workspace {workspace_id}, skipping summarization of {user_id_or_channel}")
+                continue
+            state = self.session_store.load_summary_state(user_id_or_channel) or {}
+            watermark = state.get("watermark", "")
+            
+            # Only turns after the watermark are sent, earlier ones are covered by the rolling summary
+            new_turns = [entry for entry in self.load_chat_history(user_id_or_channel) if entry.get("timestamp", "") > watermark]
+            if new_turns:
+                items.append({
+                    "id": user_id_or_channel,
+                    "workspace_id": workspace_id,
+                    "text": format_turns(new_turns),
+                    "summary": state.get("summary", ""),
+                    "turns": new_turns
+                })
+        if not items:
+            return
+        
+        # One structured request covers several conversations
+        results = self.memory_extractor.extract(items)
+        updated_at = datetime.datetime.now().isoformat()
+        for item in items:
+            result = results.get(item["id"])
+            if result is None:
+                # Keep the watermark so these turns are retried on the next pass
+                continue
+            self.memory[item["workspace_id"]].add_memories(user_name_memories(item["turns"]) + result["memories"])
+            self.session_store.save_summary_state(item["id"], {
+                "watermark": item["turns"][-1].get("timestamp", ""),
+                "summary": result["summary"] or item["summary"],
+                "updated_at": updated_at
+            })
     
     def get_user_info(self, app_id, user_id):
-        """Get user information from Slack API"""
+        """Get user information from the app's Slack metadata cache"""
         try:
-            app = self.bots[app_id]["app"]
-            result = app.client.users_info(user=user_id)
-            if result["ok"]:
-                user = result["user"]
-                return {
-                    "id": user_id,
-                    "name": user.get("real_name") or user.get("name", "Unknown User"),
-                    "display_name": user.get("profile", {}).get("display_name", "")
-                }
+            return self.bots[app_id]["metadata"].get_user(user_id)
         except Exception as e:
             logger.error(f"[{app_id}] Error getting user info: {str(e)}")
         return {"id": user_id, "name": "Unknown User", "display_name": ""}
     
-    def generate_response_with_history(self, app_id, user_id_or_channel, query, is_channel=False, user_id=None, user_name=None, thread_ts=None):
-        """Generate a response using Gemini with the user's or channel's chat history"""
-        # Load the chat history
+    def generate_response_with_history(self, app_id, user_id_or_channel, query, is_channel=False, user_id=None, user_name=None, thread_ts=None, stream=None):
+        """Generate a response using Gemini with the user's or channel's chat history
+        
+        When stream is a StreamingReply, the response is generated in streaming mode and
+        the reply message is edited as chunks arrive. The final text is returned either way.
+        """
+        # Load the stored history window, the prompt builder keeps what fits the token budget
         chat_history = self.load_chat_history(user_id_or_channel)
         
-        # Extract workspace ID from user_id_or_channel
-        workspace_id = app_id
-        if "_channel_" in user_id_or_channel:
-            parts = user_id_or_channel.split("_channel_")
-            if len(parts) > 0:
-                workspace_id = parts[0]
+        # Extract workspace and channel IDs from user_id_or_channel
+        workspace_id, channel_id, _ = parse_history_id(user_id_or_channel)
+        if channel_id is None:
+            workspace_id = app_id
         
         try:
-            # Get the model for this app
-            model = self.bots[app_id]["model"]
+            bot = self.bots[app_id]
+            
+            # The workspace memory snapshot is part of the stable prefix shared by all conversations of the workspace
+            snapshot = ""
+            memory_manager = self.memory.get(workspace_id)
+            if memory_manager is not None:
+                snapshot = self.context_cache.snapshot(workspace_id, memory_manager.get_snapshot)
+            model, prefix, prefix_key = self.context_cache.model_for(app_id, workspace_id, bot, snapshot)
             
             # Get memory context
             memory_context = ""
             
             try:
-                # Get memory context for this workspace
-                if user_id and not is_channel:
-                    memory_context = self.memory[workspace_id].get_context_for_user(user_id)
-                else:
-                    # For channels, just get general context
-                    memory_context = self.memory[workspace_id].get_context_for_user()
+                # Get the memory items of this workspace most relevant to the user and query, minus those already in the snapshot
+                if memory_manager is not None:
+                    snapshot_items = set(snapshot.splitlines())
+                    memory_context = "\n".join(
+                        memory_item for memory_item in memory_manager.get_context_for_user(user_id, query=query).splitlines()
+                        if memory_item not in snapshot_items
+                    )
             except Exception as e:
                 logger.error(f"Error getting memory context: {str(e)}")
             
-            # Format chat history for Gemini
-            formatted_history = []
-            
-            # Add memory prompt as system message if it's not empty
-            if memory_context.strip():
-                formatted_history.append({
-                    "role": "model",
-                    "parts": [f"I have access to the following important information that I should remember:\n\n{memory_context}"]
-                })
-            
-            # Add recent conversation history
-            for entry in chat_history[-20:]:  # Use last 20 messages to avoid context limits
-                content = entry["content"]
-                
-                # If this is a channel message and has user info, prefix with user name only (no channel prefix)
-                if is_channel and entry.get("user_name") and entry["role"] == "user":
-                    content = f"{entry['user_name']}: {content}"
-                    
-                formatted_history.append({
-                    "role": "user" if entry["role"] == "user" else "model",
-                    "parts": [content]
-                })
-            
             # Format the current query with user name for channel messages
             current_query = query
             if is_channel and user_name:
                 current_query = f"{user_name}: {query}"
             
-            # Add the current query
-            if formatted_history:
-                # Continue the conversation with history
-                chat = model.start_chat(history=formatted_history)
-                # Create a generation config for the message
-                generation_config = {
-                    "response_mime_type": "text/plain"
-                }
-                
-                # Send the message with standard parameters
-                response = chat.send_message(
-                    current_query,
-                    generation_config=generation_config,
-                    stream=False
-                )
-                
-                # Handle function calling for search_web
-                response_text = self._process_function_calls(response, chat, current_query)
-            else:
-                # Start a new conversation
-                chat = model.start_chat()
-                # Create a generation config for the message
-                generation_config = {
-                    "response_mime_type": "text/plain"
-                }
-                
-                # Send the message with standard parameters
-                response = chat.send_message(
+            # The current time changes every request, so it goes into the message instead of the instruction
+            timezone = bot.get("timezone", BOT_TIMEZONE)
+            try:
+                now = datetime.datetime.now(ZoneInfo(timezone))
+            except (ZoneInfoNotFoundError, ValueError):
+                logger.warning(f"[{app_id}] Unknown timezone {timezone}, using UTC")
+                timezone = "UTC"
+                now = datetime.datetime.now(ZoneInfo(timezone))
+            preamble = f"[Current date and time: {now.strftime('%Y-%m-%d')} ({now.strftime('%A')}) {now.strftime('%H:%M')} {timezone}]"
+            
+            # Send the query, trimming the prompt and retrying if it is rejected as too long
+            token_budget = None
+            for attempt in range(PROMPT_MAX_RETRIES + 1):
+                formatted_history, message, prompt_stats = self.prompt_builder.build(
+                    bot.get("system_instruction", ""),
+                    memory_context,
+                    chat_history,
                     current_query,
-                    generation_config=generation_config,
-                    stream=False
+                    is_channel=is_channel,
+                    token_budget=token_budget,
+                    prefix=prefix,
+                    preamble=preamble
                 )
-                
-                # Handle function calling for search_web
-                response_text = self._process_function_calls(response, chat, current_query)
+                chat = model.start_chat(history=formatted_history)
+                try:
+                    response = chat.send_message(
+                        message,
+                        generation_config={"response_mime_type": "text/plain"},
+                        stream=stream is not None
+                    )
+                    break
+                except Exception as e:
+                    if attempt == PROMPT_MAX_RETRIES or not is_context_length_error(e):
+                        raise
+                    token_budget = prompt_stats["budget"] // 2
+                    logger.warning(f"[{app_id}] Prompt of about {prompt_stats['estimated_tokens']} tokens was too long, retrying with a budget of {token_budget}")
+            
+            # Show the text in the reply message as it is generated
+            if stream is not None:
+                streamed_text = ""
+                for chunk in response:
+                    try:
+                        streamed_text += chunk.text
+                    except (AttributeError, TypeError, ValueError):
+                        # Chunks carrying a function call have no text
+                        continue
+                    stream.update(streamed_text)
+            
+            # Record how much of the prompt was served from the context cache
+            self.context_cache.record_usage(
+                response, prefix_key, f"{bot.get('system_instruction', '')}\n{snapshot}", prompt_stats["estimated_tokens"]
+            )
+            
+            # Run the tools the model asked for and get its final answer
+            response_text = self.tool_runner.run(response, chat, defaults={"get_current_datetime": {"timezone": timezone}})
             
             # Get the response text and handle grounding information
             response_text = response_text
@@ -556,11 +824,6 @@ class SlackBotManager:
             
             # For channels, include the user ID, name, and channel ID in the content to track who said what and where
             if is_channel and user_id:
-                # Extract channel ID from the format "workspace{id}_channel_{channel_id}"
-                channel_id = None
-                if "_channel_" in user_id_or_channel:
-                    channel_id = user_id_or_channel.split("_channel_")[1]
-                
                 user_message = {
                     "role": "user", 
                     "content": query,  # Store original query without name prefix
@@ -569,36 +832,27 @@ class SlackBotManager:
                     "user_name": user_name or "Unknown User",  # Store the user name if available
                     "channel_id": channel_id  # Store the channel ID to track where the message was sent
                 }
-                chat_history.append(user_message)
+                new_entries = [user_message]
             else:
-                chat_history.append({"role": "user", "content": query, "timestamp": timestamp})
+                new_entries = [{"role": "user", "content": query, "timestamp": timestamp}]
             
             # For channel messages, include the channel ID in the bot response as well
-            if is_channel and "_channel_" in user_id_or_channel:
-                channel_id = user_id_or_channel.split("_channel_")[1]
-                chat_history.append({
+            if is_channel and channel_id:
+                new_entries.append({
                     "role": "bot", 
                     "content": response_text, 
                     "timestamp": timestamp,
                     "channel_id": channel_id  # Store the channel ID for bot responses too
                 })
             else:
-                chat_history.append({"role": "bot", "content": response_text, "timestamp": timestamp})
+                new_entries.append({"role": "bot", "content": response_text, "timestamp": timestamp})
             
-            # Save the updated chat history
-            self.save_chat_history(user_id_or_channel, chat_history)
+            # Append the new exchange to the session log
+            self.save_chat_history(user_id_or_channel, new_entries)
             
-            # Periodically summarize the session and update memory
-            if len(chat_history) % 10 == 0:  # Every 10 messages
-                try:
-                    # Summarize the session and extract important information
-                    summary = self.memory[workspace_id].summarize_session(chat_history)
-                    
-                    # Memory updates are handled in the summarize_session method
-                    # No additional processing needed
-                        
-                except Exception as e:
-                    logger.error(f"Error summarizing session: {str(e)}")
+            # Periodically summarize the session into memory, in the background
+            if self.conversation_cache.count(user_id_or_channel) % SUMMARY_INTERVAL == 0:
+                self.summarizer.request(workspace_id, user_id_or_channel)
             
             return response_text
             
@@ -608,148 +862,30 @@ class SlackBotManager:
     
 
     
-    def _process_function_calls(self, response, chat, original_query):
-        """Process function calls in the response"""
-        # If we can get the text directly, return it
-        try:
-            return response.text
-        except (AttributeError, TypeError):
-            pass
-            
-        # Check for function calls
-        try:
-            # Extract parts from the response
-            if not hasattr(response, 'candidates') or not response.candidates:
-                return "I couldn't generate a response. Please try again."
-                
-            candidate = response.candidates[0]
-            if not hasattr(candidate, 'content') or not candidate.content:
-                return "I couldn't generate a response. Please try again."
-                
-            content = candidate.content
-            if not hasattr(content, 'parts') or not content.parts:
-                return "I couldn't generate a response. Please try again."
-                
-            # Process each part
-            result_text = ""
-            has_function_call = False
-            
-            for part in content.parts:
-                # Extract text if available
-                if hasattr(part, 'text') and part.text:
-                    result_text += part.text
-                
-                # Handle function calls
-                if hasattr(part, 'function_call'):
-                    has_function_call = True
-                    function_call = part.function_call
-                    
-                    if function_call.name == "search_web":
-                        try:
-                            # Extract search query
-                            # Handle different types of args (string or object)
-                            try:
-                                if isinstance(function_call.args, str):
-                                    args = json.loads(function_call.args)
-                                    query = args.get("query", original_query)
-                                else:
-                                    # If args is already an object (MapComposite)
-                                    query = getattr(function_call.args, "query", original_query)
-                            except Exception as e:
-                                logger.error(f"Error parsing function args: {str(e)}")
-                                query = original_query
-                            
-                            logger.info(f"Searching web for: {query}")
-                            
-                            # Get current date and time for accurate search context
-                            current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-                            current_day = datetime.datetime.now().strftime("%A")
-                            current_time = datetime.datetime.now().strftime("%H:%M:%S")
-                            
-                            # Create a direct search instruction that forces the model to use its search tool
-                            search_prompt = f"""I need you to search the web for current information about: {query}
-                            
-                            IMPORTANT INSTRUCTIONS:
-                            1. You MUST use your search_web function to find this information
-                            2. Today's date is {current_date} ({current_day}), and the current time is {current_time}
-                            3. Make sure your search results reflect the most up-to-date information available
-                            4. DO NOT respond until you have completed the search
-                            5. Include specific details from your search results
-                            
-                            Please execute the search_web function now."""
-                            
-                            # Force the model to use the search tool by explicitly requesting it
-                            search_message = chat.send_message(search_prompt, stream=False)
-                            
-                            # Check if the search was actually performed
-                            search_performed = False
-                            if hasattr(search_message, 'candidates') and search_message.candidates:
-                                for candidate in search_message.candidates:
-                                    if hasattr(candidate, 'content') and candidate.content:
-                                        for part in candidate.content.parts:
-                                            if hasattr(part, 'function_call') and part.function_call:
-                                                search_performed = True
-                            
-                            # If search wasn't performed in the first attempt, try again with a more direct approach
-                            if not search_performed:
-                                direct_search_prompt = f"""USE YOUR SEARCH_WEB FUNCTION to find information about: {query}
-                                
-                                This is EXTREMELY IMPORTANT. You MUST use your search_web function.
-                                Do not respond with anything except the search results.
-                                
-                                Function name: search_web
-                                Parameter: query = \"{query}\"
-                                
-                                Execute this function now."""
-                                
-                                search_message = chat.send_message(direct_search_prompt, stream=False)
-                            
-                            # Now ask for a comprehensive response based on the search results
-                            follow_up_prompt = f"""Based on your search about '{query}', provide a detailed response with the information you found.
-                            
-                            IMPORTANT:
-                            1. Today's date is {current_date} ({current_day})
-                            2. Include specific facts and details from your search results
-                            3. If you didn't find any information, explicitly state that you couldn't find information about {query}
-                            4. Format your response in a conversational, helpful way
-                            
-                            What did you find about '{query}'?"""
-                            
-                            # Get the final response
-                            follow_up = chat.send_message(follow_up_prompt, stream=False)
-                            
-                            # Return the follow-up response
-                            try:
-                                return follow_up.text
-                            except (AttributeError, TypeError):
-                                # If we can't get text directly, try to extract it from parts
-                                follow_up_text = ""
-                                for follow_part in follow_up.candidates[0].content.parts:
-                                    if hasattr(follow_part, 'text') and follow_part.text:
-                                        follow_up_text += follow_part.text
-                                return follow_up_text if follow_up_text else "I found some information, but couldn't process it properly."
-                                
-                        except Exception as e:
-                            logger.error(f"Error processing search_web function: {str(e)}")
-                            return f"I tried to search for information about '{original_query}', but encountered an error. {result_text}"
-            
-            # If there was a function call but we didn't return from it, return a default message
-            if has_function_call:
-                return "I need to search for more information to answer your question accurately, but I'm currently unable to perform web searches."
-                
-            # If there was no function call but we have some text, return it
-            if result_text:
-                return result_text
-                
-            # Default response if we couldn't extract anything
-            return "I couldn't generate a response. Please try again."
-            
-        except Exception as e:
-            logger.error(f"Error processing function calls: {str(e)}")
-            return f"I encountered an error while processing your request. Please try again."
+    def search_web(self, query=""):
+        """Tool handler of search_web
+        
+        Args:
+            query: Search keywords chosen by the model
+            
+        Returns:
+            Dictionary with the query and its results
+        """
+        logger.info(f"Searching web for: {query}")
+        return {"query": query, "results": self.search.search(query, SEARCH_RESULTS)}
     
 
     
+    def shutdown(self):
+        """Flush buffered state before the process exits"""
+        logger.info("Shutting down, draining events and flushing conversations")
+        # Finish accepted events first, their replies are saved to the conversation cache
+        self.event_pool.shutdown(timeout=EVENT_DRAIN_TIMEOUT)
+        self.summarizer.shutdown()
+        self.conversation_cache.flush_all()
+        self.context_cache.shutdown()
+        self.tool_runner.shutdown()
+    
     def run(self, host='0.0.0.0', port=3000):
         """Run the Flask app"""
         self.flask_app.run(host=host, port=port)
@@ -760,5 +896,12 @@ if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
     
     bot_manager = SlackBotManager()
+    
+    # Cloud Run and Docker send SIGTERM before stopping the container
+    def handle_sigterm(signum, frame):
+        bot_manager.shutdown()
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
     # Run the Flask app on 0.0.0.0 to be accessible externally
     bot_manager.run(host='0.0.0.0', port=port)
@@ -0,0 +1,178 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Sentinel stored for lookups that failed, so they are not retried on every message
+_MISSING = object()
+
+class SlackMetadataCache:
+    """Per-app cache of Slack users and the bot's own identity"""
+
+    def __init__(self, client, ttl: int = 3600, negative_ttl: int = 300, max_entries: int = 20000):
+        """Initialize the cache
+
+        Args:
+            client: Slack WebClient of the app
+            ttl: Seconds a successful lookup is cached
+            negative_ttl: Seconds a failed lookup is cached
+            max_entries: Maximum number of users kept, least recently used are evicted first
+        """
+        self.client = client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._users = OrderedDict()
+        self._bot_user_id = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "negative_hits": 0, "invalidations": 0, "prefetched": 0}
+
+    def _get(self, entries: OrderedDict, key: str):
+        """Look up a cached entry, returning None when absent or expired"""
+        with self._lock:
+            entry = entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del entries[key]
+                self._counters["misses"] += 1
+                return None
+            entries.move_to_end(key)
+            if value is _MISSING:
+                self._counters["negative_hits"] += 1
+            else:
+                self._counters["hits"] += 1
+            return value
+
+    def _put(self, entries: OrderedDict, key: str, value, ttl: int):
+        """Store an entry and evict the least recently used ones over the size limit"""
+        with self._lock:
+            entries[key] = (value, time.monotonic() + ttl)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    @staticmethod
+    def _format_user(user: Dict) -> Dict:
+        """Reduce a Slack user object to the fields the bot uses"""
+        return {
+            "id": user.get("id"),
+            "name": user.get("real_name") or user.get("name", "Unknown User"),
+            "display_name": user.get("profile", {}).get("display_name", "")
+        }
+
+    def get_user(self, user_id: str) -> Dict:
+        """Get user information, calling users.info only on a cache miss
+
+        Args:
+            user_id: Slack user ID
+
+        Returns:
+            Dictionary with the user's id, name and display name
+        """
+        cached = self._get(self._users, user_id)
+        if cached is not None:
+            if cached is _MISSING:
+                return {"id": user_id, "name": "Unknown User", "display_name": ""}
+            return cached
+
+        try:
+            result = self.client.users_info(user=user_id)
+            if result["ok"]:
+                user = self._format_user(result["user"])
+                user["id"] = user_id
+                self._put(self._users, user_id, user, self.ttl)
+                return user
+        except Exception as e:
+            logger.error(f"Error getting user info for {user_id}: {str(e)}")
+
+        self._put(self._users, user_id, _MISSING, self.negative_ttl)
+        return {"id": user_id, "name": "Unknown User", "display_name": ""}
+
+    def get_bot_user_id(self) -> Optional[str]:
+        """Get the bot's own user ID, calling auth.test only until it succeeds once
+
+        Returns:
+            The bot user ID, or None if it could not be resolved
+        """
+        if self._bot_user_id:
+            return self._bot_user_id
+        try:
+            self._bot_user_id = self.client.auth_test()["user_id"]
+        except Exception as e:
+            logger.error(f"Error resolving bot user ID: {str(e)}")
+        return self._bot_user_id
+
+    def prefetch_users(self, page_size: int = 200) -> int:
+        """Load every workspace member into the cache with paginated users.list calls
+
+        Args:
+            page_size: Number of users requested per page
+
+        Returns:
+            Number of users cached
+        """
+        count = 0
+        cursor = None
+        try:
+            while True:
+                result = self.client.users_list(limit=page_size, cursor=cursor)
+                if not result["ok"]:
+                    break
+                for member in result.get("members", []):
+                    if member.get("id") and not member.get("deleted"):
+                        self._put(self._users, member["id"], self._format_user(member), self.ttl)
+                        count += 1
+                cursor = result.get("response_metadata", {}).get("next_cursor")
+                if not cursor:
+                    break
+        except Exception as e:
+            logger.error(f"Error prefetching users: {str(e)}")
+
+        with self._lock:
+            self._counters["prefetched"] += count
+        logger.info(f"Prefetched {count} users")
+        return count
+
+    def update_user(self, user: Dict):
+        """Replace a cached user from a user_change event payload
+
+        Args:
+            user: Slack user object from the event
+        """
+        user_id = user.get("id")
+        if not user_id:
+            return
+        with self._lock:
+            self._counters["invalidations"] += 1
+        if user.get("deleted"):
+            self.invalidate_user(user_id)
+        else:
+            self._put(self._users, user_id, self._format_user(user), self.ttl)
+
+    def invalidate_user(self, user_id: str):
+        """Remove a user from the cache
+
+        Args:
+            user_id: Slack user ID
+        """
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters
+
+        Returns:
+            Dictionary of cache metrics
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["users"] = len(self._users)
+            stats["bot_user_id_cached"] = self._bot_user_id is not None
+            return stats
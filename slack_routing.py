@@ -0,0 +1,132 @@
+import hmac
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Requests signed longer ago than this are rejected as possible replays, as Bolt does
+SIGNATURE_MAX_AGE = 60 * 5
+
+def parse_slack_body(raw_body: str, content_type: Optional[str] = None) -> Dict:
+    """Parse a Slack request body once, whether it is JSON or a form-encoded payload
+
+    Args:
+        raw_body: Raw request body
+        content_type: Content-Type header of the request
+
+    Returns:
+        Parsed payload, or an empty dictionary if the body could not be parsed
+    """
+    try:
+        if content_type and content_type.startswith("application/x-www-form-urlencoded"):
+            form = parse_qs(raw_body)
+            if "payload" in form:
+                return json.loads(form["payload"][0])
+            return {key: values[0] for key, values in form.items()}
+        return json.loads(raw_body) if raw_body else {}
+    except Exception as e:
+        logger.debug(f"Could not parse Slack request body: {str(e)}")
+        return {}
+
+def compute_signature(signing_secret: str, timestamp: str, raw_body: str) -> str:
+    """Compute the Slack v0 request signature
+
+    Args:
+        signing_secret: Signing secret of the Slack app
+        timestamp: Value of the X-Slack-Request-Timestamp header
+        raw_body: Raw request body
+
+    Returns:
+        Signature in the same format as the X-Slack-Signature header
+    """
+    base = f"v0:{timestamp}:{raw_body}".encode("utf-8")
+    return "v0=" + hmac.new(signing_secret.encode("utf-8"), base, hashlib.sha256).hexdigest()
+
+class SlackRoutingTable:
+    """Index from Slack team and app identifiers to the configured bot that serves them"""
+
+    def __init__(self):
+        self.by_team_id = {}
+        self.by_api_app_id = {}
+        self.signing_secrets = {}
+
+    def add(self, app_id: str, config: Dict):
+        """Register a configured bot
+
+        Args:
+            app_id: Internal ID of the bot
+            config: Bot configuration with optional team_id, api_app_id and signing_secret
+        """
+        if config.get("team_id"):
+            self.by_team_id[config["team_id"]] = app_id
+        if config.get("api_app_id"):
+            self.by_api_app_id[config["api_app_id"]] = app_id
+        if config.get("signing_secret"):
+            self.signing_secrets[app_id] = config["signing_secret"]
+
+    def resolve(self, payload: Dict) -> Optional[str]:
+        """Find the bot for a payload by its api_app_id or team_id
+
+        Args:
+            payload: Parsed Slack request body
+
+        Returns:
+            Internal ID of the bot, or None if the identifiers are unknown
+        """
+        api_app_id = payload.get("api_app_id")
+        if api_app_id and api_app_id in self.by_api_app_id:
+            return self.by_api_app_id[api_app_id]
+
+        # Team ID could be at the top level, in the event, or in the team object
+        team_id = payload.get("team_id") or (payload.get("event") or {}).get("team")
+        if not team_id and isinstance(payload.get("team"), dict):
+            team_id = payload["team"].get("id")
+        return self.by_team_id.get(team_id) if team_id else None
+
+    def match_signature(self, headers, raw_body: str) -> Optional[str]:
+        """Find the bot whose signing secret produced the request signature
+
+        Args:
+            headers: Request headers
+            raw_body: Raw request body
+
+        Returns:
+            Internal ID of the matching bot, or None if no signing secret matches
+        """
+        signature = headers.get("X-Slack-Signature")
+        timestamp = headers.get("X-Slack-Request-Timestamp")
+        if not signature or not timestamp:
+            return None
+
+        for app_id, signing_secret in self.signing_secrets.items():
+            if hmac.compare_digest(compute_signature(signing_secret, timestamp, raw_body), signature):
+                return app_id
+        return None
+
+    def verify_signature(self, app_id: str, headers, raw_body: str) -> bool:
+        """Check that a request was signed with the signing secret of a bot and is recent
+
+        Args:
+            app_id: Internal ID of the bot
+            headers: Request headers
+            raw_body: Raw request body
+
+        Returns:
+            True if the signature is valid
+        """
+        signing_secret = self.signing_secrets.get(app_id)
+        signature = headers.get("X-Slack-Signature")
+        timestamp = headers.get("X-Slack-Request-Timestamp")
+        if not signing_secret or not signature or not timestamp:
+            return False
+        try:
+            if abs(time.time() - int(timestamp)) > SIGNATURE_MAX_AGE:
+                return False
+        except ValueError:
+            return False
+        return hmac.compare_digest(compute_signature(signing_secret, timestamp, raw_body), signature)
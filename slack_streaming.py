@@ -0,0 +1,226 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Appended to partial text while the reply is still being generated
+CURSOR = " ▌"
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Get the Retry-After seconds of a Slack rate limit error, None for other errors"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    status = getattr(response, "status_code", None)
+    data = getattr(response, "data", None) or {}
+    if status != 429 and data.get("error") != "ratelimited":
+        return None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", headers.get("retry-after", 1)))
+    except (TypeError, ValueError):
+        return 1.0
+
+def _percentile(values, fraction: float) -> float:
+    """Get a percentile of sorted values, 0.0 when there are none"""
+    if not values:
+        return 0.0
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 3)
+
+class SlackStreamer:
+    """Posts replies progressively, editing a placeholder message as the text grows
+
+    Edits of one channel are spaced at least min_interval seconds apart across all
+    replies in that channel, and a rate limited channel waits for the Retry-After
+    period. Intermediate edits are skipped when a channel is not due, only the final
+    edit is always sent.
+    """
+
+    def __init__(self, min_interval: float = 1.0, placeholder: str = "_Thinking..._", max_final_wait: float = 10.0):
+        """Initialize the streamer
+
+        Args:
+            min_interval: Minimum seconds between two edits in one channel
+            placeholder: Text of the message posted before the first token arrives
+            max_final_wait: Maximum seconds the final edit waits for a rate limited channel
+        """
+        self.min_interval = min_interval
+        self.placeholder = placeholder
+        self.max_final_wait = max_final_wait
+        self._next_edit = {}
+        self._lock = threading.Lock()
+        self._counters = {"streams": 0, "updates": 0, "skipped_updates": 0, "rate_limited": 0, "failed": 0}
+        self._placeholder_latencies = deque(maxlen=1000)
+        self._first_token_latencies = deque(maxlen=1000)
+
+    def start(self, client, channel: str, thread_ts: Optional[str] = None, started_at: Optional[float] = None):
+        """Post the placeholder of a reply
+
+        Args:
+            client: Slack WebClient of the app
+            channel: Channel ID
+            thread_ts: Optional thread to reply in
+            started_at: Optional time.monotonic() at which handling started, defaults to now
+
+        Returns:
+            StreamingReply, or None if the placeholder could not be posted
+        """
+        started_at = started_at or time.monotonic()
+        try:
+            kwargs = {"channel": channel, "text": self.placeholder}
+            if thread_ts:
+                kwargs["thread_ts"] = thread_ts
+            response = client.chat_postMessage(**kwargs)
+        except Exception as e:
+            logger.error(f"Error posting placeholder in {channel}: {str(e)}")
+            with self._lock:
+                self._counters["failed"] += 1
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._counters["streams"] += 1
+            self._placeholder_latencies.append(now - started_at)
+            # Drop channels whose slots are past so the table does not grow without bound
+            if len(self._next_edit) > 10000:
+                for key in [key for key, due in self._next_edit.items() if due < now]:
+                    del self._next_edit[key]
+            # Leave a gap after the post before the first edit
+            self._next_edit[channel] = max(self._next_edit.get(channel, 0.0), now + self.min_interval)
+        return StreamingReply(self, client, response["channel"], response["ts"], started_at)
+
+    def _acquire(self, channel: str, wait: float = 0.0) -> bool:
+        """Reserve the next edit slot of a channel, waiting at most wait seconds for it
+
+        When the slot is further away than wait, this sleeps the whole wait and then
+        gives up, so callers never spin on a rate limited channel.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                due = self._next_edit.get(channel, 0.0)
+                if due <= now:
+                    self._next_edit[channel] = now + self.min_interval
+                    return True
+            if due - now > wait:
+                if wait > 0:
+                    time.sleep(wait)
+                return False
+            time.sleep(due - now)
+            wait -= due - now
+
+    def _rate_limited(self, channel: str, seconds: float):
+        """Hold back edits of a channel for the Retry-After period"""
+        with self._lock:
+            self._counters["rate_limited"] += 1
+            self._next_edit[channel] = max(self._next_edit.get(channel, 0.0), time.monotonic() + seconds)
+
+    def _record(self, counter: str, first_token_latency: Optional[float] = None):
+        """Count an edit outcome and the time to the first visible token"""
+        with self._lock:
+            self._counters[counter] += 1
+            if first_token_latency is not None:
+                self._first_token_latencies.append(first_token_latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get streaming counters and latencies
+
+        Returns:
+            Dictionary of streaming metrics, latencies are in seconds
+        """
+        with self._lock:
+            placeholder = sorted(self._placeholder_latencies)
+            first_token = sorted(self._first_token_latencies)
+            stats = dict(self._counters)
+            stats.update({
+                "min_interval_s": self.min_interval,
+                "time_to_placeholder_s": {"p50": _percentile(placeholder, 0.5), "p95": _percentile(placeholder, 0.95)},
+                "time_to_first_token_s": {"p50": _percentile(first_token, 0.5), "p95": _percentile(first_token, 0.95)},
+            })
+            return stats
+
+class StreamingReply:
+    """A reply being streamed into one Slack message"""
+
+    def __init__(self, streamer: SlackStreamer, client, channel: str, ts: str, started_at: float):
+        self.streamer = streamer
+        self.client = client
+        self.channel = channel
+        self.ts = ts
+        self.started_at = started_at
+        self.text = ""
+        self._visible = False
+        self._throttled = False
+
+    def _edit(self, text: str) -> bool:
+        """Replace the message text, returning whether Slack accepted the edit"""
+        self._throttled = False
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, text=text)
+        except Exception as e:
+            seconds = retry_after(e)
+            if seconds is not None:
+                self._throttled = True
+                self.streamer._rate_limited(self.channel, seconds)
+            else:
+                logger.error(f"Error updating streamed reply in {self.channel}: {str(e)}")
+                self.streamer._record("failed")
+            return False
+        first_token_latency = None
+        if not self._visible and text.strip():
+            self._visible = True
+            first_token_latency = time.monotonic() - self.started_at
+        self.streamer._record("updates", first_token_latency)
+        return True
+
+    def update(self, text: str):
+        """Show the partial text if the channel is due for an edit, otherwise skip this edit
+
+        Args:
+            text: Full text generated so far
+        """
+        self.text = text
+        if not text.strip():
+            return
+        if not self.streamer._acquire(self.channel):
+            self.streamer._record("skipped_updates")
+            return
+        self._edit(f"{text}{CURSOR}")
+
+    def finish(self, text: str) -> bool:
+        """Replace the placeholder with the final text
+
+        If the final edit cannot be made within max_final_wait, the placeholder or partial
+        text is deleted so the caller can post the reply as a new message without leaving
+        a stale copy behind.
+
+        Args:
+            text: Complete reply
+
+        Returns:
+            Whether the final text was posted
+        """
+        self.text = text
+        deadline = time.monotonic() + self.streamer.max_final_wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if self.streamer._acquire(self.channel, wait=max(0.0, remaining)):
+                if self._edit(text):
+                    return True
+                if not self._throttled:
+                    break
+            if time.monotonic() >= deadline:
+                logger.error(f"Gave up posting the final streamed reply in {self.channel}")
+                break
+        self._discard()
+        return False
+
+    def _discard(self):
+        """Delete the placeholder message after the final edit failed"""
+        try:
+            self.client.chat_delete(channel=self.channel, ts=self.ts)
+        except Exception as e:
+            logger.error(f"Error deleting streamed reply in {self.channel}: {str(e)}")
@@ -0,0 +1,279 @@
+import os
+import json
+import sqlite3
+import logging
+import datetime
+import threading
+from typing import Dict, Iterator, List, Optional
+from storage import JsonMemoryStorage, MemoryStorage, SessionStorage
+from session_store import JsonlSessionStore, parse_history_id, read_session_file
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation TEXT NOT NULL,
+    workspace TEXT NOT NULL,
+    channel_id TEXT,
+    user_id TEXT,
+    role TEXT,
+    ts TEXT NOT NULL DEFAULT '',
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_ts ON messages (conversation, ts);
+CREATE INDEX IF NOT EXISTS idx_messages_workspace_user ON messages (workspace, user_id);
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workspace TEXT NOT NULL,
+    item TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (workspace, item)
+);
+CREATE TABLE IF NOT EXISTS summary_state (
+    conversation TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+"""
+
+# Statements are kept as constants so each connection's statement cache reuses the compiled form
+INSERT_MESSAGE = "INSERT INTO messages (conversation, workspace, channel_id, user_id, role, ts, entry) VALUES (?, ?, ?, ?, ?, ?, ?)"
+SELECT_TAIL = "SELECT entry FROM messages WHERE conversation = ? ORDER BY ts DESC, id DESC LIMIT ?"
+SELECT_CONVERSATION = "SELECT entry FROM messages WHERE conversation = ? ORDER BY ts, id"
+COUNT_CONVERSATION = "SELECT COUNT(*) FROM messages WHERE conversation = ?"
+TRIM_CONVERSATION = """DELETE FROM messages WHERE conversation = ? AND id NOT IN (
+    SELECT id FROM messages WHERE conversation = ? ORDER BY ts DESC, id DESC LIMIT ?)"""
+DELETE_CONVERSATION = "DELETE FROM messages WHERE conversation = ?"
+SELECT_WORKSPACES = "SELECT DISTINCT workspace FROM messages ORDER BY workspace"
+SELECT_CONVERSATIONS = "SELECT DISTINCT conversation FROM messages WHERE workspace = ? ORDER BY conversation"
+INSERT_MEMORY = "INSERT OR IGNORE INTO memories (workspace, item, created_at) VALUES (?, ?, ?)"
+SELECT_MEMORIES = "SELECT item FROM memories WHERE workspace = ? ORDER BY id"
+SELECT_SUMMARY_STATE = "SELECT state FROM summary_state WHERE conversation = ?"
+UPSERT_SUMMARY_STATE = "INSERT OR REPLACE INTO summary_state (conversation, state) VALUES (?, ?)"
+DELETE_SUMMARY_STATE = "DELETE FROM summary_state WHERE conversation = ?"
+UPDATE_MEMORY = "UPDATE OR IGNORE memories SET item = ?, created_at = ? WHERE workspace = ? AND item = ?"
+
+class SQLiteStorage(SessionStorage, MemoryStorage):
+    """Session and memory storage in a single SQLite database in WAL mode"""
+
+    def __init__(self, database_path: str, max_entries: int = 100, trim_slack: Optional[int] = None):
+        """Initialize the database
+
+        Args:
+            database_path: Path of the SQLite database file
+            max_entries: Number of entries kept per conversation
+            trim_slack: Number of entries a conversation may grow past max_entries before it is trimmed
+        """
+        self.database_path = database_path
+        self.max_entries = max_entries
+        self.trim_slack = trim_slack if trim_slack is not None else max(10, max_entries // 2)
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        connection.commit()
+
+    def _connection(self):
+        """Get this thread's connection, opening it on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=30, cached_statements=256)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _message_row(history_id: str, entry: Dict):
+        """Build the parameters of INSERT_MESSAGE for one entry"""
+        workspace_id, channel_id, _ = parse_history_id(history_id)
+        return (
+            history_id,
+            workspace_id,
+            entry.get("channel_id") or channel_id,
+            entry.get("user_id"),
+            entry.get("role"),
+            entry.get("timestamp", ""),
+            json.dumps(entry, ensure_ascii=False)
+        )
+
+    def read_tail(self, history_id: str, limit: int) -> List[Dict]:
+        if limit <= 0:
+            return []
+        try:
+            rows = self._connection().execute(SELECT_TAIL, (history_id, limit)).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading chat history for {history_id}: {str(e)}")
+            return []
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def read_all(self, history_id: str) -> List[Dict]:
+        rows = self._connection().execute(SELECT_CONVERSATION, (history_id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self, history_id: str) -> int:
+        return self._connection().execute(COUNT_CONVERSATION, (history_id,)).fetchone()[0]
+
+    def append(self, history_id: str, entries: List[Dict]):
+        if not entries:
+            return
+        connection = self._connection()
+        try:
+            with connection:
+                connection.executemany(INSERT_MESSAGE, [self._message_row(history_id, entry) for entry in entries])
+                count = connection.execute(COUNT_CONVERSATION, (history_id,)).fetchone()[0]
+                if count > self.max_entries + self.trim_slack:
+                    connection.execute(TRIM_CONVERSATION, (history_id, history_id, self.max_entries))
+        except Exception as e:
+            logger.error(f"Error saving chat history for {history_id}: {str(e)}")
+
+    def clear(self, history_id: str):
+        connection = self._connection()
+        with connection:
+            connection.execute(DELETE_CONVERSATION, (history_id,))
+            connection.execute(DELETE_SUMMARY_STATE, (history_id,))
+
+    def list_workspaces(self) -> List[str]:
+        return [row[0] for row in self._connection().execute(SELECT_WORKSPACES).fetchall()]
+
+    def list_conversations(self, workspace_id: str) -> List[str]:
+        return [row[0] for row in self._connection().execute(SELECT_CONVERSATIONS, (workspace_id,)).fetchall()]
+
+    def iter_entries(self, history_id: str) -> Iterator[Dict]:
+        for row in self._connection().execute(SELECT_CONVERSATION, (history_id,)):
+            yield json.loads(row[0])
+
+    def load_summary_state(self, history_id: str) -> Optional[Dict]:
+        row = self._connection().execute(SELECT_SUMMARY_STATE, (history_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_summary_state(self, history_id: str, state: Dict):
+        connection = self._connection()
+        with connection:
+            connection.execute(UPSERT_SUMMARY_STATE, (history_id, json.dumps(state, ensure_ascii=False)))
+
+    def query_messages(self, workspace_id: Optional[str] = None, channel_id: Optional[str] = None,
+                       user_id: Optional[str] = None, since: Optional[str] = None,
+                       until: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Query stored messages by workspace, channel, user and time range
+
+        Args:
+            workspace_id: Optional workspace filter
+            channel_id: Optional channel filter
+            user_id: Optional user filter
+            since: Optional inclusive lower bound on the ISO timestamp
+            until: Optional exclusive upper bound on the ISO timestamp
+            limit: Maximum number of messages returned
+
+        Returns:
+            List of the most recent matching entries, oldest first
+        """
+        conditions = []
+        params = []
+        for column, value in (("workspace", workspace_id), ("channel_id", channel_id), ("user_id", user_id)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            conditions.append("ts >= ?")
+            params.append(since)
+        if until:
+            conditions.append("ts < ?")
+            params.append(until)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+        rows = self._connection().execute(
+            f"SELECT entry FROM messages {where} ORDER BY ts DESC, id DESC LIMIT ?", params
+        ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def load_memories(self, workspace_id: str) -> List[str]:
+        try:
+            rows = self._connection().execute(SELECT_MEMORIES, (workspace_id,)).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading memory for {workspace_id}: {str(e)}")
+            return []
+        return [row[0] for row in rows]
+
+    def add_memories(self, workspace_id: str, items: List[str]) -> List[str]:
+        connection = self._connection()
+        created_at = datetime.datetime.now().isoformat()
+        added = []
+        try:
+            with connection:
+                for item in items:
+                    if connection.execute(INSERT_MEMORY, (workspace_id, item, created_at)).rowcount:
+                        added.append(item)
+        except Exception as e:
+            logger.error(f"Error saving memory for {workspace_id}: {str(e)}")
+            return []
+        return added
+
+    def replace_memory(self, workspace_id: str, old_item: str, new_item: str) -> bool:
+        connection = self._connection()
+        created_at = datetime.datetime.now().isoformat()
+        try:
+            with connection:
+                return connection.execute(UPDATE_MEMORY, (new_item, created_at, workspace_id, old_item)).rowcount > 0
+        except Exception as e:
+            logger.error(f"Error replacing memory for {workspace_id}: {str(e)}")
+            return False
+
+    def import_json(self, sessions_dir: str, memory_dir: str) -> Dict[str, int]:
+        """Bulk import the JSON session, summary state and memory files into the database
+
+        Args:
+            sessions_dir: Directory of the JSON session files
+            memory_dir: Directory of the JSON memory files
+
+        Returns:
+            Dictionary with the number of imported conversations, messages, summary states and memories
+        """
+        imported = {"conversations": 0, "messages": 0, "summary_states": 0, "memories": 0}
+
+        json_store = JsonlSessionStore(sessions_dir, max_entries=self.max_entries)
+        json_store.migrate_legacy_sessions()
+        connection = self._connection()
+        for path in json_store.iter_session_files():
+            history_id = os.path.basename(path)[:-len(".jsonl")]
+            entries = read_session_file(path)
+            # Keep the summarization watermark and rolling summary so nothing is summarized twice
+            state = json_store.load_summary_state(history_id)
+            with connection:
+                connection.execute(DELETE_CONVERSATION, (history_id,))
+                connection.executemany(INSERT_MESSAGE, [self._message_row(history_id, entry) for entry in entries])
+                if state is not None:
+                    connection.execute(UPSERT_SUMMARY_STATE, (history_id, json.dumps(state, ensure_ascii=False)))
+            imported["conversations"] += 1
+            imported["messages"] += len(entries)
+            if state is not None:
+                imported["summary_states"] += 1
+
+        if os.path.isdir(memory_dir):
+            json_memory = JsonMemoryStorage(memory_dir)
+            workspace_ids = sorted({
+                file_name.rsplit("_memory.", 1)[0]
+                for file_name in os.listdir(memory_dir)
+                if file_name.endswith(("_memory.json", "_memory.jsonl"))
+            })
+            for workspace_id in workspace_ids:
+                items = json_memory.load_memories(workspace_id)
+                imported["memories"] += len(self.add_memories(workspace_id, items))
+
+        logger.info(
+            f"Imported {imported['conversations']} conversations, {imported['messages']} messages, "
+            f"{imported['summary_states']} summary states and {imported['memories']} memories"
+        )
+        return imported
+
+if __name__ == "__main__":
+    # Import the JSON files next to this script into the SQLite database
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    database_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, "data", "slack_bot.db")
+    storage = SQLiteStorage(database_path)
+    print(storage.import_json(os.path.join(base_dir, "sessions"), os.path.join(base_dir, "memory")))
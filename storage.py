@@ -0,0 +1,241 @@
+import os
+import json
+import logging
+import datetime
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class SessionStorage:
+    """Interface for conversation history storage backends"""
+
+    # Number of entries kept per conversation
+    max_entries = 100
+
+    def read_tail(self, history_id: str, limit: int) -> List[Dict]:
+        """Read the most recent entries of a conversation, oldest first"""
+        raise NotImplementedError
+
+    def read_all(self, history_id: str) -> List[Dict]:
+        """Read every stored entry of a conversation, oldest first"""
+        raise NotImplementedError
+
+    def count(self, history_id: str) -> int:
+        """Get the number of stored entries of a conversation"""
+        raise NotImplementedError
+
+    def append(self, history_id: str, entries: List[Dict]):
+        """Append entries to a conversation, oldest first"""
+        raise NotImplementedError
+
+    def clear(self, history_id: str):
+        """Delete a conversation"""
+        raise NotImplementedError
+
+    def list_workspaces(self) -> List[str]:
+        """List the workspaces that have stored conversations"""
+        raise NotImplementedError
+
+    def list_conversations(self, workspace_id: str) -> List[str]:
+        """List the history IDs of the stored conversations of a workspace"""
+        raise NotImplementedError
+
+    def iter_entries(self, history_id: str) -> Iterator[Dict]:
+        """Stream every stored entry of a conversation, oldest first, without loading it all"""
+        raise NotImplementedError
+
+    def load_summary_state(self, history_id: str) -> Optional[Dict]:
+        """Load a conversation's summarization watermark and rolling summary, None if never summarized"""
+        raise NotImplementedError
+
+    def save_summary_state(self, history_id: str, state: Dict):
+        """Store a conversation's summarization watermark and rolling summary"""
+        raise NotImplementedError
+
+class MemoryStorage:
+    """Interface for long-term memory storage backends"""
+
+    def load_memories(self, workspace_id: str) -> List[str]:
+        """Load every memory item of a workspace in insertion order"""
+        raise NotImplementedError
+
+    def add_memories(self, workspace_id: str, items: List[str]) -> List[str]:
+        """Store memory items that are not stored yet
+
+        Returns:
+            The items that were actually added
+        """
+        raise NotImplementedError
+
+    def replace_memory(self, workspace_id: str, old_item: str, new_item: str) -> bool:
+        """Replace a stored memory item in place, keeping its position
+
+        Returns:
+            True if the old item was replaced, False if it is missing or the new item already exists
+        """
+        raise NotImplementedError
+
+class JsonMemoryStorage(MemoryStorage):
+    """Memory storage in append-only memory/{workspace_id}_memory.jsonl logs
+
+    Each workspace log is read once and kept in memory with a hash index for
+    deduplication, new items are appended to the log in a single write. A replaced
+    item is recorded as a line with a "replaces" field, applied in place on load.
+    """
+
+    def __init__(self, memory_dir: str):
+        """Initialize the memory storage
+
+        Args:
+            memory_dir: Directory to store memory files
+        """
+        self.memory_dir = memory_dir
+        os.makedirs(memory_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._items = {}
+        self._index = {}
+
+    def memory_file(self, workspace_id: str) -> str:
+        """Get the memory log path of a workspace"""
+        return os.path.join(self.memory_dir, f"{workspace_id}_memory.jsonl")
+
+    def legacy_memory_file(self, workspace_id: str) -> str:
+        """Get the path of the workspace's legacy single-document memory file"""
+        return os.path.join(self.memory_dir, f"{workspace_id}_memory.json")
+
+    def _ensure_loaded(self, workspace_id: str):
+        """Read the workspace log into memory once, migrating the legacy file first, the caller holds the lock"""
+        if workspace_id in self._items:
+            return
+
+        legacy_file = self.legacy_memory_file(workspace_id)
+        if os.path.exists(legacy_file):
+            self._migrate_legacy_file(workspace_id, legacy_file)
+
+        items = []
+        index = {}
+        memory_file = self.memory_file(workspace_id)
+        if os.path.exists(memory_file):
+            try:
+                with open(memory_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                            item = record["item"]
+                        except (json.JSONDecodeError, KeyError, TypeError):
+                            logger.warning(f"Skipping malformed memory line in {memory_file}")
+                            continue
+                        if item in index:
+                            continue
+                        replaced = record.get("replaces")
+                        if replaced in index:
+                            position = index.pop(replaced)
+                            items[position] = item
+                            index[item] = position
+                        else:
+                            index[item] = len(items)
+                            items.append(item)
+            except Exception as e:
+                logger.error(f"Error loading memory from {memory_file}: {str(e)}")
+
+        self._items[workspace_id] = items
+        self._index[workspace_id] = index
+
+    def _migrate_legacy_file(self, workspace_id: str, legacy_file: str):
+        """Append the items of a legacy memory file to the log and keep the original as .bak"""
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                items = json.load(f).get("memory", [])
+            self._write_lines(workspace_id, items)
+            os.replace(legacy_file, legacy_file + ".bak")
+            logger.info(f"Migrated {len(items)} memory items from {legacy_file}")
+        except Exception as e:
+            logger.error(f"Error migrating memory file {legacy_file}: {str(e)}")
+
+    def _write_lines(self, workspace_id: str, items: List[str], replaces: str = None):
+        """Append items to the workspace log in one write"""
+        created_at = datetime.datetime.now().isoformat()
+        extra = {"replaces": replaces} if replaces is not None else {}
+        data = "".join(
+            json.dumps({"item": item, "created_at": created_at, **extra}, ensure_ascii=False) + "\n"
+            for item in items
+        )
+        with open(self.memory_file(workspace_id), 'a', encoding='utf-8') as f:
+            f.write(data)
+
+    def load_memories(self, workspace_id: str) -> List[str]:
+        with self._lock:
+            self._ensure_loaded(workspace_id)
+            return list(self._items[workspace_id])
+
+    def add_memories(self, workspace_id: str, items: List[str]) -> List[str]:
+        with self._lock:
+            self._ensure_loaded(workspace_id)
+            index = self._index[workspace_id]
+            workspace_items = self._items[workspace_id]
+            added = []
+            for item in items:
+                if item not in index:
+                    index[item] = len(workspace_items) + len(added)
+                    added.append(item)
+            if not added:
+                return []
+            try:
+                self._write_lines(workspace_id, added)
+            except Exception as e:
+                logger.error(f"Error saving memory to {self.memory_file(workspace_id)}: {str(e)}")
+                for item in added:
+                    del index[item]
+                return []
+            workspace_items.extend(added)
+            return added
+
+    def replace_memory(self, workspace_id: str, old_item: str, new_item: str) -> bool:
+        with self._lock:
+            self._ensure_loaded(workspace_id)
+            index = self._index[workspace_id]
+            if old_item not in index or new_item in index:
+                return False
+            try:
+                self._write_lines(workspace_id, [new_item], replaces=old_item)
+            except Exception as e:
+                logger.error(f"Error saving memory to {self.memory_file(workspace_id)}: {str(e)}")
+                return False
+            position = index.pop(old_item)
+            self._items[workspace_id][position] = new_item
+            index[new_item] = position
+            return True
+
+def create_storage(backend: str, sessions_dir: str, memory_dir: str, database_path: str,
+                   max_entries: int = 100) -> Tuple[SessionStorage, MemoryStorage]:
+    """Create the session and memory storage for the configured backend
+
+    Args:
+        backend: "json" for files under sessions/ and memory/, or "sqlite"
+        sessions_dir: Directory of the JSON session files
+        memory_dir: Directory of the JSON memory files
+        database_path: Path of the SQLite database file
+        max_entries: Number of entries kept per conversation
+
+    Returns:
+        Tuple of session storage and memory storage
+    """
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+
+        sqlite_storage = SQLiteStorage(database_path, max_entries=max_entries)
+        return sqlite_storage, sqlite_storage
+
+    if backend != "json":
+        logger.warning(f"Unknown storage backend '{backend}', using json")
+
+    from session_store import JsonlSessionStore
+
+    session_storage = JsonlSessionStore(sessions_dir, max_entries=max_entries)
+    session_storage.migrate_legacy_sessions()
+    return session_storage, JsonMemoryStorage(memory_dir)
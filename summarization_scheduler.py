@@ -0,0 +1,169 @@
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class SummarizationScheduler:
+    """Runs conversation summarization in the background, off the reply path
+
+    Requests for a conversation that is already waiting are coalesced into one run,
+    and a request that arrives while the conversation is being summarized schedules
+    a single follow-up run. Each request waits delay seconds so a burst of triggers
+    collapses into one summarization. Due conversations are handed over in batches of
+    up to max_batch so they can share extraction requests. At most max_workers batches
+    run at once, and a workspace is only in one batch at a time since they write to
+    the same memory.
+    """
+
+    def __init__(self, summarize_fn: Callable[[List[Tuple[str, str]]], Any], max_workers: int = 2,
+                 delay: float = 10.0, max_batch: int = 8, name: str = "summarizer"):
+        """Initialize the scheduler and start its workers
+
+        Args:
+            summarize_fn: Callable taking a list of (workspace ID, conversation history ID) pairs
+            max_workers: Maximum number of batches running at once
+            delay: Seconds a request waits for further requests before it runs
+            max_batch: Maximum number of conversations per batch
+            name: Prefix used for worker thread names
+        """
+        self.summarize_fn = summarize_fn
+        self.max_workers = max(1, max_workers)
+        self.delay = delay
+        self.max_batch = max(1, max_batch)
+        self._closed = False
+
+        # history_id -> (workspace_id, first requested_at)
+        self._pending = OrderedDict()
+        self._running = set()
+        self._running_workspaces = set()
+        self._rerun = {}
+        self._ready = threading.Condition()
+
+        self._counters = {"requested": 0, "coalesced": 0, "batches": 0, "completed": 0, "failed": 0}
+        self._recent_lags = deque(maxlen=1000)
+        self._lag_max = 0.0
+
+        self._threads = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def request(self, workspace_id: str, history_id: str):
+        """Ask for a conversation to be summarized, never blocks on the summarization itself
+
+        Args:
+            workspace_id: Workspace whose memory receives the summary
+            history_id: Conversation history ID
+        """
+        with self._ready:
+            if self._closed:
+                return
+            self._counters["requested"] += 1
+            if history_id in self._pending:
+                self._counters["coalesced"] += 1
+            elif history_id in self._running:
+                # Summarize again once the running pass is done, to cover the new messages
+                if history_id in self._rerun:
+                    self._counters["coalesced"] += 1
+                self._rerun[history_id] = (workspace_id, time.monotonic())
+            else:
+                self._pending[history_id] = (workspace_id, time.monotonic())
+                self._ready.notify()
+
+    def _next_batch(self, now: float):
+        """Pick the oldest due requests whose workspaces are idle, the caller holds the lock
+
+        Returns:
+            Tuple of the list of jobs, possibly empty, and the seconds until the next request becomes due
+        """
+        batch = []
+        wait = None
+        for history_id, (workspace_id, requested_at) in self._pending.items():
+            due_in = requested_at + self.delay - now
+            if due_in > 0:
+                wait = due_in if wait is None else min(wait, due_in)
+                continue
+            if workspace_id not in self._running_workspaces:
+                batch.append((history_id, workspace_id, requested_at))
+                if len(batch) >= self.max_batch:
+                    break
+        return batch, wait
+
+    def _worker(self):
+        """Worker loop that runs batches of due summarizations"""
+        while True:
+            with self._ready:
+                while True:
+                    if self._closed:
+                        return
+                    batch, wait = self._next_batch(time.monotonic())
+                    if batch:
+                        break
+                    self._ready.wait(wait)
+                now = time.monotonic()
+                for history_id, workspace_id, requested_at in batch:
+                    del self._pending[history_id]
+                    self._running.add(history_id)
+                    self._running_workspaces.add(workspace_id)
+                    lag = now - requested_at
+                    self._recent_lags.append(lag)
+                    self._lag_max = max(self._lag_max, lag)
+                self._counters["batches"] += 1
+
+            try:
+                self.summarize_fn([(workspace_id, history_id) for history_id, workspace_id, _ in batch])
+                failed = False
+            except Exception as e:
+                failed = True
+                logger.error(f"Error summarizing {len(batch)} conversations: {str(e)}")
+
+            with self._ready:
+                self._counters["failed" if failed else "completed"] += len(batch)
+                for history_id, workspace_id, _ in batch:
+                    self._running.discard(history_id)
+                    self._running_workspaces.discard(workspace_id)
+                    rerun = self._rerun.pop(history_id, None)
+                    if rerun is not None:
+                        self._pending[history_id] = rerun
+                self._ready.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get scheduler counters, queue depth and lag
+
+        Returns:
+            Dictionary of scheduler metrics, lags are in seconds
+        """
+        with self._ready:
+            now = time.monotonic()
+            recent = sorted(self._recent_lags)
+            oldest: Optional[float] = None
+            if self._pending:
+                oldest = now - min(requested_at for _, requested_at in self._pending.values())
+            stats = dict(self._counters)
+            stats.update({
+                "workers": self.max_workers,
+                "queue_depth": len(self._pending),
+                "running": len(self._running),
+                "rerun_waiting": len(self._rerun),
+                "oldest_pending_s": round(oldest, 2) if oldest is not None else 0.0,
+                "lag_s": {
+                    "p50": round(recent[len(recent) // 2], 2) if recent else 0.0,
+                    "p95": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 2) if recent else 0.0,
+                    "max": round(self._lag_max, 2),
+                },
+            })
+            return stats
+
+    def shutdown(self):
+        """Stop the workers, pending requests are dropped"""
+        with self._ready:
+            self._closed = True
+            dropped = len(self._pending)
+            self._ready.notify_all()
+        if dropped:
+            logger.info(f"Dropped {dropped} pending summarizations on shutdown")
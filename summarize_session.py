@@ -1,9 +1,15 @@
 import os
 import json
+import time
 import logging
+import argparse
 import datetime
-import google.generativeai as genai
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from flat_memory_manager import FlatMemoryManager
+from memory_extractor import BatchMemoryExtractor, format_turns, user_name_memories
+from storage import create_storage
+from embedding_service import create_embedding_service
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,105 +18,249 @@ logger = logging.getLogger(__name__)
 # Constants
 MEMORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory")
 SESSIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+DATABASE_PATH = os.environ.get("DATABASE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "slack_bot.db"))
+
+# Batch mode settings
+BATCH_WORKERS = int(os.environ.get("SUMMARY_BATCH_WORKERS", 4))
+# Embedding settings, the same as the bot's so memory vectors stay comparable
+EMBEDDING_PROVIDER = os.environ.get("EMBEDDING_PROVIDER", "local")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "models/text-embedding-004")
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "embeddings.db"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 100))
+EMBEDDING_BATCH_WAIT = float(os.environ.get("EMBEDDING_BATCH_WAIT", 0.05))
+
+CHECKPOINT_PATH = os.environ.get("SUMMARY_CHECKPOINT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "summarize_checkpoint.json"))
+
+# Number of new messages per conversation sent to the model in one pass
+MAX_TURNS_PER_CONVERSATION = 50
+
+# Number of conversations handed to one pool task, they share batched extraction requests
+CONVERSATIONS_PER_TASK = 20
+
+# Memory items and summary states are committed, and the checkpoint saved, after this many conversations
+COMMIT_EVERY = 20
+
+class Checkpoint:
+    """Set of conversations already summarized by an interrupted batch run"""
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.completed = set(json.load(f).get("completed", []))
+                logger.info(f"Resuming from checkpoint {path} with {len(self.completed)} conversations done")
+            except Exception as e:
+                logger.error(f"Error reading checkpoint {path}: {str(e)}")
+
+    def save(self):
+        """Atomically write the checkpoint file"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"completed": sorted(self.completed), "updated_at": datetime.datetime.now().isoformat()}, f)
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        """Delete the checkpoint file once a run has finished"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def read_new_turns(session_storage, history_id, watermark, limit=MAX_TURNS_PER_CONVERSATION):
+    """Stream a conversation and keep the most recent messages after the watermark
+
+    Returns:
+        Tuple of the new messages, oldest first, and the number of messages read
+    """
+    turns = deque(maxlen=limit)
+    read = 0
+    for entry in session_storage.iter_entries(history_id):
+        read += 1
+        if entry.get("timestamp", "") > watermark:
+            turns.append(entry)
+    return list(turns), read
+
+def summarize_conversations(extractor, session_storage, history_ids):
+    """Extract memories from the messages of several conversations added since their last summarization
+
+    Runs on a pool thread. The conversations share batched extraction requests, and nothing
+    is written here so the caller can commit results in batches.
+
+    Returns:
+        List of dictionaries with the history ID, the number of messages read, the extracted
+        memory items and the new summary state, or an "error" for conversations that failed
+    """
+    results = []
+    items = []
+    for history_id in history_ids:
+        state = session_storage.load_summary_state(history_id) or {}
+        turns, read = read_new_turns(session_storage, history_id, state.get("watermark", ""))
+        result = {"history_id": history_id, "messages": read, "memories": [], "state": None}
+        results.append(result)
+        if turns:
+            items.append({"id": history_id, "text": format_turns(turns), "summary": state.get("summary", "")})
+            result["turns"] = turns
+            result["previous_summary"] = state.get("summary", "")
+
+    extracted = extractor.extract(items) if items else {}
+    for result in results:
+        turns = result.pop("turns", None)
+        previous_summary = result.pop("previous_summary", "")
+        if not turns:
+            continue
+        update = extracted.get(result["history_id"])
+        if update is None:
+            result["error"] = "memory extraction failed"
+            continue
+        result["memories"] = user_name_memories(turns) + update["memories"]
+        result["state"] = {
+            "watermark": turns[-1].get("timestamp", ""),
+            "summary": update["summary"] or previous_summary,
+            "updated_at": datetime.datetime.now().isoformat()
+        }
+    return results
+
+def summarize_sessions(workspace_ids=None, workers=BATCH_WORKERS, checkpoint_path=CHECKPOINT_PATH,
+                       fresh=False, session_storage=None, memory_storage=None):
+    """Summarize conversations in parallel into their workspace memory, resuming an interrupted run
+
+    The memory items and vector files of the workspaces are written directly, so the bot
+    must not be running at the same time.
+
+    Args:
+        workspace_ids: Optional workspaces to summarize, all stored workspaces by default
+        workers: Number of conversation groups summarized at once
+        checkpoint_path: Path of the checkpoint file of completed conversations
+        fresh: Ignore an existing checkpoint
+        session_storage: Optional session storage, created from STORAGE_BACKEND if not given
+        memory_storage: Optional memory storage, created from STORAGE_BACKEND if not given
+
+    Returns:
+        Dictionary of run statistics
+    """
+    if session_storage is None or memory_storage is None:
+        session_storage, memory_storage = create_storage(STORAGE_BACKEND, SESSIONS_DIR, MEMORY_DIR, DATABASE_PATH)
+
+    checkpoint = Checkpoint(checkpoint_path)
+    if fresh:
+        checkpoint.completed.clear()
+
+    stats = {"conversations": 0, "skipped": 0, "failed": 0, "messages": 0, "memories_added": 0}
+    started_at = time.monotonic()
+
+    # Embed memory items with the bot's provider, another model would make the vector store start over
+    embedder = create_embedding_service(
+        EMBEDDING_PROVIDER,
+        cache_path=EMBEDDING_CACHE_PATH,
+        model=EMBEDDING_MODEL,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        max_wait=EMBEDDING_BATCH_WAIT
+    )
+
+    # Memory managers are only used from this thread, pool threads read sessions and call the model
+    extractor = BatchMemoryExtractor()
+    managers = {}
+    workspace_of = {}
+    for workspace_id in workspace_ids or session_storage.list_workspaces():
+        managers[workspace_id] = FlatMemoryManager(MEMORY_DIR, workspace_id, storage=memory_storage, embedder=embedder)
+        for history_id in session_storage.list_conversations(workspace_id):
+            if history_id in checkpoint.completed:
+                stats["skipped"] += 1
+            else:
+                workspace_of[history_id] = workspace_id
+    jobs = list(workspace_of)
+    logger.info(f"Summarizing {len(jobs)} conversations with {workers} workers ({stats['skipped']} already done)")
+
+    pending_memories = {}
+    pending_states = []
+
+    def commit():
+        for workspace_id, items in pending_memories.items():
+            stats["memories_added"] += len(managers[workspace_id].add_memories(items))
+        for history_id, state in pending_states:
+            if state is not None:
+                session_storage.save_summary_state(history_id, state)
+            checkpoint.completed.add(history_id)
+        pending_memories.clear()
+        pending_states.clear()
+        checkpoint.save()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        groups = (jobs[i:i + CONVERSATIONS_PER_TASK] for i in range(0, len(jobs), CONVERSATIONS_PER_TASK))
+        while True:
+            # Keep a bounded number of groups in flight so reads stay streaming
+            for group in groups:
+                future = pool.submit(summarize_conversations, extractor, session_storage, group)
+                in_flight[future] = group
+                if len(in_flight) >= workers * 2:
+                    break
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                group = in_flight.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    stats["failed"] += len(group)
+                    logger.error(f"Error summarizing {len(group)} conversations: {str(e)}")
+                    continue
+                for result in results:
+                    history_id = result["history_id"]
+                    if "error" in result:
+                        stats["failed"] += 1
+                        logger.error(f"Error summarizing {history_id}: {result['error']}")
+                        continue
+                    stats["conversations"] += 1
+                    stats["messages"] += result["messages"]
+                    pending_memories.setdefault(workspace_of[history_id], []).extend(result["memories"])
+                    pending_states.append((history_id, result["state"]))
+
+            if len(pending_states) >= COMMIT_EVERY:
+                commit()
+                processed = stats["conversations"] + stats["failed"]
+                logger.info(f"Progress: {processed}/{len(jobs)} conversations")
+        commit()
+
+    elapsed = time.monotonic() - started_at
+    stats["elapsed_s"] = round(elapsed, 2)
+    stats["conversations_per_s"] = round(stats["conversations"] / elapsed, 2) if elapsed else 0.0
+    stats["messages_per_s"] = round(stats["messages"] / elapsed, 2) if elapsed else 0.0
+
+    # Keep the checkpoint when conversations failed, so the next run only retries those
+    if not stats["failed"]:
+        checkpoint.remove()
+
+    logger.info(
+        f"Summarized {stats['conversations']} conversations ({stats['failed']} failed, {stats['skipped']} skipped), "
+        f"{stats['messages']} messages read, {stats['memories_added']} memories added in {stats['elapsed_s']}s "
+        f"({stats['conversations_per_s']} conversations/s, {stats['messages_per_s']} messages/s)"
+    )
+    return stats
+
+def summarize_session_file(workspace_id="workspace1", session_storage=None, memory_storage=None):
+    """Summarize the conversations of one workspace
 
-def load_session(file_path):
-    """Load a session file"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading session file {file_path}: {str(e)}")
-        return []
-
-def summarize_session_file(workspace_id="workspace1"):
-    """Summarize the session file and extract important information as natural language
-    
     Args:
         workspace_id: ID of the workspace to summarize
+        session_storage: Optional session storage, created from STORAGE_BACKEND if not given
+        memory_storage: Optional memory storage, created from STORAGE_BACKEND if not given
     """
-    # Initialize the flat memory manager
-    memory_manager = FlatMemoryManager(MEMORY_DIR, workspace_id)
-    
-    # Get the session file path
-    session_file = os.path.join(SESSIONS_DIR, f"{workspace_id}.json")
-    
-    if not os.path.exists(session_file):
-        logger.error(f"Session file not found: {session_file}")
-        return
-    
-    # Load the session data
-    session_data = load_session(session_file)
-    
-    if not session_data:
-        logger.error(f"No data found in session file: {session_file}")
-        return
-    
-    # Initialize Gemini model for summarization
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
-    except Exception as e:
-        logger.error(f"Error initializing Gemini model: {str(e)}")
-        return
-    
-    # Format conversation for analysis
-    conversation_text = "\n\n".join([
-        f"{msg.get('user_name', 'Bot') if msg.get('role') == 'user' else 'Bot'}: {msg.get('content', '')}" 
-        for msg in session_data[-50:]  # Use last 50 messages
-    ])
-    
-    # Extract user information from the session data
-    for message in session_data:
-        if message.get("role") == "user" and message.get("user_id") and message.get("user_name"):
-            user_id = message.get("user_id")
-            user_name = message.get("user_name")
-            memory_manager.add_memory(f"User {user_id}: {user_name}")
-    
-    # Extract important memories as natural language
-    extract_memories(model, conversation_text, memory_manager)
-    
-    logger.info(f"Session summarization completed for {workspace_id}")
-
-def extract_memories(model, conversation_text, memory_manager):
-    """Extract important memories from conversation as natural language"""
-    try:
-        # Create a prompt that asks for important information as natural language
-        memories_prompt = f"""Below is a conversation. Extract 10-15 important pieces of information that are worth remembering long-term.
-        These could be about people, organizations, preferences, facts, or any other significant information.
-        Write each memory as a complete, natural language sentence. Be concise but informative.
-        Do not categorize or label the memories - just write them as plain text.
-        
-        CONVERSATION:
-        {conversation_text}
-        
-        IMPORTANT MEMORIES:"""
-        
-        memories_response = model.generate_content(memories_prompt)
-        if memories_response and memories_response.text and memories_response.text.lower() != "none":
-            memories = [memory.strip() for memory in memories_response.text.split("\n") if memory.strip()]
-            for memory in memories:
-                memory_manager.add_memory(memory)
-    except Exception as e:
-        logger.error(f"Error extracting memories: {str(e)}")
+    return summarize_sessions([workspace_id], session_storage=session_storage, memory_storage=memory_storage)
 
 def summarize_all_sessions():
-    """Summarize all session files in the sessions directory"""
-    if not os.path.exists(SESSIONS_DIR):
-        logger.error(f"Sessions directory not found: {SESSIONS_DIR}")
-        return
-    
-    # Get all session files
-    session_files = [f for f in os.listdir(SESSIONS_DIR) if f.endswith('.json')]
-    
-    for session_file in session_files:
-        # Extract workspace ID from filename
-        workspace_id = session_file.split('.')[0]
-        summarize_session_file(workspace_id)
+    """Summarize all workspaces in the configured session storage"""
+    return summarize_sessions()
 
 if __name__ == "__main__":
-    # If a workspace ID is provided as an argument, summarize only that workspace
-    import sys
-    if len(sys.argv) > 1:
-        summarize_session_file(sys.argv[1])
-    else:
-        # Otherwise summarize all workspaces
-        summarize_all_sessions()
+    parser = argparse.ArgumentParser(description="Summarize stored conversations into long-term memory")
+    parser.add_argument("workspaces", nargs="*", help="Workspaces to summarize, all by default")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Conversations summarized at once")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="Checkpoint file used to resume interrupted runs")
+    parser.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args()
+    summarize_sessions(args.workspaces or None, workers=args.workers, checkpoint_path=args.checkpoint, fresh=args.fresh)
@@ -0,0 +1,52 @@
+import logging
+import tempfile
+from near_duplicates import MinHashLSH
+from flat_memory_manager import FlatMemoryManager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_near_duplicates():
+    """Test that facts about different people, IDs or numbers are never treated as near-duplicates"""
+    print("Testing near-duplicate detection...")
+
+    detector = MinHashLSH()
+    detector.add(0, "Bob works at Samsung in Seoul")
+    detector.add(1, "User U123ABC: Their name is Bob")
+    detector.add(2, "The team standup is at 10am")
+
+    assert detector.find("Alice works at Samsung in Seoul") is None
+    assert detector.find("User U456DEF: Their name is Bob") is None
+    assert detector.find("The team standup is at 11am") is None
+    assert detector.find("Bob works at Samsung in Seoul now")[0] == 0
+    assert detector.find("User U123ABC: Their name is Bob Kim")[0] == 1
+    print("Detector keeps different people, IDs and numbers apart")
+
+def test_memory_merge():
+    """Test how the memory manager stores rewordings of stored facts"""
+    print("Testing memory item merging...")
+
+    with tempfile.TemporaryDirectory() as memory_dir:
+        memory_manager = FlatMemoryManager(memory_dir, "workspace1")
+        memory_manager.add_memories([
+            "Bob works at Samsung in Seoul",
+            "Alice works at Samsung in Seoul",
+            "User U1: Their name is Bob",
+            "User U2: Their name is Bob",
+        ])
+        assert len(memory_manager.get_memory()) == 4
+
+        # A rewording that adds detail replaces the stored item, one that adds nothing is dropped
+        memory_manager.add_memories(["Bob works at Samsung in Seoul now", "Bob works at Samsung"])
+        assert memory_manager.get_memory()[0] == "Bob works at Samsung in Seoul now"
+        assert len(memory_manager.get_memory()) == 4
+
+        # A conflicting value is stored next to the old one
+        memory_manager.add_memories(["Bob works at Samsung in Busan"])
+        assert "Bob works at Samsung in Busan" in memory_manager.get_memory()
+        print(f"Memory items: {memory_manager.get_memory()}")
+
+if __name__ == "__main__":
+    test_near_duplicates()
+    test_memory_merge()
@@ -0,0 +1,24 @@
+import re
+import math
+
+# Hangul and other non-ASCII scripts take more tokens per character than English
+_NON_ASCII_PATTERN = re.compile(r"[^\x00-\x7f]")
+
+# Rough average characters per token of the Gemini tokenizer for English and Korean text
+ASCII_CHARS_PER_TOKEN = 4.0
+NON_ASCII_CHARS_PER_TOKEN = 1.5
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text without calling the API
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Estimated token count, rounded up
+    """
+    if not text:
+        return 0
+    non_ascii = len(_NON_ASCII_PATTERN.findall(text))
+    ascii_chars = len(text) - non_ascii
+    return math.ceil(ascii_chars / ASCII_CHARS_PER_TOKEN + non_ascii / NON_ASCII_CHARS_PER_TOKEN)
@@ -0,0 +1,220 @@
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+import google.generativeai as genai
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Reply used when the model still asks for tools after the iteration cap
+TOOL_LIMIT_MESSAGE = "I couldn't finish looking that up. Please try again."
+
+def response_text(response) -> str:
+    """Get the text of a response, joining its text parts when it also holds function calls"""
+    try:
+        return response.text
+    except (AttributeError, TypeError, ValueError):
+        pass
+    text = ""
+    for candidate in getattr(response, "candidates", None) or []:
+        content = getattr(candidate, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            if getattr(part, "text", None):
+                text += part.text
+        break
+    return text
+
+def function_calls(response) -> List[Any]:
+    """Get the function calls requested by the first candidate of a response"""
+    calls = []
+    for candidate in getattr(response, "candidates", None) or []:
+        content = getattr(candidate, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            function_call = getattr(part, "function_call", None)
+            if function_call and getattr(function_call, "name", ""):
+                calls.append(function_call)
+        break
+    return calls
+
+def call_args(function_call) -> Dict[str, Any]:
+    """Get the arguments of a function call as a plain dictionary"""
+    args = function_call.args
+    if not args:
+        return {}
+    if isinstance(args, str):
+        return json.loads(args)
+    return {key: args[key] for key in args}
+
+def function_response_part(name: str, result: Dict[str, Any]):
+    """Build the function_response part that returns a tool result to the model"""
+    return genai.protos.Part(function_response=genai.protos.FunctionResponse(name=name, response=result))
+
+class ToolRunner:
+    """Runs the function calls of a chat locally and returns their results to the model
+
+    Each round executes all calls of the latest response concurrently and sends their
+    results back as function_response parts in one message, until the model answers
+    with text or max_iterations rounds have run. Calls still running when the round
+    deadline passes are answered with a timeout error, so a round takes as long as its
+    slowest call, capped by the deadline.
+    """
+
+    def __init__(self, handlers: Optional[Dict[str, Callable[..., Dict[str, Any]]]] = None, max_iterations: int = 3,
+                 max_workers: int = 8, deadline: float = 10.0):
+        """Initialize the runner
+
+        Args:
+            handlers: Tool name to a callable taking the call arguments as keywords and returning a result dictionary
+            max_iterations: Maximum number of tool rounds per reply
+            max_workers: Number of threads running tool calls, shared by all replies
+            deadline: Seconds a round waits for its calls
+        """
+        self.handlers = dict(handlers or {})
+        self.max_iterations = max(1, max_iterations)
+        self.deadline = deadline
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="tool")
+        self._lock = threading.Lock()
+        self._counters = {
+            "replies": 0, "tool_replies": 0, "rounds": 0, "calls": 0, "errors": 0, "timeouts": 0, "limit_reached": 0,
+            "round_wall_s": 0.0, "round_serial_s": 0.0
+        }
+        self._calls_by_tool = {}
+
+    def register(self, name: str, handler: Callable[..., Dict[str, Any]]):
+        """Add or replace the handler of a tool"""
+        self.handlers[name] = handler
+
+    def _timed_execute(self, function_call, defaults: Optional[Dict[str, Any]] = None):
+        """Execute one function call on a pool thread, returning its result and duration"""
+        started_at = time.monotonic()
+        result = self.execute(function_call, defaults)
+        return result, time.monotonic() - started_at
+
+    def execute_all(self, calls: List[Any], defaults: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Execute the function calls of one model turn concurrently within the round deadline
+
+        Args:
+            calls: Function calls of the turn
+            defaults: Optional tool name to default arguments, used where the model gave none
+
+        Returns:
+            Results in the order of the calls
+        """
+        started_at = time.monotonic()
+        defaults = defaults or {}
+        futures = [self._pool.submit(self._timed_execute, call, defaults.get(call.name)) for call in calls]
+        wait(futures, timeout=self.deadline)
+        results = []
+        serial = 0.0
+        timeouts = 0
+        for call, future in zip(calls, futures):
+            if future.done():
+                result, duration = future.result()
+                serial += duration
+            else:
+                # The call keeps its pool thread until it returns, but the reply no longer waits for it
+                future.cancel()
+                timeouts += 1
+                serial += self.deadline
+                logger.warning(f"Tool {call.name} did not finish within {self.deadline}s")
+                result = {"error": f"Tool {call.name} timed out"}
+            results.append(result)
+        with self._lock:
+            self._counters["timeouts"] += timeouts
+            self._counters["round_wall_s"] += time.monotonic() - started_at
+            self._counters["round_serial_s"] += serial
+        return results
+
+    def execute(self, function_call, defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Execute one function call, errors are returned to the model as an "error" result
+
+        Args:
+            function_call: Function call of the model
+            defaults: Optional default arguments, overridden by those the model gave
+        """
+        name = function_call.name
+        with self._lock:
+            self._counters["calls"] += 1
+            self._calls_by_tool[name] = self._calls_by_tool.get(name, 0) + 1
+        handler = self.handlers.get(name)
+        if handler is None:
+            return {"error": f"Unknown tool: {name}"}
+        try:
+            args = dict(defaults or {})
+            args.update({key: value for key, value in call_args(function_call).items() if value not in (None, "")})
+            logger.info(f"Running tool {name} with {args}")
+            result = handler(**args)
+            return result if isinstance(result, dict) else {"result": result}
+        except Exception as e:
+            logger.error(f"Error running tool {name}: {str(e)}")
+            with self._lock:
+                self._counters["errors"] += 1
+            return {"error": str(e)}
+
+    def _response_part(self, name: str, result: Dict[str, Any]):
+        """Build the function_response part of a result, replacing a result that cannot be converted with an error"""
+        try:
+            return function_response_part(name, result)
+        except Exception as e:
+            logger.error(f"Error converting the result of tool {name}: {str(e)}")
+            with self._lock:
+                self._counters["errors"] += 1
+            return function_response_part(name, {"error": f"Tool {name} returned a result that could not be sent"})
+
+    def run(self, response, chat, defaults: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """Resolve the function calls of a response and get the final reply text
+
+        Args:
+            response: Response of the chat's latest send_message
+            chat: Chat session the response belongs to
+            defaults: Optional tool name to default arguments of this reply, such as the workspace timezone
+
+        Returns:
+            Reply text
+        """
+        with self._lock:
+            self._counters["replies"] += 1
+        calls = function_calls(response)
+        if calls:
+            with self._lock:
+                self._counters["tool_replies"] += 1
+
+        rounds = 0
+        while calls:
+            if rounds >= self.max_iterations:
+                with self._lock:
+                    self._counters["limit_reached"] += 1
+                logger.warning(f"Stopped after {rounds} tool rounds")
+                return response_text(response) or TOOL_LIMIT_MESSAGE
+            rounds += 1
+            with self._lock:
+                self._counters["rounds"] += 1
+            results = self.execute_all(calls, defaults)
+            parts = [self._response_part(call.name, result) for call, result in zip(calls, results)]
+            response = chat.send_message(parts, stream=False)
+            calls = function_calls(response)
+
+        return response_text(response) or "I couldn't generate a response. Please try again."
+
+    def stats(self) -> Dict[str, Any]:
+        """Get tool loop counters
+
+        Returns:
+            Dictionary of tool metrics
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["calls_by_tool"] = dict(self._calls_by_tool)
+            stats["round_wall_s"] = round(stats["round_wall_s"], 3)
+            stats["round_serial_s"] = round(stats["round_serial_s"], 3)
+            stats["model_calls_per_tool_reply"] = (
+                round(1 + stats["rounds"] / stats["tool_replies"], 2) if stats["tool_replies"] else 0.0
+            )
+            return stats
+
+    def shutdown(self):
+        """Stop the tool threads without waiting for running calls"""
+        self._pool.shutdown(wait=False)
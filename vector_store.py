@@ -0,0 +1,205 @@
+import os
+import json
+import zlib
+import logging
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+from memory_index import tokenize
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class HashingEmbedder:
+    """Local embedder that hashes words and character trigrams into a fixed-size vector"""
+
+    def __init__(self, dim: int = 256):
+        """Initialize the embedder
+
+        Args:
+            dim: Number of vector dimensions
+        """
+        self.dim = dim
+
+    @property
+    def name(self) -> str:
+        return f"local-hashing-{self.dim}"
+
+    def _features(self, text: str) -> List[str]:
+        """Get the hashed features of a text: its terms and the character trigrams of each term"""
+        features = []
+        for token in tokenize(text):
+            features.append(token)
+            padded = f"#{token}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into L2-normalized vectors
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Float32 matrix with one row per text
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                # crc32 is stable across processes, unlike hash()
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dim] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed one query text"""
+        return self.embed([text])[0]
+
+class VectorStore:
+    """Contiguous float32 vector matrix persisted as memory-mapped .npy segments
+
+    Rows are written in place into preallocated segment files, so appends never
+    rewrite existing data, and opening the store maps the files without reading them.
+    """
+
+    def __init__(self, directory: str, name: str, dim: int, segment_size: int = 8192,
+                 model: Optional[str] = None):
+        """Open or create a vector store
+
+        Args:
+            directory: Directory holding the segment files
+            name: Prefix of the segment and metadata files
+            dim: Number of vector dimensions
+            segment_size: Number of rows per segment file
+            model: Optional name of the embedder, stored vectors from another embedder are discarded
+        """
+        self.directory = directory
+        self.name = name
+        os.makedirs(directory, exist_ok=True)
+        self.meta_file = os.path.join(directory, f"{name}.meta.json")
+        self._lock = threading.Lock()
+        self._segments = []
+
+        self.model = model
+        meta = self._read_meta()
+        if meta and meta.get("dim") == dim and meta.get("model") == model:
+            self.dim = meta["dim"]
+            self.segment_size = meta["segment_size"]
+            self.count = meta["count"]
+        else:
+            if meta:
+                logger.warning(f"Vector store {name} was built with {meta.get('model')} ({meta.get('dim')} dimensions), "
+                               f"expected {model} ({dim} dimensions), starting over")
+            self.dim = dim
+            self.segment_size = segment_size
+            self.count = 0
+            self._write_meta()
+
+    def _read_meta(self):
+        """Read the metadata file, returning None if it does not exist"""
+        if not os.path.exists(self.meta_file):
+            return None
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading vector store metadata {self.meta_file}: {str(e)}")
+            return None
+
+    def _write_meta(self):
+        """Atomically write the metadata file"""
+        temp_file = f"{self.meta_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({"dim": self.dim, "model": self.model, "segment_size": self.segment_size, "count": self.count}, f)
+        os.replace(temp_file, self.meta_file)
+
+    def _segment_file(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{self.name}.{segment:04d}.npy")
+
+    def _segment(self, segment: int) -> np.ndarray:
+        """Map a segment file, creating it if needed, the caller holds the lock"""
+        while len(self._segments) <= segment:
+            path = self._segment_file(len(self._segments))
+            if os.path.exists(path):
+                matrix = np.lib.format.open_memmap(path, mode='r+')
+            else:
+                matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(self.segment_size, self.dim))
+            self._segments.append(matrix)
+        return self._segments[segment]
+
+    def add(self, vectors: np.ndarray) -> int:
+        """Append vectors
+
+        Args:
+            vectors: Float32 matrix with one row per vector
+
+        Returns:
+            Row index of the first appended vector
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            first_row = self.count
+            for offset, vector in enumerate(vectors):
+                row = first_row + offset
+                self._segment(row // self.segment_size)[row % self.segment_size] = vector
+            self.count += len(vectors)
+            self._write_meta()
+            return first_row
+
+    def update(self, row: int, vector: np.ndarray):
+        """Overwrite the vector of an existing row in place
+
+        Args:
+            row: Row index
+            vector: New vector
+        """
+        with self._lock:
+            if not 0 <= row < self.count:
+                raise IndexError(f"Row {row} is out of range")
+            self._segment(row // self.segment_size)[row % self.segment_size] = np.asarray(vector, dtype=np.float32)
+
+    def truncate(self, count: int):
+        """Forget rows at and after the given index, they are overwritten by later appends
+
+        Args:
+            count: Number of rows to keep
+        """
+        with self._lock:
+            self.count = min(self.count, max(0, count))
+            self._write_meta()
+
+    def search(self, query: np.ndarray, k: int = 10) -> List[Tuple[int, float]]:
+        """Find the rows with the highest cosine similarity to a normalized query vector
+
+        Args:
+            query: Query vector
+            k: Maximum number of results
+
+        Returns:
+            List of (row, score) pairs, best first
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            count = self.count
+            segments = [self._segment(i) for i in range((count + self.segment_size - 1) // self.segment_size)]
+        if not count or k <= 0:
+            return []
+
+        # Score every segment with one matrix-vector product, vectors are stored normalized
+        scores = np.concatenate([
+            segment[:min(self.segment_size, count - i * self.segment_size)] @ query
+            for i, segment in enumerate(segments)
+        ])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def flush(self):
+        """Flush mapped segments to disk"""
+        with self._lock:
+            for segment in self._segments:
+                segment.flush()